@@ -55,7 +55,7 @@
 # Thank you for testing BART!
 # ******************************* END LICENSE *******************************
 
-import sys, os, re, shutil, time, subprocess
+import sys, os, re, shutil, time, subprocess, multiprocessing
 import argparse, ConfigParser
 import numpy as np
 
@@ -72,6 +72,18 @@ import InitialPT as ipt
 import makeatm   as mat
 import makecfg   as mc
 import bestFit   as bf
+import posterior as pp
+import pipeline  as pl
+import opstore   as ops
+import opacity   as op
+import checkpoint as chk
+import estimate  as es
+import preflight as pf
+import plots
+import system    as sy
+import wine      as w
+import atmbin    as ab
+import teachunks as tc
 
 sys.path.append(MC3dir)
 import mcutils   as mu
@@ -112,7 +124,55 @@ def main():
      "\n======================================================================")
 
   mu.msg(1, "\nInitialization:")
+  args, cfile = parse()
+
+  # Make output directory and copy the input files:
+  date_dir = setup(args, cfile)
+
+  # Build the pipeline and run the requested stages:
+  resources = None
+  if args.resources is not None:
+    resources = pl.FileResources(args.resources)
+  pipe = makePipeline(args, cfile, date_dir, resources)
+  targets = None
+  if args.justTEA:
+    targets = ["atmosphere"]
+  elif args.justOpacity:
+    targets = ["opacity"]
+  elif args.estimate:
+    targets = ["estimate"]
+  try:
+    pipe.run(targets)
+  finally:
+    # Record the stages' telemetry:
+    pipe.manifest(date_dir + "run_manifest.json")
 
+  if args.justTEA:
+    mu.msg(1, "~~ BART End (after TEA) ~~")
+  elif args.justOpacity:
+    mu.msg(1, "~~ BART End (after Transit opacity calculation) ~~")
+  elif args.estimate:
+    mu.msg(1, "~~ BART End (after cost estimate) ~~")
+  else:
+    mu.msg(1, "~~ BART End ~~")
+
+
+def parse(argv=None):
+  """
+  Parse the command-line and configuration-file arguments.
+
+  Parameters:
+  -----------
+  argv: List of strings
+     Command-line arguments (default: sys.argv[1:]).
+
+  Returns:
+  --------
+  args: Namespace
+     The BART arguments.
+  cfile: String
+     The BART configuration file.
+  """
   # Parse the config file from the command line:
   cparser = argparse.ArgumentParser(description=__doc__, add_help=False,
                          formatter_class=argparse.RawDescriptionHelpFormatter)
@@ -127,7 +187,16 @@ def main():
   parser.add_argument("--justOpacity",           action='store_true',
                        help="Run only Transit to generate the Opacity table.")
   parser.add_argument("--resume",                action='store_true',
-                       help="Resume a previous run.")
+                       help="Resume a previous run from its last MCMC "
+                            "checkpoint.")
+  parser.add_argument("--estimate",              action='store_true',
+                       help="Estimate the cost of the MCMC (and stop).")
+  parser.add_argument("--batch",                 action='store_true',
+                       help="Run without prompting for confirmation.")
+  parser.add_argument("--resources",             action="store",
+                       help="CPU-budget file shared with other runs (see "
+                            "pipeline.FileResources).",
+                       dest="resources", type=str, default=None)
   # Directories and files options:
   group = parser.add_argument_group("Directories and files")
   group.add_argument("--loc_dir", dest="loc_dir",
@@ -210,6 +279,18 @@ def main():
            help="Reference pressure level (bar) corresponding to the pressure"
                 "at the planet radius [default: %(default)s]",
            type=float, action="store", default=0.1)
+  group.add_argument("--teachunks", dest="teachunks",
+           help="Number of layer chunks to run TEA in parallel "
+                "[default: %(default)s]",
+           type=int, action="store", default=1)
+  group.add_argument("--teaverify", dest="teaverify",
+           help="Check the chunked TEA output against a serial "
+                "calculation [default: %(default)s]",
+           type=eval, action="store", default=False)
+  group.add_argument("--teacache", dest="teacache",
+           help="Directory of the TEA layer cache (TEA runs only over "
+                "the layers not in the cache) [default: %(default)s]",
+           type=str, action="store", default=None)
 
   # MCMC options:
   group = parser.add_argument_group("MCMC")
@@ -237,6 +318,18 @@ def main():
   group.add_argument("--burnin", dest="burnin",
            help="Number of burn-in iterations per chain",
            type=mu.parray, action="store", default=None)
+  group.add_argument("--checkpoint_iter", dest="checkpoint_iter",
+           help="Number of MCMC iterations (all chains) between "
+                "checkpoints [default: %(default)s]",
+           type=eval, action="store", default=None)
+  group.add_argument("--checkpoint_time", dest="checkpoint_time",
+           help="Wall-clock time (minutes) between MCMC checkpoints "
+                "[default: %(default)s]",
+           type=eval, action="store", default=None)
+  group.add_argument("--checkpoint_burnin", dest="checkpoint_burnin",
+           help="Burn-in iterations per chain discarded after each "
+                "checkpoint restart [default: burnin]",
+           type=eval, action="store", default=None)
   group.add_argument("--data", dest="data",
            help="Transit or eclipse depths",
            type=mu.parray, action="store", default=None)
@@ -258,6 +351,32 @@ def main():
   group.add_argument("--kurucz_file",           action="store",
            help="Stellar Kurucz file [default: %(default)s]",
            dest="kurucz",   type=str,       default=None)
+  group.add_argument("--kurucz_interp",         action="store",
+           help="Interpolate the Kurucz models to the stellar temperature "
+                "and log(g), instead of taking the nearest model "
+                "[default: %(default)s]",
+           dest="kurucz_interp", type=eval, default=False)
+  group.add_argument("--kurucz_cache",          action="store",
+           help="Directory where to keep a binary version of the Kurucz "
+                "file (shared across runs) [default: %(default)s]",
+           dest="kurucz_cache", type=str, default=None)
+  group.add_argument("--filter_cache",          action="store",
+           help="Directory where to cache the filters resampled to the "
+                "spectrum (shared across runs) [default: the output "
+                "directory]",
+           dest="filter_cache", type=str, default=None)
+  group.add_argument("--bins",                  action="store",
+           help="Wavelength edges (microns) of top-hat bins, fit after the "
+                "filters [default: %(default)s]",
+           dest="bins",     type=mu.parray, default=None)
+  group.add_argument("--binres",                action="store",
+           help="Resolving power of top-hat bins over binrange (if bins "
+                "is not set) [default: %(default)s]",
+           dest="binres",   type=float,     default=None)
+  group.add_argument("--binrange",              action="store",
+           help="Wavelength range (microns) of the binres bins "
+                "[default: %(default)s]",
+           dest="binrange", type=mu.parray, default=None)
   group.add_argument("--solution",                    action="store",
            help="Solution geometry [default: %(default)s]",
            dest="solution", type=str,       default="None",
@@ -271,19 +390,47 @@ def main():
   group.add_argument("--opacityfile", dest="opacityfile",
            help="Opacity table file [default: %(default)s]",
            type=str, action="store", default=None)
+  group.add_argument("--opchunks", dest="opchunks",
+           help="Number of temperature chunks to generate the opacity "
+                "table in parallel [default: %(default)s]",
+           type=int, action="store", default=1)
+  group.add_argument("--opverify", dest="opverify",
+           help="Check the chunked opacity table against a serial "
+                "calculation [default: %(default)s]",
+           type=eval, action="store", default=False)
+  group.add_argument("--opstore", dest="opstore",
+           help="Directory of the shared opacity-table store "
+                "[default: %(default)s]",
+           type=str, action="store", default=None)
+  group.add_argument("--opstore_size", dest="opstore_size",
+           help="Maximum size of the opacity-table store in GB "
+                "[default: unlimited]",
+           type=float, action="store", default=None)
   group.add_argument("--outflux", dest="outflux",
            help="Output with flux values [default: %(default)s]",
            type=str, action="store", default=None)
   group.add_argument("--outmod", dest="outmod",
            help="Output with modulation values [default: %(default)s]",
            type=str, action="store", default=None)
+  group.add_argument("--binspec", dest="binspec",
+           help="Also write the output spectrum in binary (npz) format "
+                "[default: %(default)s]",
+           type=eval, action="store", default=False)
 
+  # Posterior-predictive options:
+  group = parser.add_argument_group("Posterior predictive")
+  group.add_argument("--npredict", dest="npredict",
+           help="Number of thinned posterior samples to evaluate full "
+                "spectra [default: %(default)s]",
+           type=int, action="store", default=0)
+  group.add_argument("--nproc", dest="nproc",
+           help="Number of worker processes for the posterior-predictive "
+                "spectra [default: number of CPUs]",
+           type=int, action="store", default=None)
 
-  # Remaining_argv contains all other command-line-arguments:
-  cargs, remaining_argv = cparser.parse_known_args()
-  # Get only the arguments defined above:
-  known, unknown = parser.parse_known_args(remaining_argv)
 
+  # Remaining_argv contains all other command-line-arguments:
+  cargs, remaining_argv = cparser.parse_known_args(argv)
 
   # Get configuration file from command-line:
   cfile = cargs.config_file
@@ -295,31 +442,41 @@ def main():
     mu.error("Configuration file: '{:s}' not found.".format(cfile))
 
   # Read values from configuration file:
-  config = ConfigParser.SafeConfigParser()
-  config.optionxform = str  # This one enable Uppercase in arguments
-  config.read([cfile])
-  defaults = dict(config.items("MCMC"))
+  defaults = mc.read(cfile)
   mu.msg(1, "The configuration file is: '{:s}'.".format(cfile), indent=2)
 
   # Set the defaults from the configuration file:
   parser.set_defaults(**defaults)
   # Set values from command line:
   args, unknown = parser.parse_known_args(remaining_argv)
+  return args, cfile
 
-  # Unpack the variables from args:
-  variables = dir(args)
-  for var in dir(known):
-    if not var.startswith("_"):
-      exec("{:s} = args.{:s}".format(var, var))
+
+def setup(args, cfile):
+  """
+  Validate the arguments (preflight check), make the output directory,
+  and copy the configuration and TEP files into it.
+
+  Parameters:
+  -----------
+  args: Namespace
+     The BART arguments.
+  cfile: String
+     The BART configuration file.
+
+  Returns:
+  --------
+  date_dir: String
+     Output directory (absolute path, with a trailing slash).
+  """
+  # Fail fast on invalid inputs, before any stage runs:
+  errors = pf.check(args, cfile)
+  if len(errors) > 0:
+    mu.error("Preflight check failed:\n  " + "\n  ".join(errors))
+  mu.msg(1, "Preflight check passed.", indent=2)
 
   # Make output directory:
-  # Make a subdirectory with the date and time
-  dirfmt = loc_dir + "%4d-%02d-%02d_%02d:%02d:%02d"
-  date_dir = dirfmt % time.localtime()[0:6]
-  # FINDME: Temporary hack (temporary?):
-  date_dir = os.path.normpath(loc_dir) + "/"
-  if not os.path.isabs(date_dir):
-    date_dir = os.getcwd() + "/" + date_dir
+  date_dir = outdir(args)
   mu.msg(1, "Output folder: '{:s}'".format(date_dir), indent=2)
   try:
     os.mkdir(date_dir)
@@ -331,153 +488,381 @@ def main():
                                                      os.strerror(e.errno)))
   # Copy files to date dir:
   # BART configuration file:
-  shutil.copy2(cfile, date_dir)
+  copy(cfile, date_dir + os.path.basename(cfile))
   # TEP file:
-  if not os.path.isfile(tep_name):
-    mu.error("Tepfile ('{:s}') Not found.".format(tep_name))
+  if not os.path.isfile(args.tep_name):
+    mu.error("Tepfile ('{:s}') Not found.".format(args.tep_name))
   else:
-    shutil.copy2(tep_name, date_dir + os.path.basename(tep_name))
+    copy(args.tep_name, date_dir + os.path.basename(args.tep_name))
+  return date_dir
 
-  # Check if files already exist:
-  runMCMC = 0  # Flag that indicate which steps to run
-  # Atmospheric file:
-  if os.path.isfile(atmfile):
-    atmfile = os.path.realpath(atmfile)
-    shutil.copy2(atmfile, date_dir + os.path.basename(atmfile))
-    mu.msg(1, "Atmospheric file copied from: '{:s}'.".format(atmfile),indent=2)
-    runMCMC |= 8
-  # Pre-atmospheric file:
-  if os.path.isfile(preatm_file):
-    preatm_file = os.path.realpath(preatm_file)
-    shutil.copy2(preatm_file, date_dir + os.path.basename(preatm_file))
-    mu.msg(1, "Pre-atmospheric file copied from: '{:s}'.".format(preatm_file),
-           indent=2)
-    runMCMC |= 4
-  # Elemental-abundances file:
-  if abun_file is not None and os.path.isfile(abun_file):
-    shutil.copy2(abun_file, date_dir + os.path.basename(abun_file))
-    mu.msg(1, "Elemental abundances file copied from: '{:s}'.".
-              format(abun_file), indent=2)
-    runMCMC |= 2
-  # Pressure file:
-  if press_file is not None and os.path.isfile(press_file):
-    shutil.copy2(press_file, date_dir + os.path.basename(press_file))
-    mu.msg(1, "Pressure file copied from: '{:s}'.".format(press_file), indent=2)
-    runMCMC |= 1
-
-
-  # Generate files as needed:
-  if runMCMC < 1:  # Pressure file
-    press_file = date_dir + press_file
-    mp.makeP(n_layers, p_top, p_bottom, press_file, log)
-    mu.msg(1, "Created new pressure file.", indent=2)
-
-  # Make uniform-abundance profiles if requested:
-  if uniform is not None and runMCMC < 8:
-    # Calculate the temperature profile:
-    temp = ipt.initialPT2(PTinit, press_file, PTtype, tep_name)
-    # Generate the uniform-abundance profiles file:
-    mat.uniform(date_dir + atmfile, press_file, abun_basic, tep_name,
-               out_spec, uniform, temp, refpress)
-    # Update the runMCMC flag to skip upcoming steps:
-    runMCMC |= 8
-
-  if runMCMC < 2:  # Elemental-abundances file
-    abun_file = date_dir + abun_file
-    mu.msg(1, "CO swap: {}".format(COswap), indent=2)
-    mat.makeAbun(abun_basic, abun_file, solar_times, COswap)
-    mu.msg(1, "Created new elemental abundances file.", indent=2)
-
-  if runMCMC < 4:  # Pre-atmospheric file
-    # Calculate the temperature profile:
-    temp = ipt.initialPT2(PTinit, press_file, PTtype, tep_name)
-    # Choose a pressure-temperature profile
-    mu.msg(1, "\nChoose temperature and pressure profile:", indent=2)
-    raw_input("  Press enter to continue, or quit and choose other initial "
-              "PT parameters.")
-    preatm_file = date_dir + preatm_file
-    mat.make_preatm(tep_name, press_file, abun_file, in_elem, out_spec,
-                  preatm_file, temp)
-    mu.msg(1, "Created new pre-atmospheric file.", indent=2)
-
-  if runMCMC < 8:  # Atmospheric file
-    # Generate the TEA configuration file:
-    mc.makeTEA(cfile, TEAdir)
-    # Call TEA to calculate the atmospheric file:
-    TEAcall = TEAdir + "tea/runatm.py"
-    TEAout  = os.path.splitext(atmfile)[0]  # Remove extension
-    # Execute TEA:
-    mu.msg(1, "\nExecute TEA:")
-    proc = subprocess.Popen([TEAcall, preatm_file, 'TEA'])
-    proc.communicate()
-
-    shutil.copy2(date_dir+"TEA/results/TEA.tea", date_dir+atmfile) 
-    atmfile = date_dir + atmfile
-    # Add radius array:
-    mat.makeRadius(out_spec, atmfile, abun_file, tep_name, refpress)
-    mu.msg(1, "Added radius column to TEA atmospheric file.", indent=2)
-    # Re-format file for use with transit:
-    mat.reformat(atmfile)
-    mu.msg(1, "Atmospheric file reformatted for Transit.", indent=2)
-
-  if justTEA:
-    mu.msg(1, "~~ BART End (after TEA) ~~")
-    return
 
-  # Make the MC3 configuration file:
-  MCMC_cfile = os.path.realpath(loc_dir) + "/MCMC_" + os.path.basename(cfile)
-  mc.makeMCMC(cfile, MCMC_cfile)
-  # Make transit configuration file:
-  mc.makeTransit(MCMC_cfile, tep_name)
+def outdir(args):
+  """
+  Output directory of a run (absolute path, with a trailing slash).
+  """
+  # Make a subdirectory with the date and time
+  dirfmt = args.loc_dir + "%4d-%02d-%02d_%02d:%02d:%02d"
+  date_dir = dirfmt % time.localtime()[0:6]
+  # FINDME: Temporary hack (temporary?):
+  date_dir = os.path.normpath(args.loc_dir) + "/"
+  if not os.path.isabs(date_dir):
+    date_dir = os.getcwd() + "/" + date_dir
+  return date_dir
+
+
+def copy(src, dst):
+  """
+  Copy a file, unless source and destination are the same file.
+  """
+  if os.path.realpath(src) != os.path.realpath(dst):
+    shutil.copy2(src, dst)
 
-  # Generate the opacity file if it doesn't exist:
-  if not os.path.isfile(opacityfile):
-    mu.msg(1, "Transit call to generate the Opacity grid table.")
+
+def makePipeline(args, cfile, date_dir, resources=None):
+  """
+  Build the pipeline of a BART run.  Each stage declares the files it
+  reads and writes, so that it runs only when these (or its arguments)
+  change since the previous run in date_dir.
+
+  Parameters:
+  -----------
+  args: Namespace
+     The BART arguments.
+  cfile: String
+     The BART configuration file.
+  date_dir: String
+     Output directory.
+  resources: pipeline.Resources instance
+     CPU budget to run the stages (default: all CPUs of this machine).
+
+  Returns:
+  --------
+  pipe: pipeline.Pipeline instance
+     The pipeline with stages: pressure, abundances, preatm, tea,
+     atmosphere, config, opacity, stellar, mcmc, bestfit, predictive,
+     and estimate.
+  """
+  pipe = pl.Pipeline(date_dir + "pipeline.json", resources)
+  config = mc.read(cfile)
+
+  def rundir(filename):
+    """Location of a file inside the output directory."""
+    if filename is None:
+      return None
+    return date_dir + os.path.basename(filename)
+
+  def given(filename):
+    """Check whether the user provided an existing file."""
+    return filename is not None and os.path.isfile(filename)
+
+  # Files of the run:
+  press_file   = rundir(args.press_file)
+  abun_file    = rundir(args.abun_file)
+  preatm_file  = rundir(args.preatm_file)
+  atmfile      = rundir(args.atmfile)
+  tea_file     = date_dir + "TEA/results/TEA.tea"
+  MCMC_cfile   = date_dir + "MCMC_" + os.path.basename(cfile)
+  tconfig      = rundir(args.tconfig)
+  opacityfile  = rundir(args.opacityfile)
+  stellar_file = None
+  if args.kurucz is not None:
+    stellar_file = date_dir + "stellar.npz"
+  MCfile       = rundir(args.logfile)
+  output       = date_dir + "output.npy"
+  filters      = []
+  if args.filter is not None:
+    filters = list(args.filter)
+  # Top-hat bin edges (None if there are no bins):
+  bins = w.readbins(args.bins, args.binres, args.binrange)
+  binkey = None if bins is None else bins.tolist()
+  # Planetary-system parameters, shared by all stages:
+  system = sy.load(args.tep_name)
+
+  # Stages that generate the atmospheric file:
+  runTEA = not given(args.atmfile) and args.uniform is None
+  makepress = not given(args.atmfile)
+
+  if makepress:
+    if given(args.press_file):
+      def pressure():
+        copy(args.press_file, press_file)
+        mu.msg(1, "Pressure file copied from: '{:s}'.".format(args.press_file),
+               indent=2)
+      pipe.add("pressure", pressure, inputs=[args.press_file],
+               outputs=[press_file])
+    else:
+      def pressure():
+        mp.makeP(args.n_layers, args.p_top, args.p_bottom, press_file,
+                 args.log)
+        mu.msg(1, "Created new pressure file.", indent=2)
+      pipe.add("pressure", pressure, outputs=[press_file],
+               params=[args.n_layers, args.p_top, args.p_bottom, args.log])
+
+  # Elemental abundances, pre-atmospheric file, and TEA:
+  if runTEA:
+    # Elemental-abundances file:
+    if given(args.abun_file):
+      def abundances():
+        copy(args.abun_file, abun_file)
+        mu.msg(1, "Elemental abundances file copied from: '{:s}'.".
+                  format(args.abun_file), indent=2)
+      pipe.add("abundances", abundances, inputs=[args.abun_file],
+               outputs=[abun_file])
+    else:
+      def abundances():
+        mu.msg(1, "CO swap: {}".format(args.COswap), indent=2)
+        mat.makeAbun(args.abun_basic, abun_file, args.solar_times, args.COswap)
+        mu.msg(1, "Created new elemental abundances file.", indent=2)
+      pipe.add("abundances", abundances, inputs=[args.abun_basic],
+               outputs=[abun_file], params=[args.solar_times, args.COswap])
+
+    # Pre-atmospheric file:
+    if given(args.preatm_file):
+      def preatm():
+        copy(args.preatm_file, preatm_file)
+        mu.msg(1, "Pre-atmospheric file copied from: '{:s}'.".
+                  format(args.preatm_file), indent=2)
+      pipe.add("preatm", preatm, inputs=[args.preatm_file],
+               outputs=[preatm_file])
+    else:
+      def preatm():
+        # Calculate the temperature profile:
+        with plots.lock:
+          temp = ipt.initialPT2(args.PTinit, press_file, args.PTtype,
+                                system, plotdir=date_dir)
+        # Choose a pressure-temperature profile
+        if not args.batch:
+          mu.msg(1, "\nChoose temperature and pressure profile:", indent=2)
+          raw_input("  Press enter to continue, or quit and choose other "
+                    "initial PT parameters.")
+        mat.make_preatm(system, press_file, abun_file, args.in_elem,
+                        args.out_spec, preatm_file, temp)
+        mu.msg(1, "Created new pre-atmospheric file.", indent=2)
+      pipe.add("preatm", preatm,
+               inputs=[press_file, abun_file, args.tep_name],
+               outputs=[preatm_file], depends=["pressure", "abundances"],
+               params=[list(args.PTinit), args.PTtype, args.in_elem,
+                       args.out_spec])
+
+    # TEA:
+    def tea():
+      # Run TEA (from date_dir), in layer chunks if requested, and only
+      # over the layers not in the cache:
+      return tc.run(preatm_file, cfile, TEAdir, date_dir, args.teachunks,
+                    args.teaverify, args.teacache)
+    pipe.add("tea", tea, inputs=[preatm_file, args.abun_basic],
+             outputs=[tea_file],
+             depends=["preatm"],
+             params=sorted(mc.TEAconfig(cfile, TEAdir).items("TEA")),
+             ncpu=args.teachunks)
+
+  # Atmospheric file:
+  if given(args.atmfile):
+    def atmosphere():
+      # transit reads text files, convert a binary atmospheric file:
+      if ab.isbinary(args.atmfile):
+        ab.totext(args.atmfile, atmfile)
+      else:
+        copy(args.atmfile, atmfile)
+      mu.msg(1, "Atmospheric file copied from: '{:s}'.".
+                format(os.path.realpath(args.atmfile)), indent=2)
+    pipe.add("atmosphere", atmosphere, inputs=[args.atmfile],
+             outputs=[atmfile])
+  elif args.uniform is not None:
+    def atmosphere():
+      # Calculate the temperature profile:
+      with plots.lock:
+        temp = ipt.initialPT2(args.PTinit, press_file, args.PTtype,
+                              system, plotdir=date_dir)
+      # Generate the uniform-abundance profiles file:
+      mat.uniform(atmfile, press_file, args.abun_basic, system,
+                  args.out_spec, args.uniform, temp, args.refpress)
+    pipe.add("atmosphere", atmosphere,
+             inputs=[press_file, args.abun_basic, args.tep_name],
+             outputs=[atmfile], depends=["pressure"],
+             params=[list(args.PTinit), args.PTtype, args.out_spec,
+                     list(args.uniform), args.refpress])
+  else:
+    def atmosphere():
+      # Add radius array and re-format for use with transit (in memory):
+      atm = mat.Atmosphere.read(tea_file)
+      mat.finalize(atm, abun_file, system, args.refpress)
+      atm.write(atmfile)
+      mu.msg(1, "Added radius column to TEA atmospheric file.", indent=2)
+      mu.msg(1, "Atmospheric file reformatted for Transit.", indent=2)
+    pipe.add("atmosphere", atmosphere,
+             inputs=[tea_file, abun_file, args.tep_name],
+             outputs=[atmfile], depends=["tea", "abundances"],
+             params=[args.out_spec, args.refpress])
+
+  # MC3 and transit configuration files:
+  updates = {"loc_dir":date_dir}
+  if stellar_file is not None:
+    updates["kurucz"] = stellar_file
+  def configuration():
+    mc.makeMCMC(cfile, MCMC_cfile, updates)
+    mc.makeTransit(MCMC_cfile, system)
+  pipe.add("config", configuration, inputs=[cfile, args.tep_name],
+           outputs=[MCMC_cfile, tconfig], params=updates)
+
+  # Opacity file:
+  if given(args.opacityfile):
+    def opacity():
+      mu.msg(1, "\nTransit uses the existing opacity file from:\n '{:s}'.".
+                 format(args.opacityfile), indent=2)
+      ops.link(args.opacityfile, opacityfile)
+    pipe.add("opacity", opacity, inputs=[args.opacityfile],
+             outputs=[opacityfile])
+  else:
     Tcall = Transitdir + "/transit/transit"
-    subprocess.call(["{:s} -c {:s} --justOpacity".format(Tcall, tconfig)],
-                    shell=True, cwd=date_dir)
+    chunked = (args.opchunks > 1 and
+               np.all([key in config for key in ["tlow","thigh","tempdelt"]]))
+    def transit():
+      if chunked:
+        return op.generate(MCMC_cfile, system, opacityfile,
+                           args.opchunks, Tcall, date_dir, args.opverify)
+      mu.msg(1, "Transit call to generate the Opacity grid table.")
+      return pl.call(["{:s} -c {:s} --justOpacity".format(Tcall, tconfig)],
+                     shell=True, cwd=date_dir)
+    if args.opstore is None:
+      opacity = transit
+    else:
+      # Take the table from the shared store, or generate and store it:
+      maxsize = None
+      if args.opstore_size is not None:
+        maxsize = args.opstore_size * 1e9
+      store = ops.Store(args.opstore, maxsize, pipe.hash)
+      def opacity():
+        return store.fetch(store.key(tconfig, atmfile), opacityfile, transit)
+    pipe.add("opacity", opacity,
+             inputs=[tconfig, atmfile] + config.get("linedb", "").split() +
+                    config.get("cia", "").split(),
+             outputs=[opacityfile], depends=["config", "atmosphere"],
+             ncpu=args.opchunks)
+
+  # Stellar model (runs concurrently with the opacity calculation):
+  if stellar_file is not None:
+    def stellar():
+      w.savestellar(stellar_file, args.kurucz, system.tstar, system.gstar,
+                    args.kurucz_interp, args.kurucz_cache)
+      mu.msg(1, "Stellar model extracted from: '{:s}'.".format(args.kurucz),
+             indent=2)
+    pipe.add("stellar", stellar, inputs=[args.kurucz, args.tep_name],
+             outputs=[stellar_file], params=[args.kurucz_interp])
   else:
-    mu.msg(1, "\nTransit copies the existing opacity file from:\n '{:s}'.".
-                 format(opacityfile), indent=2)
-    shutil.copy2(opacityfile, date_dir + os.path.basename(opacityfile))
-
-  if justOpacity:
-    mu.msg(1, "~~ BART End (after Transit opacity calculation) ~~")
-    return
+    pipe.add("stellar", lambda: None)
 
   # Run the MCMC:
-  mu.msg(1, "\nStart MCMC:")
-  MC3call = MC3dir + "/mccubed.py"
-  subprocess.call(["mpiexec {:s} -c {:s}".format(MC3call, MCMC_cfile)],
-                  shell=True, cwd=date_dir)
-
-  # Run best-fit Transit call
-  mu.msg(1, "\nTransit call with the best-fitting values.")
- 
-  # MCcubed output file
-  MCfile = date_dir + logfile
-
-  # Call bestFit submodule and make new bestFit_tconfig.cfg
-  bf.callTransit(atmfile, tep_name, MCfile, stepsize, molfit, tconfig, date_dir, params, burnin)
-
-  # Best-fit tconfig
-  bestFit_tconfig = date_dir + 'bestFit_tconfig.cfg'
-
-  # Call Transit with the best-fit tconfig
-  Tcall = Transitdir + "/transit/transit"
-  subprocess.call(["{:s} -c {:s}".format(Tcall, bestFit_tconfig)],
-                    shell=True, cwd=date_dir)
-
-  # Plot best-fit eclipse or modulation spectrum, depending on solution 
-  if solution == 'eclipse':
-    # Plot best-fit eclipse spectrum
-    bf.plot_bestFit_Spectrum(filter, kurucz, tep_name, solution, outflux, data, uncert, date_dir)
-  elif solution == 'transit':
-    # Plot best-fit transit spectrum
-    bf.plot_bestFit_Spectrum(filter, kurucz, tep_name, solution, outmod, data, uncert, date_dir)
-
-
-  mu.msg(1, "~~ BART End ~~")
+  mcmcrun = {"numit":int(float(config["numit"]))}
+  def mcmcrate(telemetry):
+    """Number and rate of model evaluations of this MCMC run."""
+    numit = mcmcrun["numit"]
+    return {"evaluations":numit, "rate":numit / telemetry["wall"]}
+  def mcmc():
+    mu.msg(1, "\nStart MCMC:")
+    MC3call = MC3dir + "/mccubed.py"
+    if args.checkpoint_iter is None and args.checkpoint_time is None:
+      return pl.call(["mpiexec {:s} -c {:s}".format(MC3call, MCMC_cfile)],
+                     shell=True, cwd=date_dir)
+    # Run in checkpointed segments (count only the iterations after
+    # the resumed checkpoint):
+    if args.resume:
+      mcmcrun["numit"] -= chk.done(date_dir)
+    chkburnin = args.checkpoint_burnin
+    if chkburnin is None:
+      chkburnin = int(float(config["burnin"]))
+    return chk.run(MCMC_cfile, MC3call, date_dir, output, MCfile,
+                   args.params, args.stepsize, args.checkpoint_iter,
+                   args.checkpoint_time, chkburnin, args.resume)
+  pipe.add("mcmc", mcmc,
+           inputs=[MCMC_cfile, tconfig, atmfile, opacityfile, stellar_file]
+                  + filters,
+           outputs=[output, MCfile],
+           depends=["config", "atmosphere", "opacity", "stellar"],
+           ncpu=int(config.get("nchains", 1)), metrics=mcmcrate)
+
+  # Cost estimate (only with --estimate):
+  if args.estimate:
+    # Unless the opacity table is given, time a reduced (two-temperature)
+    # table instead of generating the full table whose cost is estimated:
+    reduced = (not given(args.opacityfile) and
+               np.all([key in config for key in ["tlow","thigh","tempdelt"]]))
+    def estimate():
+      etconfig, opcost = tconfig, None
+      if reduced:
+        etconfig, opcost = es.opacity(MCMC_cfile, system,
+                                      Transitdir + "/transit/transit",
+                                      date_dir, date_dir + "estimate/")
+      est = es.estimate(etconfig, atmfile, system, args.PTtype,
+                        args.molfit, args.filter, stellar_file,
+                        args.solution, args.tint, args.params, args.stepsize,
+                        int(float(config["numit"])), int(config["nchains"]),
+                        kfile=args.kurucz, bins=bins, opcost=opcost)
+      es.report(est, date_dir + "estimate.json")
+    depends = ["config", "atmosphere", "stellar"]
+    if not reduced:
+      depends.append("opacity")
+    pipe.add("estimate", estimate, depends=depends)
+
+  # Evaluate the best-fit model in-process with the transit module:
+  # Best-fit spectrum output file, depending on solution:
+  outspec = None
+  if args.solution == 'eclipse':
+    outspec = rundir(args.outflux)
+  elif args.solution == 'transit':
+    outspec = rundir(args.outmod)
+  def bestfit():
+    mu.msg(1, "\nTransit call with the best-fitting values.")
+    with plots.lock:
+      # Call bestFit submodule (writes bestFit.atm and bestFit_tconfig.cfg)
+      specwn, bestspectrum, bestband = bf.callTransit(atmfile, system,
+                       MCfile, args.stepsize, args.molfit, args.tconfig,
+                       date_dir, args.params, args.burnin, args.PTtype,
+                       args.filter, stellar_file, args.solution, args.tint,
+                       outspec, binary=args.binspec,
+                       filter_cache=args.filter_cache, bins=bins)
+      # Plot best-fit eclipse or modulation spectrum, depending on solution
+      bf.plot_bestFit_Spectrum(args.filter, stellar_file, system,
+                               args.solution, specwn, bestspectrum,
+                               args.data, args.uncert, date_dir, bins,
+                               args.filter_cache)
+  pipe.add("bestfit", bestfit,
+           inputs=[output, MCfile, atmfile, tconfig, opacityfile,
+                   stellar_file] + filters,
+           outputs=[outspec, date_dir + "bestFit.atm",
+                    date_dir + "BART-bestFit-Spectrum.png"],
+           depends=["mcmc"],
+           params=[args.molfit, args.PTtype, args.solution, args.tint,
+                   args.data, args.uncert, args.binspec, binkey])
+
+  # Posterior-predictive spectra from thinned posterior samples:
+  if args.npredict > 0:
+    def predictive():
+      mu.msg(1, "\nPosterior-predictive spectra.")
+      pp.predictive(output, args.burnin, args.npredict, args.stepsize,
+                    args.params, date_dir, args.nproc, tconfig=tconfig,
+                    atmfile=atmfile, tepfile=system,
+                    PTtype=args.PTtype, molfit=args.molfit,
+                    filters=args.filter, kurucz=stellar_file,
+                    filter_cache=args.filter_cache, bins=bins,
+                    solution=args.solution, tint=args.tint)
+    ncpu = args.nproc
+    if ncpu is None:
+      ncpu = multiprocessing.cpu_count()
+    # Run after bestfit, the pool must not fork during another
+    # in-process transit evaluation:
+    pipe.add("predictive", predictive,
+             inputs=[output, atmfile, tconfig, opacityfile, stellar_file]
+                    + filters,
+             outputs=[date_dir + "posterior_spectra.npy",
+                      date_dir + "posterior_bands.npz"],
+             depends=["bestfit"],
+             params=[args.npredict, args.molfit, args.PTtype, args.solution,
+                     args.tint, binkey],
+             ncpu=ncpu)
+
+  return pipe
 
 
 if __name__ == "__main__":
@@ -64,7 +64,7 @@ from mpi4py import MPI
 import makeatm   as mat
 import PT        as pt
 import wine      as w
-import reader    as rd
+import system    as sy
 import constants as c
 
 BARTdir = os.path.dirname(os.path.realpath(__file__))
@@ -156,6 +156,22 @@ def main(comm):
                      help="Solution geometry [default: %(default)s]",
                      dest="solution", type=str,       default="None",
                      choices=('transit', 'eclipse'))
+  group.add_argument("--filter_cache",          action="store",
+                     help="Filter-bank cache directory [default: the "
+                     "transit configuration file directory]",
+                     dest="filter_cache", type=str, default=None)
+  group.add_argument("--bins",                  action="store",
+                     help="Wavelength edges (microns) of top-hat bins "
+                     "[default: %(default)s]",
+                     dest="bins",     type=mu.parray, default=None)
+  group.add_argument("--binres",                action="store",
+                     help="Resolving power of top-hat bins "
+                     "[default: %(default)s]",
+                     dest="binres",   type=float,     default=None)
+  group.add_argument("--binrange",              action="store",
+                     help="Wavelength range (microns) of the binres bins "
+                     "[default: %(default)s]",
+                     dest="binrange", type=mu.parray, default=None)
 
   parser.set_defaults(**defaults)
   args2, unknown = parser.parse_known_args(remaining_argv)
@@ -180,17 +196,17 @@ def main(comm):
   Tmax    = args2.Tmax
 
   # Extract necessary values from the TEP file:
-  tep = rd.File(tepfile)
+  system = sy.load(tepfile)
   # Stellar temperature in K:
-  tstar = float(tep.getvalue('Ts')[0])
+  tstar = system.tstar
   # Stellar radius (in meters):
-  rstar = float(tep.getvalue('Rs')[0]) * c.Rsun
+  rstar = system.rstar
   # Semi-major axis (in meters):
-  sma   = float(tep.getvalue( 'a')[0]) * sc.au
+  sma   = system.sma
   # Planetary radius (in meters):
-  rplanet = float(tep.getvalue('Rp')[0]) * c.Rjup
+  rplanet = system.rplanet
   # Planetary mass (in kg):
-  mplanet = float(tep.getvalue('Mp')[0]) * c.Mjup
+  mplanet = system.mplanet
 
   # Number of parameters:
   nfree   = len(params)                # Total number of free parameters
@@ -225,7 +241,7 @@ def main(comm):
   PTargs = [PTtype]
   if PTtype == "line":
     # Planetary surface gravity (in cm s-2):
-    gplanet = 100.0 * sc.G * mplanet / rplanet**2
+    gplanet = 100.0 * system.gplanet
     # Additional PT arguments:
     PTargs += [rstar, tstar, tint, sma, gplanet]
 
@@ -262,41 +278,45 @@ def main(comm):
   solution = args2.solution  # Solution type
 
   # Log10(stellar gravity)
-  gstar = float(tep.getvalue('loggstar')[0])
+  gstar = system.gstar
   # Planet-to-star radius ratio:
-  rprs  = rplanet / rstar
+  rprs  = system.rprs
   mu.msg(verb, "OCON FLAG 10: {}, {}, {}".format(tstar, gstar, rprs))
 
+  if ffile is None:
+    ffile = []
   nfilters = len(ffile)  # Number of filters:
 
-  # FINDME: Separate filter/stellar interpolation?
-  # Get stellar model:
-  starfl, starwn, tmodel, gmodel = w.readkurucz(kurucz, tstar, gstar)
-  # Read and resample the filters:
-  nifilter  = [] # Normalized interpolated filter
-  istarfl   = [] # interpolated stellar flux
-  wnindices = [] # wavenumber indices used in interpolation
+  # Filters and stellar flux resampled to the transit wavenumber
+  # sampling (cached for the other ranks, MCMC segments, and runs):
+  cachedir = args2.filter_cache
+  if cachedir is None:
+    cachedir = os.path.dirname(os.path.realpath(transitcfile))
+  bank = w.FilterBank(specwn, ffile, kurucz, tstar, gstar, cachedir)
   for i in np.arange(nfilters):
-    # Read filter:
-    filtwaven, filttransm = w.readfilter(ffile[i])
     # Check that filter boundaries lie within the spectrum wn range:
-    if filtwaven[0] < specwn[0] or filtwaven[-1] > specwn[-1]:
+    if bank.bounds[i,0] < specwn[0] or bank.bounds[i,1] > specwn[-1]:
       mu.exit(message="Wavenumber array ({:.2f} - {:.2f} cm-1) does not "
               "cover the filter[{:d}] wavenumber range ({:.2f} - {:.2f} "
-              "cm-1).".format(specwn[0], specwn[-1], i, filtwaven[0],
-                                                        filtwaven[-1]))
-
-    # Resample filter and stellar spectrum:
-    nifilt, strfl, wnind = w.resample(specwn, filtwaven, filttransm,
-                                              starwn,    starfl)
-    mu.msg(verb, "OCON FLAG 67: mean star flux: %.3e"%np.mean(strfl))
-    nifilter.append(nifilt)
-    istarfl.append(strfl)
-    wnindices.append(wnind)
+              "cm-1).".format(specwn[0], specwn[-1], i, bank.bounds[i,0],
+                                                        bank.bounds[i,1]))
+  nifilter  = bank.nifilter   # Normalized interpolated filter
+  istarfl   = bank.istarfl    # interpolated stellar flux
+  wnindices = bank.wnindices  # wavenumber indices used in interpolation
+
+  # Top-hat bins (after the filters in the band-flux array):
+  edges = w.readbins(args2.bins, args2.binres, args2.binrange)
+  nbins = 0
+  if edges is not None:
+    try:
+      bins = w.Bins(specwn, edges, kurucz, tstar, gstar)
+    except ValueError as error:
+      mu.exit(message=str(error))
+    nbins = len(bins.meanwn)
 
   # Allocate arrays for receiving and sending data to master:
-  spectrum = np.zeros(nwave,    dtype='d')
-  bandflux = np.zeros(nfilters, dtype='d')
+  spectrum = np.zeros(nwave,          dtype='d')
+  bandflux = np.zeros(nfilters+nbins, dtype='d')
 
   # Allocate array to receive parameters from MPI:
   params = np.zeros(npars, np.double)
@@ -321,7 +341,7 @@ def main(comm):
     # If the temperature goes out of bounds:
     if np.any(profiles[0] < Tmin) or np.any(profiles[0] > Tmax):
       print("Out of bounds")
-      mu.comm_gather(comm, -np.ones(nfilters), MPI.DOUBLE)
+      mu.comm_gather(comm, -np.ones(nfilters+nbins), MPI.DOUBLE)
       continue
 
     #mu.msg(verb, "T pars: \n{}\n".format(PTargs))
@@ -353,6 +373,12 @@ def main(comm):
       elif solution == "transit":
         bandflux[i] = w.bandintegrate(spectrum[wnindices[i]], specwn,
                                       nifilter[i], wnindices[i])
+    # And per bin:
+    if nbins > 0:
+      if   solution == "eclipse":
+        bandflux[nfilters:] = bins.fluxratio(spectrum, rprs)
+      elif solution == "transit":
+        bandflux[nfilters:] = bins.integrate(spectrum)
 
     # Send resutls back to MCMC:
     #mu.msg(verb, "OCON FLAG 95: Flux band integrated ({})".format(bandflux))
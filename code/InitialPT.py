@@ -53,13 +53,14 @@
 # Thank you for testing BART!
 # ******************************* END LICENSE *******************************
 
+import os
 import numpy as np
-import matplotlib.pyplot as plt
 import scipy.constants   as sc
 
 import PT        as pt
-import reader    as rd
+import system    as sy
 import constants as c
+import plots
 
 def initialPT(date_dir, tepfile, press_file, a1, a2, p1, p3, T3_fac):
   """
@@ -74,7 +75,7 @@ def initialPT(date_dir, tepfile, press_file, a1, a2, p1, p3, T3_fac):
   ----------
   date_dir: String
      Directory where to save the output plots.
-  tepfile: String
+  tepfile: String or system.System
      Name of ASCII tep file with planetary system data.
   press_file: String
      Name of ASCII file with pressure array data.
@@ -130,6 +131,7 @@ def initialPT(date_dir, tepfile, press_file, a1, a2, p1, p3, T3_fac):
   T, T0, T1, T3 = PT[5], PT[7], PT[8], PT[9]
 
   # Plot raw PT profile
+  plt = plots.pyplot()
   plt.figure(1)
   plt.clf()
   plt.semilogy(PT[0], PT[1], '.', color = 'r'     )
@@ -159,7 +161,7 @@ def initialPT(date_dir, tepfile, press_file, a1, a2, p1, p3, T3_fac):
 
   return T_smooth
 
-def initialPT2(params, pressfile, mode, tepfile, tint=100.0):
+def initialPT2(params, pressfile, mode, tepfile, tint=100.0, plotdir="./"):
   """
   Compute a Temperature profile.
 
@@ -171,10 +173,12 @@ def initialPT2(params, pressfile, mode, tepfile, tint=100.0):
     File name of the pressure array.
   mode: String
     Chose the PT model: 'madhu' or 'line'.
-  tepfile: String
+  tepfile: String or system.System
     Filename of the planet's TEP file.
   tint: Float
     Internal planetary temperature.
+  plotdir: String
+    Directory where to save the plot of the profile.
   """
   # Read pressures from file:
   pressure = pt.read_press_file(pressfile)
@@ -183,21 +187,17 @@ def initialPT2(params, pressfile, mode, tepfile, tint=100.0):
   PTargs = [mode]
 
   # Read the TEP file:
-  tep = rd.File(tepfile)
+  system = sy.load(tepfile)
   # Stellar radius (in meters):
-  rstar = float(tep.getvalue('Rs')[0]) * c.Rsun
+  rstar = system.rstar
   # Stellar temperature in K:
-  tstar = float(tep.getvalue('Ts')[0])
+  tstar = system.tstar
   # Semi-major axis (in meters):
-  sma   = float(tep.getvalue( 'a')[0]) * sc.au
-  # Planetary radius (in meters):
-  rplanet = float(tep.getvalue('Rp')[0]) * c.Rjup
-  # Planetary mass (in kg):
-  mplanet = float(tep.getvalue('Mp')[0]) * c.Mjup
+  sma   = system.sma
 
   if mode == "line":
     # Planetary surface gravity (in cm s-2):
-    gplanet = 100.0 * sc.G * mplanet / rplanet**2
+    gplanet = 100.0 * system.gplanet
     # Additional PT arguments:
     PTargs += [rstar, tstar, tint, sma, gplanet]
 
@@ -205,6 +205,7 @@ def initialPT2(params, pressfile, mode, tepfile, tint=100.0):
   Temp =  pt.PT_generator(pressure, params, PTargs)
 
   # Plot PT profile
+  plt = plots.pyplot()
   plt.figure(1)
   plt.semilogy(Temp, pressure, '-', color = 'r')
   plt.xlim(0.9*min(Temp), 1.1*max(Temp))
@@ -213,7 +214,7 @@ def initialPT2(params, pressfile, mode, tepfile, tint=100.0):
   plt.xlabel('T [K]'     , fontsize=14)
   plt.ylabel('logP [bar]', fontsize=14)
 
-  # Save plot to current directory
-  plt.savefig('InitialPT.png') 
+  # Save plot:
+  plt.savefig(os.path.join(plotdir, 'InitialPT.png'))
 
   return Temp
@@ -54,13 +54,12 @@
 # ******************************* END LICENSE *******************************
 
 import numpy as np
-import matplotlib.pyplot as plt
 import scipy.constants as sc
 import scipy.special   as sp
 from scipy.ndimage import gaussian_filter1d
-import reader as rd
-
-plt.ion()
+import system as sy
+import table  as tb
+import plots
 
 """
   This code serves as an input generator for BART. It generates
@@ -126,18 +125,10 @@ def read_press_file(press_file):
      2014-06-19  Jasmina   Written by.
      2014-08-15  Patricio  Cleaned up.
      '''
-  
-     # Open and read the pressure array file
-     f = open(press_file, 'r')
-     lines = f.readlines()
-     f.close()
-
-     # Store the values in pressure array
-     pressure = np.zeros(len(lines)-1, np.double)
-     for i in np.arange(1, len(lines)):
-          pressure[i-1] = lines[i].split()[1]
-
-     return pressure
+     # Read the pressure column (skip the header line):
+     data = tb.read(press_file, ["pressure"], [np.double], usecols=[1],
+                    skiprows=1)
+     return data["pressure"]
 
 
 # reads the tep file and calculates planet's effective temperature
@@ -151,7 +142,7 @@ def planet_Teff(tepfile):
 
      Parameters
      ----------
-     tepfile: string
+     tepfile: string or system.System
            Name of the tep ASCII file.
  
      Returns
@@ -165,28 +156,16 @@ def planet_Teff(tepfile):
      2014-08-15   Patricio   Added source for the radius of the sun.
      '''
 
-     # Opens tepfile to read and get data
-     tep = rd.File(tepfile)
-
-     # Get stellar temperature in K
-     stellarT = tep.getvalue('Ts')
-     Tstar    = np.float(stellarT[0])
-
-     # Get stellar radius in units of Rsun
-     stellarR = tep.getvalue('Rs')
-     Rstar    = np.float(stellarR[0])
-
-     # Get semimajor axis in AU
-     semimajor = tep.getvalue('a')
-     a         = np.float(semimajor[0])
+     # Get the system parameters (Rsun from constants.py, source:
+     # http://nssdc.gsfc.nasa.gov/planetary/factsheet/sunfact.html)
+     system = sy.load(tepfile)
 
-     # Sun radius in meters:
-     # Source: http://nssdc.gsfc.nasa.gov/planetary/factsheet/sunfact.html
-     Rsun = 696000000.0   # m
+     # Stellar temperature in K
+     Tstar = system.tstar
 
      # Radius fo the star and semimajor axis in m
-     Rstar = Rstar * Rsun # m
-     a     = a * sc.au    # m
+     Rstar = system.rstar # m
+     a     = system.sma   # m
 
      # Effective temperature of the planet 
      # Teff^4 = Teff*^4 * f * (Rstar/a)^2 * (1-A)
@@ -818,6 +797,7 @@ def plot_PT(p, PT, T_smooth, MadhuPT):
      2014-07-24 Jasmina   Integrated general plotting function.
      2014-09-24 Jasmina   Updated documentation.
      ''' 
+     plt = plots.pyplot()
     
      if MadhuPT == 'MadhuPT_Inv':
           # Takes temperatures from PT generator
@@ -0,0 +1,391 @@
+# ****************************** START LICENSE *******************************
+# Bayesian Atmospheric Radiative Transfer (BART), a code to infer
+# properties of planetary atmospheres based on observed spectroscopic
+# information.
+# 
+# This project was completed with the support of the NASA Planetary
+# Atmospheres Program, grant NNX12AI69G, held by Principal Investigator
+# Joseph Harrington. Principal developers included graduate students
+# Patricio E. Cubillos and Jasmina Blecic, programmer Madison Stemm, and
+# undergraduates M. Oliver Bowman and Andrew S. D. Foster.  The included
+# 'transit' radiative transfer code is based on an earlier program of
+# the same name written by Patricio Rojo (Univ. de Chile, Santiago) when
+# he was a graduate student at Cornell University under Joseph
+# Harrington.  Statistical advice came from Thomas J. Loredo and Nate
+# B. Lust.
+# 
+# Copyright (C) 2015 University of Central Florida.  All rights reserved.
+# 
+# This is a test version only, and may not be redistributed to any third
+# party.  Please refer such requests to us.  This program is distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+# 
+# Our intent is to release this software under an open-source,
+# reproducible-research license, once the code is mature and the first
+# research paper describing the code has been accepted for publication
+# in a peer-reviewed journal.  We are committed to development in the
+# open, and have posted this code on github.com so that others can test
+# it and give us feedback.  However, until its first publication and
+# first stable release, we do not permit others to redistribute the code
+# in either original or modified form, nor to publish work based in
+# whole or in part on the output of this code.  By downloading, running,
+# or modifying this code, you agree to these conditions.  We do
+# encourage sharing any modifications with us and discussing them
+# openly.
+# 
+# We welcome your feedback, but do not guarantee support.  Please send
+# feedback or inquiries to:
+# 
+# Joseph Harrington <jh@physics.ucf.edu>
+# Patricio Cubillos <pcubillos@fulbrightmail.org>
+# Jasmina Blecic <jasmina@physics.ucf.edu>
+# 
+# or alternatively,
+# 
+# Joseph Harrington, Patricio Cubillos, and Jasmina Blecic
+# UCF PSB 441
+# 4111 Libra Drive
+# Orlando, FL 32816-2385
+# USA
+# 
+# Thank you for testing BART!
+# ******************************* END LICENSE *******************************
+
+"""
+Binary atmospheric-model format.
+
+An atmospheric binary file holds the species, pressure, temperature,
+(optionally) radius, and abundance profiles of an atmospheric model,
+with the values' units.  The file contains an 8-byte magic string, the
+length of a JSON header (8-byte unsigned integer), the JSON header, and
+the [nlayers, ncolumns] double-precision data table (radius, pressure,
+temperature, and one column per species), aligned to 64 bytes so that
+it can be memory-mapped.  The layers keep the order of the text file
+they came from.
+
+The text files are those written by TEA ('tea' layout: layers from
+the top of the atmosphere) and by makeatm.reformat() for transit
+('transit' layout: units block, species without the JANAF suffix, and
+layers from the bottom).  The conversions keep every value: the text
+writer prints each column with the fewest digits that reproduce its
+values exactly.
+
+Functions:
+----------
+isbinary:
+   Check whether a file is an atmospheric binary file.
+load:
+   Read an atmospheric file, either binary or text.
+read:
+   Read (memory-map) an atmospheric binary file.
+readtext:
+   Read an atmospheric text file.
+write:
+   Write an atmospheric binary file.
+writetext:
+   Write an atmospheric text file.
+tobinary:
+   Convert an atmospheric text file into binary.
+totext:
+   Convert an atmospheric binary file into text.
+"""
+
+import os
+import struct
+import json
+import numpy as np
+
+import table as tb
+
+# File signature and data alignment (bytes):
+MAGIC = b"BARTATM1"
+ALIGN = 64
+# Default values' units of transit (radius in km, pressure in bar,
+# abundances by number):
+UNITS = [["ur", "1e5"], ["up", "1e6"], ["q", "number"]]
+
+
+def isbinary(atmfile):
+  """
+  Check whether atmfile is an atmospheric binary file.
+  """
+  f = open(atmfile, "rb")
+  magic = f.read(len(MAGIC))
+  f.close()
+  return magic == MAGIC
+
+
+def load(atmfile, mmap=True):
+  """
+  Read an atmospheric file, binary (see read()) or text (see
+  readtext()).
+
+  Returns:
+  --------
+  species: List of strings
+     Species names.
+  pressure: 1D float ndarray
+     Pressure of each layer (bar).
+  temp: 1D float ndarray
+     Temperature of each layer (K).
+  abundances: 2D float ndarray
+     Abundances (mixing fractions) of shape [nlayers, nspecies].
+  radius: 1D float ndarray
+     Radius of each layer (km), None if the file has no radius.
+  info: Dictionary
+     The values' units (list of [key, value] pairs), header text (lines
+     before #SPECIES), and layout ('tea' or 'transit') of the file.
+  """
+  if isbinary(atmfile):
+    return read(atmfile, mmap)
+  return readtext(atmfile)
+
+
+def read(atmfile, mmap=True):
+  """
+  Read an atmospheric binary file.
+
+  Parameters:
+  -----------
+  atmfile: String
+     Atmospheric binary file.
+  mmap: Boolean
+     If True, memory-map the data table (copy-on-write, the file is
+     never modified), else read it into memory.
+
+  Returns:
+  --------
+  (See load())
+  """
+  f = open(atmfile, "rb")
+  if f.read(len(MAGIC)) != MAGIC:
+    f.close()
+    raise ValueError("'{:s}' is not an atmospheric binary file.".
+                     format(atmfile))
+  hlen, = struct.unpack("<Q", f.read(8))
+  header = json.loads(f.read(hlen).decode("utf-8"))
+  offset = _offset(hlen)
+  shape = header["nlayers"], len(header["columns"])
+  if mmap:
+    f.close()
+    data = np.memmap(atmfile, np.dtype(str(header["dtype"])), "c", offset,
+                     shape)
+  else:
+    f.seek(offset)
+    data = np.fromfile(f, np.dtype(str(header["dtype"])),
+                       shape[0]*shape[1]).reshape(shape)
+    f.close()
+
+  species = [str(spec) for spec in header["species"]]
+  radius = None
+  if header["columns"][0] == "radius":
+    radius = data[:,0]
+  nspec = len(species)
+  info = {"units":  [[str(u) for u in unit] for unit in header["units"]],
+          "header": str(header["header"]),
+          "layout": str(header["layout"])}
+  return (species, data[:,-nspec-2], data[:,-nspec-1], data[:,-nspec:],
+          radius, info)
+
+
+def readtext(atmfile):
+  """
+  Read an atmospheric text file (TEA or transit layout).
+
+  Parameters:
+  -----------
+  atmfile: String
+     Atmospheric text file.
+
+  Returns:
+  --------
+  (See load())
+  """
+  f = open(atmfile, "r")
+  lines = f.read().splitlines()
+  f.close()
+  marks = [line.strip() for line in lines]
+  imol  = marks.index("#SPECIES") + 1
+  start = marks.index("#TEADATA") + 2
+  species = lines[imol].split()
+
+  # Header and values' units:
+  units  = []
+  header = []
+  layout = "tea"
+  inunits = False
+  for line in lines[:imol-1]:
+    if line.strip() == "#Values units:":
+      inunits = True
+      layout  = "transit"
+    elif inunits and len(line.split()) == 2 and not line.startswith("#"):
+      units.append(line.split())
+    else:
+      inunits = False
+      header.append(line)
+  while len(header) > 0 and header[-1].strip() == "":
+    header.pop()
+  if len(units) == 0:
+    units = [list(unit) for unit in UNITS]
+
+  # Data table (split all the rows at once):
+  datalines = [line for line in lines[start:] if line.strip()]
+  ncol = len(datalines[0].split())
+  data = np.array(" ".join(datalines).split()).astype(np.double)
+  data = np.reshape(data, (len(datalines), ncol))
+  nspec = len(species)
+  radius = None
+  if ncol == nspec + 3:
+    radius = data[:,0]
+  info = {"units":units, "header":"\n".join(header), "layout":layout}
+  return (species, data[:,-nspec-2], data[:,-nspec-1], data[:,-nspec:],
+          radius, info)
+
+
+def write(atmfile, species, pressure, temp, abundances, radius=None,
+          units=None, header="", layout="tea"):
+  """
+  Write an atmospheric binary file.
+
+  Parameters:
+  -----------
+  atmfile: String
+     Output atmospheric binary file.
+  species: List of strings
+     Species names.
+  pressure: 1D float ndarray
+     Pressure of each layer (bar).
+  temp: 1D float ndarray
+     Temperature of each layer (K).
+  abundances: 2D float ndarray
+     Abundances (mixing fractions) of shape [nlayers, nspecies].
+  radius: 1D float ndarray
+     Radius of each layer (km), if any.
+  units: List of [key, value] pairs
+     Values' units (default: UNITS).
+  header: String
+     Header text (comments) of the model.
+  layout: String
+     Layout of the text file the model came from ('tea' or 'transit').
+  """
+  if units is None:
+    units = UNITS
+  columns = ["pressure", "temp"] + list(species)
+  data = [pressure, temp]
+  if radius is not None:
+    columns = ["radius"] + columns
+    data = [radius] + data
+  data = np.column_stack(data + [abundances]).astype("<f8")
+
+  head = json.dumps({"species":list(species), "nlayers":len(data),
+                     "columns":columns, "dtype":"<f8", "units":units,
+                     "header":header, "layout":layout}).encode("utf-8")
+  # Pad the header to align the data:
+  head += b" " * (_offset(len(head)) - len(MAGIC) - 8 - len(head))
+
+  # Write and rename, so readers never see a partial file:
+  tmpfile = atmfile + ".{:d}.tmp".format(os.getpid())
+  f = open(tmpfile, "wb")
+  f.write(MAGIC)
+  f.write(struct.pack("<Q", len(head)))
+  f.write(head)
+  data.tofile(f)
+  f.close()
+  os.rename(tmpfile, atmfile)
+
+
+def writetext(atmfile, species, pressure, temp, abundances, radius=None,
+              units=None, header="", layout="tea", fmt=None):
+  """
+  Write an atmospheric text file (TEA or transit layout, see the module
+  docstring).  The input layers are written in the given order.
+
+  Parameters:
+  -----------
+  (See write())
+  fmt: List of strings
+     Format of each column (radius, if any, pressure, temperature, and
+     abundances).  If None, use the shortest formats that reproduce the
+     values exactly.
+  """
+  if units is None:
+    units = UNITS
+  labels = ["Pressure", "Temp"]
+  data = [pressure, temp]
+  if radius is not None:
+    labels = ["Radius"] + labels
+    data = [radius] + data
+  data = np.column_stack(data + [abundances])
+  if layout == "transit":
+    species = [spec.partition("_")[0] for spec in species]
+
+  f = open(atmfile, "w")
+  if header != "":
+    f.write(header + "\n")
+  if layout == "transit":
+    f.write("\n#Values units:\n")
+    f.write("".join(["{:s} {:s}\n".format(key, val) for key, val in units]))
+  f.write("\n#SPECIES\n{:s}\n\n#TEADATA\n".format(" ".join(species)))
+  f.write("#" + " ".join(["{:10s}".format(label)
+                          for label in labels + list(species)]).rstrip()
+          + "\n")
+  if fmt is None:
+    fmt = [_fmt(column) for column in data.T]
+  tb.writerows(f, data, " ".join(fmt) + "\n")
+  f.close()
+
+
+def tobinary(atmfile, binfile):
+  """
+  Convert an atmospheric text file into an atmospheric binary file.
+  """
+  species, pressure, temp, abundances, radius, info = readtext(atmfile)
+  write(binfile, species, pressure, temp, abundances, radius,
+        info["units"], info["header"], info["layout"])
+
+
+def totext(binfile, atmfile, layout=None):
+  """
+  Convert an atmospheric binary file into an atmospheric text file.
+
+  Parameters:
+  -----------
+  binfile: String
+     Input atmospheric binary file.
+  atmfile: String
+     Output atmospheric text file.
+  layout: String
+     Layout of the text file ('tea' or 'transit').  If None, use the
+     layout of the file the binary came from.  Changing the layout
+     reverses the layers' order.
+  """
+  species, pressure, temp, abundances, radius, info = read(binfile)
+  if layout is None:
+    layout = info["layout"]
+  if layout != info["layout"]:
+    pressure, temp, abundances = pressure[::-1], temp[::-1], abundances[::-1]
+    if radius is not None:
+      radius = radius[::-1]
+  writetext(atmfile, species, pressure, temp, abundances, radius,
+            info["units"], info["header"], layout)
+
+
+def _offset(hlen):
+  """
+  Offset (bytes) of the data table for a header of hlen bytes.
+  """
+  size = len(MAGIC) + 8 + hlen
+  return ALIGN * ((size + ALIGN - 1) // ALIGN)
+
+
+def _fmt(values):
+  """
+  Shortest exponential format that reproduces all the values.
+  """
+  for digits in np.arange(1, 17):
+    fmt = "%.{:d}e".format(digits)
+    if np.all(np.char.mod(fmt, values).astype(np.double) == values):
+      return fmt
+  return "%.17e"
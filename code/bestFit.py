@@ -1,17 +1,19 @@
+import os
 import numpy as np
-import reader as rd
+import system as sy
 import scipy.constants as sc
 import scipy.special   as sp
 import scipy.interpolate as si
 from scipy.ndimage.filters import gaussian_filter1d as gaussf
-import matplotlib.pyplot as plt
-import matplotlib
 
 import makeatm as mat
+import atmbin as ab
 import PT as pt
 import wine as w
 import readtransit as rt
 import constants as c
+import posterior as pp
+import plots
 
 def read_MCMC_out(MCfile):
     """
@@ -64,128 +66,33 @@ def get_starData(tepfile):
     """
     Extract the Stellar temperature, radius, and mass from a TEP file.
     """
-    # Open tepfile to read and get data:
-    tep = rd.File(tepfile)
+    system = sy.load(tepfile)
+    return system.rstar, system.tstar, system.sma, system.gstar
 
-    # Get star mass in Mjup:
-    Tstar = np.float(tep.getvalue('Ts')[0])
 
-    # Get star radius in MKS units:
-    Rstar = np.float(tep.getvalue('Rs')[0]) * c.Rsun
-
-    # Get semi major axis in meters:
-    sma = np.float(tep.getvalue('a')[0]) * sc.au
-
-    # Get star loggstar:
-    gstar = np.float(tep.getvalue('loggstar')[0])
-
-    return Rstar, Tstar, sma, gstar
-
-
-def write_atmfile(atmfile, molfit, T_line, allParams, date_dir):
+def write_atmfile(atmfile, profiles, date_dir):
     """
-    Write best-fit atm file with scaled H2 and He to abundances sum of 1.
+    Write the best-fit atm file (bestFit.atm in date_dir) with the
+    temperature and abundance profiles evaluated for the best-fit model.
+
+    Parameters
+    ----------
+    atmfile: String
+       Atmospheric model file (provides the species, pressure, radius,
+       and header of the output).
+    profiles: 2D float ndarray
+       Temperature and abundance profiles of shape [nspecies+1, nlayers],
+       in the layer order of atmfile (see posterior.model).
+    date_dir: String
+       Output directory.
     """
-    # Open atmfile to read
-    f = open(atmfile, 'r')
-    lines = np.asarray(f.readlines())
-    f.close()
+    # Read the (text or binary) atmospheric file:
+    molecules, pressure, temp, abun, rad, info = ab.load(atmfile)
 
-    # Get the molecules
-    imol = np.where(lines == "#SPECIES\n")[0][0] + 1
-    molecules = lines[imol].split()
-
-    # Find the line where the layers info begins
-    start = np.where(lines == "#TEADATA\n")[0][0] + 2 
-    headers = lines[start-1].split()
-    datalines = lines[start:]
-
-    # Number of columns
-    ncol = len(lines[start].split())
-
-    # Number of layers
-    ndata = len(datalines)  
-
-    # Allocate space for rad and pressure
-    rad = np.zeros(ndata, np.double)
-    pressure = np.zeros(ndata, np.double) 
-
-    # Number of abundances (elements per line except Radius, Press and T) 
-    nabun = len(lines[start].split()) - 3  
-    abundances = np.zeros((ndata, nabun), np.double)
-
-    # Extract radius, pressure, and abundance data
-    data = np.zeros((ndata, len(headers)))
-    for i in np.arange(ndata):
-            data[i] = datalines[i].split()
-    rad      = data[:, 0]
-    pressure = data[:, 1] 
-
-    # fill out the abundances array
-    abundances = np.zeros((len(molecules), ndata))
-    for i in np.arange(len(molecules)):
-        for j in np.arange(ndata):
-            abundances[i] = data[:, i+3] 
-
-    # recognize which columns to take from the atmospheric file
-    headers = lines[start-1].split()
-    columns = np.zeros(len(molfit))
-    for i in np.arange(len(molfit)):
-        for j in np.arange(len(headers)):
-            if molfit[i] == headers[j]:
-                columns[i] = j
-
-    # number of molecules to fit
-    nfit = len(molfit)
-    abun_fact = allParams[5:]
-
-    # multiply the abundances of molfit molecules
-    for i in np.arange(len(columns)):
-       abundances[columns[i]-3] = abundances[columns[i]-3] * 10**abun_fact[i]
-
-    # ===== Scale H2 and He if sum abundances > 1 ===== #
-    # Find index for Hydrogen and Helium
-    molecules = np.asarray(molecules)
-    iH2     = np.where(molecules=="H2")[0][0]
-    iHe     = np.where(molecules=="He")[0][0]
-
-    # Get H2/He abundance ratio:
-    ratio = (abundances[iH2,:] / abundances[iHe,:])
-
-    # Find which level has sum(abundances)>1 and get the difference
-    q = np.sum(abundances, axis=0) - 1
-
-    # Correct H2, and He abundances respecting their ration
-    for i in np.arange(ndata):
-        if q[i]>0:
-            abundances[iH2, i] -= ratio[i] * q[i] / (1.0 + ratio[i])
-            abundances[iHe, i] -=            q[i] / (1.0 + ratio[i])
-
-    # open best fit atmospheric file
-    fout = open(date_dir + 'bestFit.atm', 'w')
-    fout.writelines(lines[:start])
-
-    # Write atm file for each run
-    for i in np.arange(ndata): 
-        # Radius, pressure, and temp for the current line
-        radi = str('%10.3f'%rad[i])
-        presi = str('%10.4e'%pressure[i])
-        tempi = str('%7.2f'%T_line[i])
-
-        # Insert radii array
-        fout.write(radi.ljust(10) + ' ')
-
-        # Insert results from the current line (T-P) to atm file
-        fout.write(presi.ljust(10) + ' ')
-        fout.write(tempi.ljust(7) + ' ')
-
-        # Write current abundances
-        for j in np.arange(len(headers) - 3):
-            fout.write('%1.4e'%abundances[j][i] + ' ')
-        fout.write('\n')
-
-    # Close atm file
-    fout.close()
+    # write best fit atmospheric file (as a text file, for transit)
+    atm = mat.Atmosphere(molecules, pressure, profiles[0], profiles[1:].T,
+                         rad, info["header"], info["layout"], info["units"])
+    atm.write(date_dir + 'bestFit.atm')
 
 
 def bestFit_tconfig(tconfig, date_dir):
@@ -206,24 +113,67 @@ def bestFit_tconfig(tconfig, date_dir):
 
 
 def callTransit(atmfile, tepfile, MCfile, stepsize, molfit, tconfig,
-                                           date_dir, params, burnin):
+                date_dir, params, burnin, PTtype="line", filters=None,
+                kurucz=None, solution=None, tint=100.0, output=None,
+                savefiles=True, binary=False, filter_cache=None, bins=None):
+    '''
+    Evaluate the best-fit model in-process with the transit module (as
+    BARTfunc does), and return the best-fit spectrum.
+    Plot best-fit and MCMC posterior PT profiles.
+
+    Parameters
+    ----------
+    atmfile: String
+       Atmospheric model file.
+    tepfile: String or system.System
+       A TEP file.
+    MCfile: String
+       MC3 output log file.
+    stepsize: 1D float ndarray
+       Parameters stepsize.
+    molfit: 1D string ndarray
+       Molecules fit.
+    tconfig: String
+       Transit configuration file (in date_dir).
+    date_dir: String
+       Output directory.
+    params: 1D float ndarray
+       Model-fitting parameters.
+    burnin: Integer
+       Number of burn-in iterations per chain.
+    PTtype: String
+       Temperature profile model.
+    filters: 1D string ndarray
+       Waveband filter files.
+    kurucz: String
+       Stellar Kurucz file.
+    solution: String
+       Solution geometry ('transit' or 'eclipse').
+    tint: Float
+       Internal temperature of the planet.
+    output: String
+       If not None, write the best-fit spectrum into this file (relative
+       to date_dir, unless it is an absolute path).
+    savefiles: Boolean
+       If True, write the best-fit atmospheric file and transit
+       configuration file (bestFit.atm, bestFit_tconfig.cfg).
+    binary: Boolean
+       If True, also write the best-fit spectrum in binary format (see
+       readtransit.binfile).
+    filter_cache: String
+       Filter-bank cache directory (see posterior.setup).
+    bins: 1D float ndarray
+       Wavelength edges (microns) of top-hat bins (see posterior.setup).
+
+    Returns
+    -------
+    specwn: 1D float ndarray
+       Wavenumber array of the spectrum (cm-1).
+    bestspectrum: 1D float ndarray
+       Best-fit spectrum.
+    bandflux: 1D float ndarray
+       Best-fit band-integrated fluxes.
     '''
-    Call Transit to produce best-fit outputs.
-    Plot MCMC posterior PT plot.
-
-    ''' 
-    # read atmfile
-    molecules, pressure, temp, abundances = mat.readatm(atmfile)
-
-    # get surface gravity
-    grav, Rp = mat.get_g(tepfile)
-
-    # convert gravity to cm/s^2
-    grav = grav*1e2
-
-    # get star data
-    R_star, T_star, sma, gstar = get_starData(tepfile)
-
     # get best parameters
     bestP, uncer, SN, mean = read_MCMC_out(MCfile)
 
@@ -236,13 +186,27 @@ def callTransit(atmfile, tepfile, MCfile, stepsize, molfit, tconfig,
     nPTparams = nparams - nmol
     PTparams  = allParams[:nPTparams]
 
-    # HARDCODED !
-    T_int = 100 # K
+    # initialize the transit module and the input/output converters
+    state = pp.setup(date_dir + tconfig, atmfile, tepfile, PTtype, molfit,
+                     filters, kurucz, solution, tint, filter_cache, bins)
+
+    # evaluate the best-fit model
+    bestspectrum, bandflux = pp.model(state, allParams)
+    specwn = state["specwn"]
+    pp.close()
+
+    # atmospheric pressure (as in atmfile), and best-fit temperature and
+    # abundance profiles
+    pressure = state["pressure"][::-1]
+    profiles = np.copy(state["profiles"])
+    best_T   = profiles[0]
 
-    # call PT line profile to calculate temperature
-    best_T = pt.PT_line(pressure, PTparams, R_star, T_star, T_int, sma, grav)
+    # write the best-fit spectrum
+    if output is not None:
+        rt.writespectrum(os.path.join(date_dir, output), specwn, bestspectrum, binary)
 
     # Plot best PT profile
+    plt = plots.pyplot()
     plt.figure(1)
     plt.semilogy(best_T, pressure, '-', color = 'r')
     plt.xlim(0.9*min(best_T), 1.1*max(best_T))
@@ -254,14 +218,11 @@ def callTransit(atmfile, tepfile, MCfile, stepsize, molfit, tconfig,
     # Save plot to current directory
     plt.savefig(date_dir + 'Best_PT.png') 
 
-    # write best-fit atmospheric file
-    write_atmfile(atmfile, molfit, best_T, allParams, date_dir)
-
-    # bestFit atm file
-    bestFit_atm = date_dir + 'bestFit.atm'
-
-    # write new bestFit Transit config
-    bestFit_tconfig(tconfig, date_dir)
+    if savefiles:
+        # write best-fit atmospheric file
+        write_atmfile(atmfile, profiles, date_dir)
+        # write new bestFit Transit config
+        bestFit_tconfig(tconfig, date_dir)
 
     # ========== plot MCMC PT profiles ==========
 
@@ -279,7 +240,7 @@ def callTransit(atmfile, tepfile, MCfile, stepsize, molfit, tconfig,
     PTprofiles = np.zeros((np.shape(data_stack)[1], len(pressure)))
 
     # current PT parameters for each chain, iteration
-    curr_PTparams = PTparams
+    curr_PTparams = np.copy(PTparams)
 
     # fill-in PT profiles array
     print("  Plotting MCMC PT profile figure.")
@@ -291,8 +252,8 @@ def callTransit(atmfile, tepfile, MCfile, stepsize, molfit, tconfig,
                 j +=1
             else:
                 pass
-        PTprofiles[k] = pt.PT_line(pressure, curr_PTparams, R_star, T_star,
-                                                          T_int, sma, grav)
+        PTprofiles[k] = pt.PT_generator(state["pressure"], curr_PTparams,
+                                        state["PTargs"])[::-1]
 
     # get percentiles (for 1,2-sigma boundaries):
     low1 = np.percentile(PTprofiles, 16.0, axis=0)
@@ -318,12 +279,18 @@ def callTransit(atmfile, tepfile, MCfile, stepsize, molfit, tconfig,
     savefile = date_dir + "MCMC_PTprofiles.png" 
     plt.savefig(savefile)
 
+    return specwn, bestspectrum, bandflux
+
 
 
-def plot_bestFit_Spectrum(filters, kurucz, tepfile, solution, output, data,
-                                                          uncert, date_dir):
+def plot_bestFit_Spectrum(filters, kurucz, tepfile, solution, specwn,
+                          bestspectrum, data, uncert, date_dir, bins=None,
+                          filter_cache=None):
     '''
-    plots BART best-model spectrum
+    plots BART best-model spectrum (as returned by callTransit)
+
+    filter_cache is the filter-bank cache directory of the MCMC run
+    (see BARTfunc), if None, use date_dir (the transit config directory).
     '''
     # get star data
     R_star, T_star, sma, gstar = get_starData(tepfile)
@@ -339,41 +306,32 @@ def plot_bestFit_Spectrum(filters, kurucz, tepfile, solution, output, data,
   
     # read kurucz file
     starfl, starwn, tmodel, gmodel = w.readkurucz(kurucz, T_star, gstar)
+    # filters resampled to specwn (cached by the MCMC run)
+    if filter_cache is None:
+        filter_cache = date_dir
+    bank = w.FilterBank(specwn, filters, kurucz, T_star, gstar, filter_cache)
 
-    # read best-fit spectrum output file, take wn and spectra values
+    # print on screen
     if solution == 'eclipse':
-        specwn, bestspectrum = rt.readspectrum(date_dir + output, wn=True)
-        # print on screen
         print("  Plotting BART best-fit eclipse spectrum figure.")
     elif solution == 'transit':
-        specwn, bestspectrum = rt.readspectrum(date_dir + output, wn=True)
-        # print on screen
         print("  Plotting BART best-fit modulation spectrum figure.")
 
     # convert wn to wl
     specwl = 1e4/specwn
 
     # number of filters
+    if filters is None:
+        filters = []
     nfilters = len(filters)
 
-    # read and resample the filters:
-    nifilter  = [] # Normalized interpolated filter
-    istarfl   = [] # interpolated stellar flux
-    wnindices = [] # wavenumber indices used in interpolation
-    meanwn    = [] # Filter mean wavenumber
-    for i in np.arange(nfilters):
-        # read filter:
-        filtwaven, filttransm = w.readfilter(filters[i])
-        meanwn.append(np.sum(filtwaven*filttransm)/sum(filttransm))
-        # resample filter and stellar spectrum:
-        nifilt, strfl, wnind = w.resample(specwn, filtwaven, filttransm,
-                                            starwn,    starfl)
-        nifilter.append(nifilt)
-        istarfl.append(strfl)
-        wnindices.append(wnind)
+    # resampled filters and stellar flux, and filter mean wavenumbers:
+    nifilter  = bank.nifilter
+    istarfl   = bank.istarfl
+    wnindices = bank.wnindices
 
     # convert mean wn to mean wl
-    meanwl = 1e4/np.asarray(meanwn)
+    meanwl = 1e4/bank.meanwn
 
     # band-integrate the flux-ratio or modulation:
     bandflux = np.zeros(nfilters, dtype='d')
@@ -385,12 +343,22 @@ def plot_bestFit_Spectrum(filters, kurucz, tepfile, solution, output, data,
         bandmod[i]  = w.bandintegrate(bestspectrum[wnindices[i]],
                                             specwn, nifilter[i], wnindices[i])
 
+    # top-hat bins (after the filters):
+    if bins is not None:
+        tophat   = w.Bins(specwn, bins, kurucz, T_star, gstar)
+        meanwl   = np.concatenate((meanwl, 1e4/tophat.meanwn))
+        bandflux = np.concatenate((bandflux,
+                                   tophat.fluxratio(bestspectrum, rprs)))
+        bandmod  = np.concatenate((bandmod, tophat.integrate(bestspectrum)))
+
     # stellar spectrum on specwn:
     sinterp = si.interp1d(starwn, starfl)
     sflux = sinterp(specwn)
     frat = bestspectrum/sflux * rprs * rprs
 
     # plot figure
+    plt = plots.pyplot()
+    import matplotlib
     plt.rcParams["mathtext.default"] = 'rm'
     matplotlib.rcParams.update({'mathtext.default':'rm'})
     matplotlib.rcParams.update({'font.size':10})
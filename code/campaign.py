@@ -0,0 +1,321 @@
+# ****************************** START LICENSE *******************************
+# Bayesian Atmospheric Radiative Transfer (BART), a code to infer
+# properties of planetary atmospheres based on observed spectroscopic
+# information.
+# 
+# This project was completed with the support of the NASA Planetary
+# Atmospheres Program, grant NNX12AI69G, held by Principal Investigator
+# Joseph Harrington. Principal developers included graduate students
+# Patricio E. Cubillos and Jasmina Blecic, programmer Madison Stemm, and
+# undergraduates M. Oliver Bowman and Andrew S. D. Foster.  The included
+# 'transit' radiative transfer code is based on an earlier program of
+# the same name written by Patricio Rojo (Univ. de Chile, Santiago) when
+# he was a graduate student at Cornell University under Joseph
+# Harrington.  Statistical advice came from Thomas J. Loredo and Nate
+# B. Lust.
+# 
+# Copyright (C) 2015 University of Central Florida.  All rights reserved.
+# 
+# This is a test version only, and may not be redistributed to any third
+# party.  Please refer such requests to us.  This program is distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+# 
+# Our intent is to release this software under an open-source,
+# reproducible-research license, once the code is mature and the first
+# research paper describing the code has been accepted for publication
+# in a peer-reviewed journal.  We are committed to development in the
+# open, and have posted this code on github.com so that others can test
+# it and give us feedback.  However, until its first publication and
+# first stable release, we do not permit others to redistribute the code
+# in either original or modified form, nor to publish work based in
+# whole or in part on the output of this code.  By downloading, running,
+# or modifying this code, you agree to these conditions.  We do
+# encourage sharing any modifications with us and discussing them
+# openly.
+# 
+# We welcome your feedback, but do not guarantee support.  Please send
+# feedback or inquiries to:
+# 
+# Joseph Harrington <jh@physics.ucf.edu>
+# Patricio Cubillos <pcubillos@fulbrightmail.org>
+# Jasmina Blecic <jasmina@physics.ucf.edu>
+# 
+# or alternatively,
+# 
+# Joseph Harrington, Patricio Cubillos, and Jasmina Blecic
+# UCF PSB 441
+# 4111 Libra Drive
+# Orlando, FL 32816-2385
+# USA
+# 
+# Thank you for testing BART!
+# ******************************* END LICENSE *******************************
+
+"""
+Campaign mode: run the BART pipelines of many targets and scenarios
+concurrently, within a global CPU budget.
+
+The campaign configuration file has a [campaign] section with one BART
+run per line of the 'runs' key (a BART configuration file followed by
+optional command-line arguments that override its BART options; the
+transit and MC3 options always come from the configuration file).
+Relative paths are relative to the directory where the campaign runs,
+and each run must have its own loc_dir.  Each run is a separate BART
+process (the transit module keeps process-global state), writing its
+output into loc_dir/campaign.log; the runs share the CPU budget through
+a pipeline.FileResources file.  For example:
+
+[campaign]
+# Total number of CPUs:
+ncpu    = 32
+# Maximum number of concurrent executions per stage:
+limits  = tea 4
+          opacity 2
+# BART runs:
+runs    = HD209458b/BART.cfg
+          HD209458b/BART.cfg --solar_times 10 --loc_dir HD209458b/x10/
+          WASP-12b/BART.cfg
+# Status and timing report:
+report  = campaign.json
+
+Run with:
+  python BART/code/campaign.py -c campaign.cfg
+
+Functions
+---------
+readcampaign:
+     Read a campaign configuration file.
+runall:
+     Run the pipelines of a campaign.
+report:
+     Write the status and timing report of a campaign.
+"""
+
+import sys, os, time, json, shlex, signal, tempfile, subprocess
+import argparse, ConfigParser
+import numpy as np
+
+filedir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(filedir + "/..")
+sys.path.append(filedir + "/../modules/MCcubed/src/")
+import mcutils  as mu
+import pipeline as pl
+import BART
+
+
+def readcampaign(cfile):
+  """
+  Read a campaign configuration file.
+
+  Parameters:
+  -----------
+  cfile: String
+     Campaign configuration file.
+
+  Returns:
+  --------
+  runs: List of lists of strings
+     Command-line arguments of each BART run.
+  ncpu: Integer
+     Total number of CPUs (None if not set).
+  limits: Dictionary
+     Maximum number of concurrent executions per stage name.
+  report: String
+     Report file name (None if not set).
+  """
+  config = ConfigParser.SafeConfigParser()
+  config.read([cfile])
+  if not config.has_section("campaign"):
+    mu.error("Campaign file '{:s}' has no [campaign] section.".format(cfile))
+  options = dict(config.items("campaign"))
+
+  runs = []
+  for line in options.get("runs", "").split("\n"):
+    if line.strip() != "":
+      argv = shlex.split(line)
+      runs.append(["-c", argv[0]] + argv[1:])
+
+  ncpu = None
+  if "ncpu" in options:
+    ncpu = int(options["ncpu"])
+
+  limits = {}
+  for line in options.get("limits", "").split("\n"):
+    if line.strip() != "":
+      name, limit = line.split()
+      limits[name] = int(limit)
+
+  return runs, ncpu, limits, options.get("report")
+
+
+def runall(runs, ncpu=None, limits={}, poll=1.0):
+  """
+  Run the BART pipelines of a campaign concurrently and non-interactively,
+  each in its own process.  All pipelines share the CPU budget and the
+  per-stage limits.
+
+  Parameters:
+  -----------
+  runs: List of lists of strings
+     Command-line arguments of each BART run.
+  ncpu: Integer
+     Total number of CPUs (default: number of CPUs).
+  limits: Dictionary
+     Maximum number of concurrent executions per stage name.
+  poll: Float
+     Interval (s) between checks of the runs' status.
+
+  Returns:
+  --------
+  results: List of dictionaries
+     For each run: the arguments, output directory, status ('done' or
+     'failed'), error message, and the status and execution time of
+     each stage.
+  """
+  # CPU budget shared by the BART processes:
+  fd, rfile = tempfile.mkstemp(prefix="campaign_", suffix=".json", dir=".")
+  os.close(fd)
+  pl.FileResources(rfile, ncpu, limits)
+
+  results = []
+  procs = []
+  try:
+    # Start the runs:
+    for argv in runs:
+      result = {"argv":argv, "dir":None, "status":"failed", "error":None,
+                "time":0.0, "stages":[]}
+      results.append(result)
+      try:
+        args, cfile = BART.parse(argv)
+        result["dir"] = BART.outdir(args)
+      except BaseException as error:
+        result["error"] = "{:s}: {}".format(type(error).__name__, error)
+        continue
+      if result["dir"] in [other["dir"] for other in results[:-1]]:
+        result["error"] = "Output folder already used by another run."
+        continue
+      if not os.path.isdir(result["dir"]):
+        os.makedirs(result["dir"])
+      # Remove the manifest of a previous run (read after this one):
+      if os.path.isfile(result["dir"] + "run_manifest.json"):
+        os.remove(result["dir"] + "run_manifest.json")
+      log = open(result["dir"] + "campaign.log", "w")
+      result["start"] = time.time()
+      # Each run in its own process group, so that it can be stopped
+      # together with its children (mpiexec, transit, TEA):
+      proc = subprocess.Popen([sys.executable, filedir + "/../BART.py"] +
+                              argv + ["--batch", "--resources", rfile],
+                              stdout=log, stderr=subprocess.STDOUT,
+                              preexec_fn=os.setsid)
+      log.close()
+      procs.append((proc, result))
+
+    # Wait for all runs (poll, to allow KeyboardInterrupt):
+    while np.any([proc.poll() is None for proc, result in procs]):
+      time.sleep(poll)
+  except BaseException:
+    for proc, result in procs:
+      try:
+        os.killpg(proc.pid, signal.SIGTERM)
+      except OSError:
+        pass
+    raise
+  finally:
+    os.remove(rfile)
+
+  # Collect the run status, and the stage status and times (from the
+  # run manifests):
+  for proc, result in procs:
+    result["time"] = time.time() - result.pop("start")
+    if proc.returncode == 0:
+      result["status"] = "done"
+    else:
+      result["error"] = "BART exit code {:d} (see '{:s}campaign.log').".\
+                        format(proc.returncode, result["dir"])
+    mfile = result["dir"] + "run_manifest.json"
+    if os.path.isfile(mfile):
+      f = open(mfile, "r")
+      manifest = json.load(f)
+      f.close()
+      for stage in manifest["stages"]:
+        result["stages"].append({"name":stage["name"],
+                                 "status":stage["status"],
+                                 "time":stage.get("wall")})
+  return results
+
+
+def report(results, rfile=None):
+  """
+  Print the status and timing of the campaign runs, and optionally
+  write them to a JSON file.
+
+  Parameters:
+  -----------
+  results: List of dictionaries
+     Output of runall().
+  rfile: String
+     JSON report file name.
+  """
+  mu.msg(1, "\nCampaign report:")
+  for result in results:
+    mu.msg(1, "{:s}  {:s}  ({:.1f} s)".format(" ".join(result["argv"][1:]),
+                                               result["status"],
+                                               result["time"]), indent=2)
+    if result["error"] is not None:
+      mu.msg(1, result["error"], indent=4)
+    for stage in result["stages"]:
+      if stage["time"] is None:
+        mu.msg(1, "{:12s} {:s}".format(stage["name"], stage["status"]),
+               indent=4)
+      else:
+        mu.msg(1, "{:12s} {:8s} {:10.1f} s".format(stage["name"],
+                                    stage["status"], stage["time"]), indent=4)
+  ndone = np.sum([result["status"] == "done" for result in results])
+  mu.msg(1, "{:d} of {:d} runs completed.".format(ndone, len(results)),
+         indent=2)
+
+  if rfile is not None:
+    f = open(rfile, "w")
+    json.dump(results, f, indent=1, sort_keys=True)
+    f.close()
+
+
+def main():
+  """
+  Run a BART campaign.
+  """
+  parser = argparse.ArgumentParser(description=__doc__,
+                         formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("-c", "--config_file", dest="cfile",
+           help="Campaign configuration file", metavar="FILE")
+  parser.add_argument("--ncpu", dest="ncpu",
+           help="Total number of CPUs [default: from the configuration "
+                "file, or the number of CPUs]",
+           type=int, action="store", default=None)
+  parser.add_argument("--report", dest="report",
+           help="JSON status and timing report file",
+           type=str, action="store", default=None)
+  args = parser.parse_args()
+
+  if args.cfile is None or not os.path.isfile(args.cfile):
+    mu.error("Campaign configuration file: '{}' not found.".
+             format(args.cfile))
+  runs, ncpu, limits, rfile = readcampaign(args.cfile)
+  if args.ncpu is not None:
+    ncpu = args.ncpu
+  if args.report is not None:
+    rfile = args.report
+
+  mu.msg(1, "\nBART campaign with {:d} runs.".format(len(runs)))
+  results = runall(runs, ncpu, limits)
+  report(results, rfile)
+
+  # Exit with an error code if any run failed:
+  if np.any([result["status"] != "done" for result in results]):
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
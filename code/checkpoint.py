@@ -0,0 +1,321 @@
+# ****************************** START LICENSE *******************************
+# Bayesian Atmospheric Radiative Transfer (BART), a code to infer
+# properties of planetary atmospheres based on observed spectroscopic
+# information.
+# 
+# This project was completed with the support of the NASA Planetary
+# Atmospheres Program, grant NNX12AI69G, held by Principal Investigator
+# Joseph Harrington. Principal developers included graduate students
+# Patricio E. Cubillos and Jasmina Blecic, programmer Madison Stemm, and
+# undergraduates M. Oliver Bowman and Andrew S. D. Foster.  The included
+# 'transit' radiative transfer code is based on an earlier program of
+# the same name written by Patricio Rojo (Univ. de Chile, Santiago) when
+# he was a graduate student at Cornell University under Joseph
+# Harrington.  Statistical advice came from Thomas J. Loredo and Nate
+# B. Lust.
+# 
+# Copyright (C) 2015 University of Central Florida.  All rights reserved.
+# 
+# This is a test version only, and may not be redistributed to any third
+# party.  Please refer such requests to us.  This program is distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+# 
+# Our intent is to release this software under an open-source,
+# reproducible-research license, once the code is mature and the first
+# research paper describing the code has been accepted for publication
+# in a peer-reviewed journal.  We are committed to development in the
+# open, and have posted this code on github.com so that others can test
+# it and give us feedback.  However, until its first publication and
+# first stable release, we do not permit others to redistribute the code
+# in either original or modified form, nor to publish work based in
+# whole or in part on the output of this code.  By downloading, running,
+# or modifying this code, you agree to these conditions.  We do
+# encourage sharing any modifications with us and discussing them
+# openly.
+# 
+# We welcome your feedback, but do not guarantee support.  Please send
+# feedback or inquiries to:
+# 
+# Joseph Harrington <jh@physics.ucf.edu>
+# Patricio Cubillos <pcubillos@fulbrightmail.org>
+# Jasmina Blecic <jasmina@physics.ucf.edu>
+# 
+# or alternatively,
+# 
+# Joseph Harrington, Patricio Cubillos, and Jasmina Blecic
+# UCF PSB 441
+# 4111 Libra Drive
+# Orlando, FL 32816-2385
+# USA
+# 
+# Thank you for testing BART!
+# ******************************* END LICENSE *******************************
+
+"""
+Checkpointed MCMC runs.
+
+The MCMC runs as a sequence of MC3 segments (each one in its own
+folder), with the segment length set by a number of iterations or by a
+wall-clock time.  After each segment the chains are appended to the
+run's output file and the checkpoint state (including the last
+ensemble of the chains) is saved, so that a crashed or preempted run
+can resume after the last completed segment.
+
+MC3 does not expose its sampler state, nor takes the starting point of
+each chain, so a new segment re-initializes the chains around the last
+ensemble (its median and standard deviation) and runs an extra
+'checkpoint_burnin' iterations per chain, which are discarded when
+appending its chains.  When the MC3 configuration sets a seed, each
+segment runs with the seed plus its segment index, so that a resumed
+run repeats the segments of an uninterrupted run.
+
+Functions
+---------
+segmentcfg:
+     Write the MC3 configuration file of a segment.
+done:
+     Number of checkpointed iterations of a run.
+run:
+     Run a checkpointed MCMC.
+"""
+
+import os, sys, time, json, shutil, hashlib, ConfigParser
+import numpy as np
+
+import pipeline as pl
+
+filedir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(filedir + "/../modules/MCcubed/src/")
+import mcutils as mu
+
+
+def segmentcfg(MCMC_cfile, segcfile, numit, burnin, params=None,
+               stepsize=None, seed=None):
+  """
+  Write the MC3 configuration file of a segment.
+
+  Parameters:
+  -----------
+  MCMC_cfile: String
+     MC3 configuration file of the run.
+  segcfile: String
+     Output configuration file of the segment.
+  numit: Integer
+     Number of iterations (all chains) of the segment.
+  burnin: Integer
+     Number of burn-in iterations per chain.
+  params: 1D float ndarray
+     Initial parameters (default: those of MCMC_cfile).
+  stepsize: 1D float ndarray
+     Initial parameter spread (default: those of MCMC_cfile).
+  seed: Integer
+     Random seed of the segment (default: that of MCMC_cfile).
+  """
+  config = ConfigParser.SafeConfigParser()
+  config.optionxform = str
+  config.read([MCMC_cfile])
+  config.set("MCMC", "numit",  "{:d}".format(numit))
+  config.set("MCMC", "burnin", "{:d}".format(burnin))
+  if params is not None:
+    config.set("MCMC", "params",   " ".join(["{:.10g}".format(p)
+                                             for p in params]))
+    config.set("MCMC", "stepsize", " ".join(["{:.10g}".format(s)
+                                             for s in stepsize]))
+  if seed is not None:
+    config.set("MCMC", "seed", "{:d}".format(seed))
+  # Keep the segment outputs in the segment folder:
+  for key in ["logfile", "savemodel"]:
+    if config.has_option("MCMC", key):
+      config.set("MCMC", key, os.path.basename(config.get("MCMC", key)))
+  with open(segcfile, "w") as f:
+    config.write(f)
+
+
+def done(date_dir):
+  """
+  Number of iterations (all chains) checkpointed in date_dir.
+
+  Returns:
+  --------
+  numit: Integer
+     Checkpointed iterations (zero if there is no checkpoint).
+  """
+  statefile = os.path.join(date_dir, "checkpoint", "state.json")
+  if not os.path.isfile(statefile):
+    return 0
+  f = open(statefile, "r")
+  state = json.load(f)
+  f.close()
+  return state["numit"]
+
+
+def save(filename, array):
+  """
+  Save an ndarray into a .npy file, atomically.
+  """
+  np.save(filename + ".tmp.npy", array)
+  os.rename(filename + ".tmp.npy", filename)
+
+
+def run(MCMC_cfile, MC3call, date_dir, output, logfile, params, stepsize,
+        every_iter=None, every_time=None, chkburnin=0, resume=False):
+  """
+  Run the MCMC in checkpointed segments.
+
+  Parameters:
+  -----------
+  MCMC_cfile: String
+     MC3 configuration file.
+  MC3call: String
+     MC3 executable.
+  date_dir: String
+     Output directory of the run.
+  output: String
+     Output file with the chains, shape (nchains, nfree, niter).
+  logfile: String
+     MC3 log file of the run (a copy of the last segment log).
+  params: 1D float ndarray
+     Initial model-fitting parameters.
+  stepsize: 1D float ndarray
+     Parameters stepsize (fixed parameters have zero stepsize).
+  every_iter: Integer
+     Number of iterations (all chains) between checkpoints.
+  every_time: Float
+     Wall-clock time (minutes) between checkpoints.
+  chkburnin: Integer
+     Burn-in iterations per chain discarded at each restart.
+  resume: Bool
+     If True, continue after the last checkpoint.
+
+  Returns:
+  --------
+  code: Integer
+     Exit code of the last MC3 call.
+  """
+  config = ConfigParser.SafeConfigParser()
+  config.optionxform = str
+  config.read([MCMC_cfile])
+  numit   = int(float(config.get("MCMC", "numit")))
+  nchains = int(config.get("MCMC", "nchains"))
+  burnin  = int(config.get("MCMC", "burnin"))
+  seed = None
+  if config.has_option("MCMC", "seed"):
+    seed = int(config.get("MCMC", "seed"))
+  params   = np.asarray(params,   np.double)
+  stepsize = np.asarray(stepsize, np.double)
+  ifree = stepsize > 0
+
+  # Checkpoint folder and state:
+  chkdir    = os.path.join(date_dir, "checkpoint")
+  statefile = os.path.join(chkdir, "state.json")
+  cfg = open(MCMC_cfile, "r")
+  key = hashlib.sha1(cfg.read()).hexdigest()
+  cfg.close()
+  if resume:
+    if not os.path.isfile(statefile):
+      mu.error("No MCMC checkpoint to resume from in '{:s}'.".format(chkdir))
+    f = open(statefile, "r")
+    state = json.load(f)
+    f.close()
+    if state["key"] != key:
+      mu.error("The MC3 configuration file '{:s}' changed since the "
+               "checkpoint in '{:s}'.".format(MCMC_cfile, chkdir))
+    mu.msg(1, "Resume MCMC after {:d} of {:d} iterations.".
+              format(state["numit"], numit), indent=2)
+    # Drop samples appended after the last checkpoint:
+    if state["numit"] > 0:
+      chains = np.load(output)
+      if np.shape(chains)[2] > state["nsamples"]:
+        save(output, chains[:,:,:state["nsamples"]])
+  else:
+    if os.path.isdir(chkdir):
+      shutil.rmtree(chkdir)
+    os.mkdir(chkdir)
+    state = {"key":key, "numit":0, "nsamples":0, "segments":[]}
+    if os.path.isfile(output):
+      os.remove(output)
+
+  if every_time is None and every_iter is None:
+    every_iter = numit
+  if every_iter is not None:
+    every_iter = int(every_iter)
+  chkburnin = int(chkburnin)
+  code = 0
+  while state["numit"] < numit:
+    iseg = len(state["segments"])
+    # Segment length (a multiple of nchains):
+    if every_time is not None and iseg > 0:
+      rate = state["numit"] / np.sum([s["wall"] for s in state["segments"]])
+      segit = int(rate * every_time * 60.0)
+      if every_iter is not None:
+        segit = np.amin([segit, every_iter])
+    elif every_iter is not None:
+      segit = every_iter
+    else:
+      segit = numit // 10
+    remaining = numit - state["numit"]
+    if iseg == 0:
+      segit = np.clip(segit, nchains*(burnin+1), remaining)
+    else:
+      segit = np.clip(segit, nchains, remaining)
+    # Do not leave a tail too short for a restart:
+    if remaining - segit < nchains*(chkburnin+1):
+      segit = remaining
+    segit = int(np.ceil(segit / float(nchains))) * nchains
+
+    # Restart around the last ensemble of the previous segment, with an
+    # extra burn-in:
+    inipars, inistep = None, None
+    segburn, segnumit = burnin, segit
+    if iseg > 0:
+      last = np.load(os.path.join(state["segments"][-1]["dir"], "last.npy"))
+      inipars = np.copy(params)
+      inistep = np.copy(stepsize)
+      inipars[ifree] = np.median(last, axis=0)
+      spread = np.std(last, axis=0)
+      inistep[ifree] = np.where(spread > 0, spread, stepsize[ifree])
+      segburn  = chkburnin
+      segnumit = segit + nchains*chkburnin
+    segseed = None
+    if seed is not None:
+      segseed = seed + iseg
+
+    segdir = os.path.join(chkdir, "segment{:03d}".format(iseg))
+    if os.path.isdir(segdir):
+      shutil.rmtree(segdir)
+    os.mkdir(segdir)
+    segcfile = os.path.join(segdir, "MCMC.cfg")
+    segmentcfg(MCMC_cfile, segcfile, segnumit, segburn, inipars, inistep,
+               segseed)
+
+    mu.msg(1, "MCMC segment {:d}: {:d} iterations.".format(iseg, segit),
+           indent=2)
+    start = time.time()
+    code = pl.call(["mpiexec {:s} -c {:s}".format(MC3call, segcfile)],
+                   shell=True, cwd=segdir)
+    if code:
+      return code
+
+    # Append the segment chains (drop the restart burn-in), and keep the
+    # last ensemble:
+    chains = np.load(os.path.join(segdir, "output.npy"))
+    if iseg > 0:
+      chains = chains[:,:,segburn:]
+    save(os.path.join(segdir, "last.npy"), chains[:,:,-1])
+    if os.path.isfile(output):
+      chains = np.concatenate((np.load(output), chains), axis=2)
+    save(output, chains)
+    shutil.copy2(os.path.join(segdir, os.path.basename(logfile)), logfile)
+
+    # Save the checkpoint:
+    state["numit"] += segit
+    state["nsamples"] = np.shape(chains)[2]
+    state["segments"].append({"dir":segdir, "numit":segit,
+                              "wall":time.time() - start})
+    f = open(statefile + ".tmp", "w")
+    json.dump(state, f, indent=1)
+    f.close()
+    os.rename(statefile + ".tmp", statefile)
+  return code
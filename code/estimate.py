@@ -0,0 +1,314 @@
+# ****************************** START LICENSE *******************************
+# Bayesian Atmospheric Radiative Transfer (BART), a code to infer
+# properties of planetary atmospheres based on observed spectroscopic
+# information.
+# 
+# This project was completed with the support of the NASA Planetary
+# Atmospheres Program, grant NNX12AI69G, held by Principal Investigator
+# Joseph Harrington. Principal developers included graduate students
+# Patricio E. Cubillos and Jasmina Blecic, programmer Madison Stemm, and
+# undergraduates M. Oliver Bowman and Andrew S. D. Foster.  The included
+# 'transit' radiative transfer code is based on an earlier program of
+# the same name written by Patricio Rojo (Univ. de Chile, Santiago) when
+# he was a graduate student at Cornell University under Joseph
+# Harrington.  Statistical advice came from Thomas J. Loredo and Nate
+# B. Lust.
+# 
+# Copyright (C) 2015 University of Central Florida.  All rights reserved.
+# 
+# This is a test version only, and may not be redistributed to any third
+# party.  Please refer such requests to us.  This program is distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+# 
+# Our intent is to release this software under an open-source,
+# reproducible-research license, once the code is mature and the first
+# research paper describing the code has been accepted for publication
+# in a peer-reviewed journal.  We are committed to development in the
+# open, and have posted this code on github.com so that others can test
+# it and give us feedback.  However, until its first publication and
+# first stable release, we do not permit others to redistribute the code
+# in either original or modified form, nor to publish work based in
+# whole or in part on the output of this code.  By downloading, running,
+# or modifying this code, you agree to these conditions.  We do
+# encourage sharing any modifications with us and discussing them
+# openly.
+# 
+# We welcome your feedback, but do not guarantee support.  Please send
+# feedback or inquiries to:
+# 
+# Joseph Harrington <jh@physics.ucf.edu>
+# Patricio Cubillos <pcubillos@fulbrightmail.org>
+# Jasmina Blecic <jasmina@physics.ucf.edu>
+# 
+# or alternatively,
+# 
+# Joseph Harrington, Patricio Cubillos, and Jasmina Blecic
+# UCF PSB 441
+# 4111 Libra Drive
+# Orlando, FL 32816-2385
+# USA
+# 
+# Thank you for testing BART!
+# ******************************* END LICENSE *******************************
+
+"""
+Pre-run cost estimator: time the setup and a few forward-model
+evaluations with the run's configuration and extrapolate the MCMC wall
+time, core hours, and memory for different numbers of MPI ranks.
+
+Functions
+---------
+opacity:
+     Time a two-temperature opacity table and extrapolate the full one.
+measure:
+     Time the setup and forward-model evaluations in this process.
+extrapolate:
+     Extrapolate the MCMC cost for a number of ranks.
+estimate:
+     Measure and extrapolate the cost of a BART run.
+report:
+     Print the cost estimate.
+"""
+
+import os, sys, time, json, resource, multiprocessing
+import numpy as np
+
+import makecfg   as mc
+import opacity   as op
+import pipeline  as pl
+import posterior as pp
+import system    as sy
+import wine      as w
+
+filedir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(filedir + "/../modules/MCcubed/src/")
+import mcutils as mu
+
+
+def opacity(MCMC_cfile, tepfile, Tcall, cwd, outdir):
+  """
+  Generate the opacity table of the run for only its two lowest grid
+  temperatures, and extrapolate the time of the full table (the cost
+  of an opacity table is proportional to its number of temperatures).
+
+  Parameters:
+  -----------
+  MCMC_cfile: String
+     MC3 configuration file (from makecfg.makeMCMC).
+  tepfile: String or system.System
+     A TEP file.
+  Tcall: String
+     Transit executable.
+  cwd: String
+     Directory where to run transit.
+  outdir: String
+     Directory for the reduced transit configuration and opacity files.
+
+  Returns:
+  --------
+  tconfig: String
+     Transit configuration file that uses the reduced opacity table (the
+     forward-model timing does not depend on the number of temperatures).
+  cost: Dictionary
+     Time (s) of the reduced table, number of temperatures of the full
+     table, and extrapolated time (s) of the full table.
+  """
+  args = mc.read(MCMC_cfile)
+  temp = op.tempgrid(float(args["tlow"]), float(args["thigh"]),
+                     float(args["tempdelt"]))
+  if not os.path.isdir(outdir):
+    os.makedirs(outdir)
+  tconfig = os.path.join(outdir, "transit.cfg")
+  mc.makeTransit(MCMC_cfile, tepfile,
+                 {"tconfig":tconfig,
+                  "opacityfile":os.path.join(outdir, "opacity.dat"),
+                  "tlow":"{:.6g}".format(temp[0]),
+                  "thigh":"{:.6g}".format(temp[min(1, len(temp)-1)])})
+  start = time.time()
+  code = pl.call([Tcall, "-c", tconfig, "--justOpacity"], cwd=cwd)
+  elapsed = time.time() - start
+  if code:
+    mu.error("Transit call for the reduced opacity table failed (exit code "
+             "{:d}).".format(code))
+  ntemp = len(temp)
+  return tconfig, {"time":elapsed, "ntemp":ntemp,
+                   "full":elapsed * ntemp / float(min(2, ntemp))}
+
+
+def measure(tconfig, atmfile, tepfile, PTtype, molfit, filters, kurucz,
+            solution, tint, params, stepsize, nevals=5, kfile=None,
+            bins=None):
+  """
+  Time the setup and forward-model evaluations in this process.
+
+  Parameters:
+  -----------
+  tconfig, atmfile, tepfile, PTtype, molfit, filters, kurucz, solution,
+  tint:
+     Forward-model arguments (see posterior.setup()).
+  params: 1D float ndarray
+     Model-fitting parameters.
+  stepsize: 1D float ndarray
+     Parameters stepsize (the evaluated models are drawn around params).
+  nevals: Integer
+     Number of forward-model evaluations to time.
+  kfile: String
+     Kurucz file whose parsing is timed (default: kurucz).
+  bins: 1D float ndarray
+     Wavelength edges of top-hat bins (see posterior.setup()).
+
+  Returns:
+  --------
+  timing: Dictionary
+     Kurucz-parsing, setup (transit initialization with the opacity
+     table, stellar model, and filters), and mean evaluation times (s),
+     the number of wavenumber samples, layers, and bands, and the peak
+     resident memory (kB) of this process.
+  """
+  timing = {}
+  if kfile is None:
+    kfile = kurucz
+  # Kurucz parsing:
+  system = sy.load(tepfile)
+  start = time.time()
+  w.readkurucz(kfile, system.tstar, system.gstar)
+  timing["kurucz"] = time.time() - start
+
+  # Worker setup (opacity-table loading happens in transit_init):
+  start = time.time()
+  state = pp.setup(tconfig, atmfile, tepfile, PTtype, molfit, filters,
+                   kurucz, solution, tint, bins=bins)
+  timing["setup"] = time.time() - start
+
+  # Forward-model evaluations (first one excluded as a warm up):
+  params   = np.asarray(params,   np.double)
+  stepsize = np.asarray(stepsize, np.double)
+  times = []
+  for i in np.arange(nevals+1):
+    pars = params + np.abs(stepsize) * np.random.normal(0, 1, len(params))
+    start = time.time()
+    spectrum, bandflux = pp.model(state, pars)
+    times.append(time.time() - start)
+  pp.close()
+  timing["eval"]     = np.mean(times[1:])
+  timing["eval_std"] = np.std(times[1:])
+  timing["nwave"]    = int(state["nwave"])
+  timing["nlayers"]  = len(state["pressure"])
+  timing["nfilters"] = len(bandflux)
+  timing["maxrss"]   = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return timing
+
+
+def extrapolate(timing, numit, nchains, nfree, nranks):
+  """
+  Extrapolate the MCMC cost for a number of ranks.  Each rank evaluates
+  its share of the chains at every iteration, so the chains of the
+  busiest rank set the wall time.
+
+  Parameters:
+  -----------
+  timing: Dictionary
+     Output of measure().
+  numit: Integer
+     Total number of MCMC iterations (all chains).
+  nchains: Integer
+     Number of chains.
+  nfree: Integer
+     Number of free parameters.
+  nranks: Integer
+     Number of MPI worker ranks.
+
+  Returns:
+  --------
+  cost: Dictionary
+     Wall time (s), core hours, parallel efficiency, and memory (kB).
+  """
+  niter = numit / float(nchains)   # Iterations per chain
+  wall = (timing["setup"] +
+          np.ceil(nchains / float(nranks)) * niter * timing["eval"])
+  serial = timing["setup"] + numit * timing["eval"]
+  # Workers plus the chains and models stored by the master:
+  memory = (nranks * timing["maxrss"] +
+            numit * (nfree + timing["nfilters"]) * 8 / 1024.0)
+  return {"ranks":      nranks,
+          "wall":       wall,
+          "corehours":  wall * nranks / 3600.0,
+          "efficiency": serial / (nranks * wall),
+          "memory":     memory}
+
+
+def estimate(tconfig, atmfile, tepfile, PTtype, molfit, filters, kurucz,
+             solution, tint, params, stepsize, numit, nchains, ncpu=None,
+             nevals=5, efficiency=0.8, kfile=None, bins=None, opcost=None):
+  """
+  Measure and extrapolate the cost of a BART run.
+
+  Parameters:
+  -----------
+  (See measure() and extrapolate().)
+  opcost: Dictionary
+     Opacity-table cost (see opacity()), if the table is to be generated.
+  ncpu: Integer
+     Available cores (default: number of CPUs of this machine).
+  efficiency: Float
+     Minimum parallel efficiency of the suggested number of ranks.
+
+  Returns:
+  --------
+  estimate: Dictionary
+     The measured timing, the cost for each candidate number of ranks
+     (the divisors of nchains up to ncpu), and the suggested ranks: the
+     most ranks (shortest wall time) with a parallel efficiency of at
+     least the requested value.
+  """
+  if ncpu is None:
+    ncpu = multiprocessing.cpu_count()
+  timing = measure(tconfig, atmfile, tepfile, PTtype, molfit, filters,
+                   kurucz, solution, tint, params, stepsize, nevals, kfile,
+                   bins)
+  nfree = np.sum(np.asarray(stepsize) > 0)
+
+  costs = []
+  for nranks in np.arange(1, nchains+1):
+    if nchains % nranks == 0 and nranks <= ncpu:
+      costs.append(extrapolate(timing, numit, nchains, nfree, int(nranks)))
+  suggested = costs[0]["ranks"]
+  for cost in costs:
+    if cost["efficiency"] >= efficiency:
+      suggested = cost["ranks"]
+  return {"timing":timing, "numit":numit, "nchains":nchains,
+          "costs":costs, "suggested":suggested, "opacity":opcost}
+
+
+def report(est, efile=None):
+  """
+  Print the cost estimate, and optionally save it as JSON.
+  """
+  timing = est["timing"]
+  mu.msg(1, "\nCost estimate:")
+  mu.msg(1, "{:d} layers, {:d} wavenumber samples, {:d} filters, numit = "
+            "{:d}, nchains = {:d}.".format(timing["nlayers"],
+            timing["nwave"], timing["nfilters"], est["numit"],
+            est["nchains"]), indent=2)
+  if est.get("opacity") is not None:
+    mu.msg(1, "Opacity table:    {:9.1f} s  (extrapolated from 2 of {:d} "
+              "temperatures)".format(est["opacity"]["full"],
+                                     est["opacity"]["ntemp"]), indent=2)
+  mu.msg(1, "Kurucz parsing:   {:9.3f} s".format(timing["kurucz"]), indent=2)
+  mu.msg(1, "Worker setup:     {:9.3f} s".format(timing["setup"]),  indent=2)
+  mu.msg(1, "Model evaluation: {:9.4f} +/- {:.4f} s".format(timing["eval"],
+                                          timing["eval_std"]), indent=2)
+  mu.msg(1, "Worker memory:    {:9.1f} MB".format(timing["maxrss"]/1024.0),
+         indent=2)
+  mu.msg(1, "\n  Ranks   Wall (h)  Core hours  Efficiency  Memory (GB)")
+  for cost in est["costs"]:
+    mark = " <-- suggested" if cost["ranks"] == est["suggested"] else ""
+    mu.msg(1, "{:7d} {:10.2f} {:11.2f} {:11.2f} {:12.2f}{:s}".
+              format(cost["ranks"], cost["wall"]/3600.0, cost["corehours"],
+                     cost["efficiency"], cost["memory"]/1024.0**2, mark))
+  if efile is not None:
+    f = open(efile, "w")
+    json.dump(est, f, indent=1)
+    f.close()
@@ -53,6 +53,7 @@
 # Thank you for testing BART!
 # ******************************* END LICENSE *******************************
 
+import os, hashlib
 import numpy as np
 import scipy.interpolate as si
 import scipy.constants   as sc
@@ -367,3 +368,168 @@ def read(filename, freq=False):
     nainten = np.fliplr(nainten)
   
   return inten, wave, grav, temp, nainten, head
+
+
+def cachefiles(filename, cachedir):
+  """
+  Names of the binary cache files of a Kurucz model file in cachedir:
+  the index (wavelengths, gravities, temperatures, and headers) and the
+  model grid.  The names carry a hash of the path, size, and
+  modification time of the model file, so a changed model file gets
+  new cache files.
+  """
+  stat = os.stat(filename)
+  sha = hashlib.sha1("{:s} {:d} {:.6f}".format(os.path.realpath(filename),
+                                               stat.st_size, stat.st_mtime))
+  root = os.path.join(cachedir, "kurucz_{:s}".format(sha.hexdigest()))
+  return root + ".index.npz", root + ".grid.npy"
+
+
+def convert(filename, cachedir):
+  """
+  Parse a Kurucz model file (see read) and store it in binary form in
+  cachedir: an index file and a [nmod, nwavl] grid file with the inten
+  models, that load() can memory map.
+
+  Parameters:
+  -----------
+  filename: String
+     Name of model file.
+  cachedir: String
+     Directory of the cache files.
+  """
+  if not os.path.isdir(cachedir):
+    try:
+      os.makedirs(cachedir)
+    except OSError:
+      if not os.path.isdir(cachedir):
+        raise
+  ifile, gfile = cachefiles(filename, cachedir)
+  inten, wave, grav, temp, nainten, head = read(filename)
+
+  # Write into temporary files and rename them, so that concurrent
+  # readers never see a partial cache (the index goes last):
+  suffix = ".{:d}.tmp".format(os.getpid())
+  np.save(gfile + suffix + ".npy", inten)
+  os.rename(gfile + suffix + ".npy", gfile)
+  np.savez(ifile + suffix + ".npz", wave=wave, grav=grav, temp=temp,
+           head=np.array(head))
+  os.rename(ifile + suffix + ".npz", ifile)
+
+
+def load(filename, cachedir):
+  """
+  Load the binary cache of a Kurucz model file from cachedir, building
+  it when it is missing (or the model file changed).  The model grid is
+  memory mapped, so only the models used are read from disk.
+
+  Parameters:
+  -----------
+  filename: String
+     Name of model file.
+  cachedir: String
+     Directory of the cache files.
+
+  Returns:
+  --------
+  inten: 2D ndarray
+     Memory-mapped array of shape (nmod, nwavl) with the inten models
+     (see read, with freq=False).
+  wave: 1D ndarray
+     Wavelengths (in meters) of the models.
+  grav: 1D ndarray
+     Log10 of the surface gravities (cm s-2) of the models.
+  temp: 1D ndarray
+     Temperatures (in K) of the models.
+  head: 1D string ndarray
+     The one-line header strings of the models.
+  """
+  ifile, gfile = cachefiles(filename, cachedir)
+  if not (os.path.isfile(ifile) and os.path.isfile(gfile)):
+    convert(filename, cachedir)
+  index = np.load(ifile)
+  inten = np.load(gfile, mmap_mode="r")
+  return inten, index["wave"], index["grav"], index["temp"], index["head"]
+
+
+def _around(x, x0, npts=4):
+  """
+  Indices of the (up to) npts nodes of the sorted array x around x0.
+  """
+  i  = np.searchsorted(x, x0)
+  hi = np.amin([len(x), np.amax([0, i - npts//2]) + npts])
+  lo = np.amax([0, hi - npts])
+  return np.arange(lo, hi)
+
+
+def _interp1(x, y, x0):
+  """
+  Cubic (or lower order if there are fewer than four nodes)
+  interpolation of y (of shape [len(x), nwavl]) at x0, evaluated for
+  all wavelengths at once.
+  """
+  exact = np.where(x == x0)[0]
+  if len(exact) > 0:
+    return y[exact[0]]
+  kind = {2:"linear", 3:"quadratic", 4:"cubic"}[len(x)]
+  return si.interp1d(x, y, kind=kind, axis=0)(x0)
+
+
+def gridinterp(inten, grav, temp, wgrav, wtemp, log=False):
+  """
+  Interpolate a Kurucz model grid in temperature and gravity, for all
+  wavelengths at once.  This is a tensor-product (log(g) then
+  temperature) local cubic interpolation over the 4x4 models around
+  (wtemp, wgrav).  Unlike interp, it handles the non-rectangular
+  coverage of the Kurucz grid: at each temperature it uses the
+  gravities modeled at that temperature, and it skips the temperatures
+  that do not cover wgrav.
+
+  Parameters:
+  -----------
+  inten: 2D ndarray
+     Array of shape (nmod, nwavl) of model brightnesses (see read), it
+     can be a memory-mapped array, only the models used are read.
+  grav: 1D ndarray
+     Log10 of the surface gravities (cm s-2) of the models.
+  temp: 1D ndarray
+     Temperatures (K) of the models.
+  wgrav: Float
+     Wanted log10(gravity) (cm s-2).
+  wtemp: Float
+     Wanted temperature (K).
+  log: Boolean
+     If True, interpolate in the log of the brightnesses.
+
+  Returns:
+  --------
+  iinten: 1D ndarray
+     Interpolated brightness of size nwavl.
+  """
+  # Temperatures whose gravities cover wgrav:
+  temps = np.unique(temp)
+  valid = np.array([np.amin(grav[temp==t]) <= wgrav and
+                    np.amax(grav[temp==t]) >= wgrav for t in temps])
+  temps = temps[valid]
+  if len(temps) == 0 or not temps[0] <= wtemp <= temps[-1]:
+    raise ValueError("Requested temperature ({:.1f} K) and log(g) ({:.2f}) "
+                     "are outside the coverage of the model grid.".
+                     format(wtemp, wgrav))
+
+  # Interpolate in gravity at each of the temperatures around wtemp:
+  itemps = temps[_around(temps, wtemp)]
+  tinten = []
+  for t in itemps:
+    imod  = np.where(temp == t)[0]
+    imod  = imod[np.argsort(grav[imod])]
+    imod  = imod[_around(grav[imod], wgrav)]
+    ginten = np.array([inten[i] for i in imod])
+    if log:
+      ginten = np.log(ginten)
+    tinten.append(_interp1(grav[imod], ginten, wgrav))
+
+  # Interpolate in temperature:
+  iinten = _interp1(itemps, np.array(tinten), wtemp)
+  if log:
+    iinten = np.exp(iinten)
+  return iinten
@@ -63,9 +63,17 @@ import scipy.constants as sc
 from scipy.interpolate import interp1d
 
 import PT        as pt
-import reader    as rd
+import atmbin    as ab
+import table     as tb
+import system    as sy
 import constants as c
 
+# Header of the final atmospheric files:
+FINALHEADER = (
+  "# This is a final TEA output file with calculated abundances (mixing "
+  "fractions) for all listed species.\n"
+  "# Units: pressure (bar), temperature (K), abundance (unitless).")
+
 """
     This code produces a pre-atm file in the format that TEA can read it.
     It, then, reads the final TEA output, adds radius array, and reformats
@@ -92,6 +100,14 @@ import constants as c
           Writes a pre-atmospheric file.
     reformat:
           Reformats final atmospheric file for Transit code.
+    finalize:
+          Adds the radius and reformats an Atmosphere in memory.
+
+    Classes
+    -------
+    Atmosphere:
+          Atmospheric model held in memory (radius, mean molecular
+          mass, transit reformatting, and writing).
 
     Notes
     -----
@@ -165,32 +181,11 @@ def read_eabun(solabun):
   2014-09-24  Jasmina   Updated documentation.
   2015-03-06  patricio  Reworked code from makeAbun function.
   """
-
   # Read the elemental-abundances file:
-  f = open(solabun, 'r')
-  lines = f.readlines()
-  f.close()
-
-  # Count the number of elements:
-  nelements = len(lines)
-  for line in lines:
-    if line.startswith("#"):
-      nelements -= 1
-
-  # Allocate arrays to put information:
-  index  = np.zeros(nelements, int)
-  symbol = np.zeros(nelements, '|S2')
-  dex    = np.zeros(nelements, np.double)
-  name   = np.zeros(nelements, '|S20')
-  mass   = np.zeros(nelements, np.double)
-
-  # Store data into the arrays:
-  i = 0
-  for line in lines:
-    if not line.startswith("#"):
-      index[i], symbol[i], dex[i], name[i], mass[i] = line.strip().split()
-      i += 1
-  return index, symbol, dex, name, mass
+  data = tb.read(solabun, ["index", "symbol", "dex", "name", "mass"],
+                          [int, '|S2', np.double, '|S20', np.double])
+  return (data["index"], data["symbol"], data["dex"], data["name"],
+          data["mass"])
 
 
 # reads the tep file and calculates surface gravity
@@ -202,7 +197,7 @@ def get_g(tepfile):
 
   Parameters
   ----------
-  tepfile: String
+  tepfile: String or system.System
      Name of the tep ASCII file.
 
   Returns
@@ -217,18 +212,13 @@ def get_g(tepfile):
   2014-06-11  Jasmina   Written by.
   2014-08-15  Patricio  Updated docstring.  Got NASA Jupiter values.
   '''
-  # Open tepfile to read and get data:
-  tep = rd.File(tepfile)
+  # Get the planetary-system parameters:
+  system = sy.load(tepfile)
 
-  # Get planet mass in kg:
-  Mplanet = np.float(tep.getvalue('Mp')[0]) * c.Mjup
-  # Get planet radius in m:
-  Rplanet = np.float(tep.getvalue('Rp')[0]) * c.Rjup
-
-  # Calculate the planet surface gravity in m/s^2:
-  g = sc.G * Mplanet / (Rplanet**2)
+  # Planet surface gravity in m/s^2:
+  g = system.gplanet
   # Return Rp in km:
-  Rp = Rplanet / 1000.0
+  Rp = system.rplanet / 1000.0
 
   return g, Rp
 
@@ -249,7 +239,7 @@ def radpress(tepfile, temp, mu, press, p0):
 
   Parameters
   ----------
-  tepfile: String
+  tepfile: String or system.System
      Transiting extrasolar planet filename.
   temp: 1D array of floats
      Temperatures for each atmospheric layer (in K).
@@ -535,38 +525,8 @@ def mean_molar_mass(abun_file, atmfile):
     2015-03-05  Patricio  Simplified a few calculations.
     """
 
-    # Read the elemental abundances file:
-    index, element, dex, name, weights = read_eabun(abun_file)
-
     # Read the atmospheric file:
-    out_spec, pressure, temp, abundances = readatm(atmfile)
-
-    # Number of molecules:
-    nspec   = len(out_spec)
-    # Number of layers in the atmosphere:
-    nLayers = len(abundances)
-
-    spec_weight = np.zeros(nspec)
-    # Get the mass of each species:
-    for i in np.arange(nspec):
-      # Remove the JANAF extension from species name and get the
-      #  stoichiometric data:
-      spec_stoich = stoich(out_spec[i].partition('_')[0])
-      # Add the mass from each element in this species:
-      for j in np.arange(len(spec_stoich)):
-        # Find the element:
-        elem_idx = np.where(element == spec_stoich[j,0])
-        # Add the weighted mass:
-        spec_weight[i] += weights[elem_idx][0] * float(spec_stoich[j,1])
-
-    # Allocate array (for each layer) of mean molar mass:
-    mu = np.zeros(nLayers)
-
-    # Sum of all species weight in the layer:
-    for i in np.arange(nLayers):
-        mu[i] = sum(spec_weight * abundances[i])
-
-    return mu
+    return Atmosphere.read(atmfile).mean_molar_mass(abun_file)
 
 
 def makeRadius(out_spec, atmfile, abun_file, tepfile, p0):
@@ -582,13 +542,14 @@ def makeRadius(out_spec, atmfile, abun_file, tepfile, p0):
   Parameters
   ----------
   out_spec: String
-      String containing all output molecular species.
+      String containing all output molecular species (unused, the
+      species are taken from atmfile).
   atmfile: String
       Name of TEA atmospheric ASCII file.
   abun_file: String
       Name of the abundances file.
       (default: 'abundances.txt', Asplund et al 2009)
-  tepfile: String
+  tepfile: String or system.System
       Name of the tepfile.
   p0: Float
       Reference pressure level (corresponding to Rplanet from the tepfile).
@@ -599,72 +560,10 @@ def makeRadius(out_spec, atmfile, abun_file, tepfile, p0):
   2015-05-03 Jasmina   Corrected atm header.
   """
 
-  # Make a copy of the original TEA atmfile
-  #shutil.copy2(atmfile, atmfile[:-4] + '_genuine.tea')
-
-  # Read the final atmospheric file
-  molecules, pressure, temperature, abundances = readatm(atmfile)
-
-  # Calculate the mean molecular mass of each layer:
-  mu = mean_molar_mass(abun_file, atmfile)
-
-  # Open atmfile to overwrite:
-  fout = open(atmfile, 'w')
-
-  # Write a header file
-  header = (
-  "# This is a final TEA output file with calculated abundances (mixing fractions) for all listed species.\n"
-  "# Units: pressure (bar), temperature (K), abundance (unitless).")
-  fout.write(header + '\n\n')
-  
-  # Retrieve planet name and surface radius
-  g, Rp = get_g(tepfile)
-
-  # Write species names
-  fout.write('#SPECIES\n' + out_spec + '\n\n')
-
-  # Write TEA data
-  fout.write('#TEADATA\n')
-
-  # Calculate the radius of each layer:
-  rad = radpress(tepfile, temperature, mu, pressure, p0)
-
-  # Number of layers in the atmosphere
-  nLayers = len(abundances)
-
-  # Number of molecules
-  nspec = len(molecules)
-
-  # Make a list of labels
-  label = ['#Radius'.ljust(11)] + ['Pressure'.ljust(11)] + ['Temp'.ljust(8)]
-  for i in np.arange(nspec):
-       label = label + [molecules[i].ljust(11)]
-  label = ''.join(label)
-
-  # Write new label
-  fout.write(label + '\n')
-
-  # Write atm file for each run
-  for i in np.arange(nLayers): 
-      # Radius, pressure, and temp for the current line
-      radi = str('%10.3f'%rad[i])
-      presi = str('%10.4e'%pressure[i])
-      tempi = str('%7.2f'%temperature[i])
-
-      # Insert radii array
-      fout.write(radi.ljust(10) + ' ')
-
-      # Insert results from the current line (T-P) to atm file
-      fout.write(presi.ljust(10) + ' ')
-      fout.write(tempi.ljust(7) + ' ')
-
-      # Write current abundances
-      for j in np.arange(nspec):
-          fout.write('%1.4e'%abundances[i][j] + ' ')
-      fout.write('\n')
-
-  # Close atm file
-  fout.close()
+  # Read the final atmospheric file, add the radius, and write it back:
+  atm = Atmosphere.read(atmfile)
+  atm.add_radius(abun_file, tepfile, p0)
+  atm.write(atmfile)
 
 
 def make_preatm(tepfile, press_file, abun_file, in_elem, out_spec,
@@ -679,7 +578,7 @@ def make_preatm(tepfile, press_file, abun_file, in_elem, out_spec,
 
   Parameters
   ----------
-  tepfile: String
+  tepfile: String or system.System
      Name of the tepfile.
   press_file: String
      Name of the pressure file.
@@ -746,12 +645,11 @@ def make_preatm(tepfile, press_file, abun_file, in_elem, out_spec,
   f.write("#Pressure   Temp          " +
         "".join(["{:<18s}".format(elem) for elem in in_symbol]) + "\n")
 
-  # Write data for each layer:
-  for i in np.arange(n_layers):
-    # Pressure, and Temperature:
-    f.write("{:10.4e} {:8.2f}  ".format(pres[i], Temp[i]))
-    # Elemental abundance list:
-    f.write("  ".join(["{:16.10e}".format(abun) for abun in out_abn]) + "\n")
+  # Write data for each layer (pressure, temperature, and elemental
+  # abundance list):
+  data = np.column_stack((pres, Temp, np.tile(out_abn, (n_layers, 1))))
+  tb.writerows(f, data, "%10.4e %8.2f  " +
+                        "  ".join(["%16.10e"]*len(out_abn)) + "\n")
   f.close()
 
 
@@ -767,7 +665,7 @@ def uniform(atmfile, press_file, abun_file, tepfile, species, abundances, temp,
      Input pressure-array filename.
   abun_file: String
      Input elemental-abundances filename.
-  tepfile: String
+  tepfile: String or system.System
      Transiting extrasolar planet filename.
   species: String
      String with list of atmospheric species (blank space separated).
@@ -790,30 +688,17 @@ def uniform(atmfile, press_file, abun_file, tepfile, species, abundances, temp,
   # Put abundance values into an array:
   abun = np.asarray(abundances, np.double)
 
-  # Write to file:
-  f = open(atmfile, 'w')
-
-  # Write species names:
-  f.write('#SPECIES\n' + species + '\n\n')
-
-  # Write header of TEA data:
-  f.write('#TEADATA\n')
-  # Column's header:
-  f.write("#Pressure   Temp     " +
-        "".join(["{:<18s}".format(mol) for mol in spec]) + "\n")
-
-  # For each layer write TEA data
-  for i in np.arange(len(press)):
-      # Pressure, and Temperature
-      f.write("{:10.4e} {:8.2f}  ".format(press[i], temp[i]))
-      # Elemental abundance list
-      f.write("  ".join(["{:16.10e}".format(ab) for ab in abun]) + "\n")
-  f.close()
+  # Keep the precision of the TEA-format values (%10.4e pressures, %8.2f
+  # temperatures, and %16.10e abundances), as if read from a file:
+  press = np.char.mod("%.4e", press).astype(np.double)
+  temp  = np.char.mod("%.2f", temp).astype(np.double)
+  abun = np.char.mod("%.10e", abun).astype(np.double)
 
-  # Calculate the radius of each layer and put it into the atmfile:
-  makeRadius(species, atmfile, abun_file, tepfile, p0)
-  # Reformat to use in transit:
-  reformat(atmfile)
+  # Calculate the radius of each layer, reformat for transit, and write
+  # the atmospheric file:
+  atm = Atmosphere(spec, press, temp, np.tile(abun, (len(press), 1)))
+  finalize(atm, abun_file, tepfile, p0)
+  atm.write(atmfile)
 
 
 # reads final TEA atmospheric file
@@ -824,7 +709,8 @@ def readatm(atmfile):
     Parameters
     ----------
     atmfile: String
-               Name of TEA atmospheric ASCII file.
+               Name of TEA atmospheric ASCII file (or atmospheric
+               binary file, see atmbin).
 
     Returns
     -------
@@ -852,51 +738,9 @@ def readatm(atmfile):
                           radius array in it.
     """
 
-    # Open the atmospheric file and read
-    f = open(atmfile, 'r')
-    lines = np.asarray(f.readlines())
-    f.close()
-
-    # Get the molecules
-    imol = np.where(lines == "#SPECIES\n")[0][0] + 1
-    molecules = lines[imol].split()
-
-    # Find the line where the layers info begins
-    start = np.where(lines == "#TEADATA\n")[0][0] + 2 
-
-    # Number of columns
-    ncol = len(lines[start].split())
-
-    # Number of layers
-    ndata = len(lines) - start  
-
-    # Read atmfile without radius array in it or with it
-    pressure = np.zeros(ndata, np.double)
-    temp     = np.zeros(ndata, np.double) 
-    if ncol == len(molecules) + 2:
-        # Number of abundances (elements per line except Press and T) 
-        nabun = len(lines[start].split()) - 2  
-        abundances = np.zeros((ndata, nabun), np.double)
-
-        # Extract pressure, temperature, and abundance data
-        for i in np.arange(ndata):
-            line = lines[start+i].strip().split()  
-            pressure[i]   = line[0]
-            temp[i]       = line[1]   
-            abundances[i] = line[2:] 
-    else:
-        # Number of abundances (elements per line except Radius, Press and T) 
-        nabun = len(lines[start].split()) - 3  
-        abundances = np.zeros((ndata, nabun), np.double)
-
-        # Extract pressure, temperature, and abundance data
-        for i in np.arange(ndata):
-            line = lines[start+i].strip().split()  
-            pressure[i]   = line[1]
-            temp[i]       = line[2]   
-            abundances[i] = line[3:] 
-
-    return molecules, pressure, temp, abundances   
+    # Read the text or binary file (see atmbin):
+    molecules, pressure, temp, abundances, radius, info = ab.load(atmfile)
+    return molecules, pressure, temp, abundances
 
 
 # reformats final TEA atmospheric file for Transit
@@ -953,3 +797,174 @@ def reformat(atmfile):
     f = open(atmfile, 'w')
     f.writelines(lines)
     f.close()
+
+
+class Atmosphere(object):
+  """
+  Atmospheric model held in memory, so that the radius, mean molecular
+  mass, and transit reformatting are computed without re-reading (and
+  re-writing) the atmospheric file.  The model is written once, with
+  write(), in the same text format as makeRadius() and reformat().
+
+  Attributes:
+  -----------
+  species: List of strings
+     Species names.
+  pressure: 1D float ndarray
+     Pressure of each layer (bar).
+  temp: 1D float ndarray
+     Temperature of each layer (K).
+  abundances: 2D float ndarray
+     Abundances (mixing fractions) of shape [nlayers, nspecies].
+  radius: 1D float ndarray
+     Radius of each layer (km), None if not computed.
+  header: String
+     Header text (comments) of the file.
+  layout: String
+     'tea' (as written by TEA) or 'transit' (as returned by reformat).
+  units: List of [key, value] pairs
+     Values' units written in the transit layout (see atmbin.UNITS).
+  """
+  def __init__(self, species, pressure, temp, abundances, radius=None,
+               header=FINALHEADER, layout="tea", units=None):
+    self.species    = list(species)
+    self.pressure   = np.array(pressure,   np.double)
+    self.temp       = np.array(temp,       np.double)
+    self.abundances = np.array(abundances, np.double)
+    self.radius     = None
+    if radius is not None:
+      self.radius = np.array(radius, np.double)
+    self.header = header
+    self.layout = layout
+    self.units  = units
+    if units is None:
+      self.units = ab.UNITS
+
+
+  @classmethod
+  def read(cls, atmfile):
+    """
+    Read an atmospheric (text or binary) file.
+    """
+    species, pressure, temp, abundances, radius, info = ab.load(atmfile)
+    return cls(species, pressure, temp, abundances, radius, info["header"],
+               info["layout"], info["units"])
+
+
+  def mean_molar_mass(self, abun_file):
+    """
+    Mean molecular mass (g/mol) of each layer (see mean_molar_mass()).
+    """
+    # Read the elemental abundances file:
+    index, element, dex, name, weights = read_eabun(abun_file)
+
+    nspec = len(self.species)
+    spec_weight = np.zeros(nspec)
+    # Get the mass of each species:
+    for i in np.arange(nspec):
+      spec_stoich = stoich(self.species[i].partition('_')[0])
+      for j in np.arange(len(spec_stoich)):
+        elem_idx = np.where(element == spec_stoich[j,0])
+        spec_weight[i] += weights[elem_idx][0] * float(spec_stoich[j,1])
+
+    # Sum the species weights of all layers at once (in the species
+    # order, as a per-layer sum would):
+    mu = np.zeros(len(self.pressure))
+    for i in np.arange(nspec):
+      mu += spec_weight[i] * self.abundances[:,i]
+    return mu
+
+
+  def add_radius(self, abun_file, tepfile, p0):
+    """
+    Calculate the radius of each layer (see makeRadius()).
+
+    Parameters:
+    -----------
+    abun_file: String
+       Name of the elemental abundances file.
+    tepfile: String or system.System
+       Name of the tepfile.
+    p0: Float
+       Reference pressure level (corresponding to Rplanet from the tepfile).
+    """
+    mu = self.mean_molar_mass(abun_file)
+    self.radius = radpress(tepfile, self.temp, mu, self.pressure, p0)
+    self.header = FINALHEADER
+
+
+  def reformat(self):
+    """
+    Re-format the model for transit (see reformat()): remove the
+    species' suffixes and reverse the layers' order (from bottom to top).
+    """
+    self.species = [spec.partition('_')[0] for spec in self.species]
+    self.pressure   = self.pressure[::-1]
+    self.temp       = self.temp[::-1]
+    self.abundances = self.abundances[::-1]
+    if self.radius is not None:
+      self.radius = self.radius[::-1]
+    self.layout = "transit"
+
+
+  def write(self, atmfile):
+    """
+    Write the model into an atmospheric text file.
+    """
+    # Column labels:
+    labels = ["Pressure", "Temp"] + self.species
+    if self.radius is not None:
+      labels = ["Radius"] + labels
+    labels[0] = "#" + labels[0]
+
+    fout = open(atmfile, 'w')
+    if self.layout == "transit":
+      fout.write(self.header + "\n\n#Values units:\n")
+      for key, val in self.units:
+        fout.write("{:s} {:s}\n".format(key, val))
+      fout.write("\n#SPECIES\n" + " ".join(self.species) + "\n\n#TEADATA\n")
+      fout.write(" ".join(["{:10s}".format(label) for label in labels[:-1]]
+                          + [labels[-1]]) + "\n")
+    else:
+      fout.write(self.header + "\n\n#SPECIES\n" + " ".join(self.species) +
+                 "\n\n#TEADATA\n")
+      widths = [11, 8] + [11]*len(self.species)
+      if self.radius is not None:
+        widths = [11] + widths
+      fout.write("".join([label.ljust(width)
+                          for label, width in zip(labels, widths)]) + "\n")
+
+    # Radius, pressure, temperature, and abundances of each layer:
+    fmt  = "%10.4e %7.2f " + "%1.4e "*len(self.species) + "\n"
+    data = [self.pressure, self.temp, self.abundances]
+    if self.radius is not None:
+      fmt  = "%10.3f " + fmt
+      data = [self.radius] + data
+    tb.writerows(fout, np.column_stack(data), fmt)
+    fout.close()
+
+
+def finalize(atm, abun_file, tepfile, p0):
+  """
+  Add the radius to a TEA atmospheric model and reformat it for
+  transit, in memory (makeRadius() followed by reformat()).
+
+  Parameters:
+  -----------
+  atm: Atmosphere
+     The atmospheric model (modified in place).
+  abun_file: String
+     Name of the elemental abundances file.
+  tepfile: String or system.System
+     Name of the tepfile.
+  p0: Float
+     Reference pressure level (corresponding to Rplanet from the tepfile).
+
+  Returns:
+  --------
+  atm: Atmosphere
+     The same atmospheric model.
+  """
+  atm.add_radius(abun_file, tepfile, p0)
+  atm.reformat()
+  return atm
@@ -58,7 +58,7 @@ import argparse, ConfigParser
 import numpy as np
 import scipy.constants as sc
 
-import reader as rd
+import system as sy
 import constants as c
 
 filedir = os.path.dirname(os.path.realpath(__file__))
@@ -66,7 +66,29 @@ sys.path.append(filedir + "/../modules/MCcubed/src/")
 import mcutils as mu
 
 
-def makeTransit(cfile, tepfile):
+def read(cfile, section="MCMC"):
+  """
+  Read the arguments of a section of a BART configuration file.
+
+  Parameters:
+  -----------
+  cfile: String
+     BART configuration file.
+  section: String
+     Configuration-file section.
+
+  Returns:
+  --------
+  args: Dictionary
+     The section arguments (strings), with case-sensitive keys.
+  """
+  config = ConfigParser.SafeConfigParser()
+  config.optionxform = str  # This one enable Uppercase in arguments
+  config.read([cfile])
+  return dict(config.items(section))
+
+
+def makeTransit(cfile, tepfile, updates=None):
   """
   Make the transit configuration file.
 
@@ -74,8 +96,11 @@ def makeTransit(cfile, tepfile):
   -----------
   cfile: String
      BART configuration file.
-  tepfile: String
+  tepfile: String or system.System
      A TEP file.
+  updates: Dictionary
+     Arguments to set (or replace) before writing the file (e.g., the
+     tconfig file name or the opacity-grid temperatures).
   """
 
   # Known transit arguments:
@@ -101,6 +126,10 @@ def makeTransit(cfile, tepfile):
   # Read BART configuration file:
   Bconfig = ConfigParser.SafeConfigParser()
   Bconfig.read([cfile])
+  # Replaced arguments:
+  if updates is not None:
+    for key in updates:
+      Bconfig.set(section, key, updates[key])
 
   # Keyword names of the arguments in the BART configuration file:
   args = Bconfig.options(section)
@@ -117,14 +146,12 @@ def makeTransit(cfile, tepfile):
       os.path.realpath(filedir + "/../modules/transit/inputs/molecules.dat")))
 
   # Calculate gsurf and refradius from the tepfile:
-  tep = rd.File(tepfile)
-  mplanet = float(tep.getvalue('Mp')[0]) * c.Mjup
-  rplanet = float(tep.getvalue('Rp')[0]) * c.Rjup
+  system = sy.load(tepfile)
 
   # Planetary radius reference level in km:
-  Bconfig.set(section, "refradius", "{:.2f}".format(rplanet * 1e-3))
+  Bconfig.set(section, "refradius", "{:.2f}".format(system.rplanet * 1e-3))
   # Planetary surface gravity in cm/s2:
-  Bconfig.set(section, "gsurf", "{:.1f}".format(100*sc.G*mplanet/rplanet**2))
+  Bconfig.set(section, "gsurf", "{:.1f}".format(100*system.gplanet))
   # Add these keywords:
   args = np.union1d(args, ["refradius", "gsurf"])
 
@@ -137,7 +164,7 @@ def makeTransit(cfile, tepfile):
   tcfile.close()
 
 
-def makeMCMC(cfile, MCMC_cfile):
+def makeMCMC(cfile, MCMC_cfile, updates=None):
   """
   Reformat configuration file to remove relative paths.  This output 
   configuration file is used by the BART's MCMC program.
@@ -148,6 +175,8 @@ def makeMCMC(cfile, MCMC_cfile):
      BART configuration file.
   MCMC_cfile: String
      Reformated configuration file.
+  updates: Dictionary
+     Arguments to set (or replace) in the output configuration file.
   """
 
   # Name of the configuration-file section:
@@ -156,6 +185,10 @@ def makeMCMC(cfile, MCMC_cfile):
   Bconfig = ConfigParser.SafeConfigParser()
   Bconfig.optionxform = str
   Bconfig.read([cfile])
+  # Replaced arguments:
+  if updates is not None:
+    for key in updates:
+      Bconfig.set(section, key, updates[key])
   # Keyword names of the arguments in the BART configuration file:
   args = Bconfig.options(section)
 
@@ -195,9 +228,9 @@ def makeMCMC(cfile, MCMC_cfile):
     Bconfig.write(configfile)
 
 
-def makeTEA(cfile, TEAdir):
+def TEAconfig(cfile, TEAdir):
   """
-  Make a TEA configuration file.
+  Get the TEA configuration from a BART configuration file.
 
   Parameters:
   -----------
@@ -205,6 +238,11 @@ def makeTEA(cfile, TEAdir):
      BART configuration file
   TEAdir: String
      Default TEA directory.
+
+  Returns:
+  --------
+  config: SafeConfigParser
+     The TEA configuration.
   """
   # Open New ConfigParser:
   config = ConfigParser.SafeConfigParser()
@@ -233,6 +271,10 @@ def makeTEA(cfile, TEAdir):
     config.set("TEA", "abun_file", Bconfig.get("MCMC", "abun_basic"))
   if Bconfig.has_option("MCMC", "loc_dir"):
     config.set("TEA", "location_out", Bconfig.get("MCMC", "loc_dir"))
+  # Paths must not depend on the directory where TEA runs:
+  for key in ["abun_file", "location_out"]:
+    if config.get("TEA", key) != "None":
+      config.set("TEA", key, os.path.realpath(config.get("TEA", key)))
   # Default TEA dir:
   if config.get("TEA", "location_TEA") == "":
     config.set("TEA", "location_TEA", TEAdir)
@@ -243,7 +285,28 @@ def makeTEA(cfile, TEAdir):
   config.set("PRE-ATM", "pre_atm_name",   "None")
   config.set("PRE-ATM", "input_elem",     "None")
   config.set("PRE-ATM", "output_species", "None")
+  return config
+
+
+def makeTEA(cfile, TEAdir, outdir="./"):
+  """
+  Make a TEA configuration file.
+
+  Parameters:
+  -----------
+  cfile: String
+     BART configuration file
+  TEAdir: String
+     Default TEA directory.
+  outdir: String
+     Directory where to write the TEA configuration file and the TEA
+     outputs (TEA must run from this directory).
+  """
+  config = TEAconfig(cfile, TEAdir)
+  # TEA writes its outputs into outdir:
+  if outdir != "./":
+    config.set("TEA", "location_out", os.path.realpath(outdir))
 
   # Write TEA configuration file:
-  with open("TEA.cfg", 'w') as configfile:
+  with open(os.path.join(outdir, "TEA.cfg"), 'w') as configfile:
     config.write(configfile)
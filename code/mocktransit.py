@@ -0,0 +1,234 @@
+# ****************************** START LICENSE *******************************
+# Bayesian Atmospheric Radiative Transfer (BART), a code to infer
+# properties of planetary atmospheres based on observed spectroscopic
+# information.
+# 
+# This project was completed with the support of the NASA Planetary
+# Atmospheres Program, grant NNX12AI69G, held by Principal Investigator
+# Joseph Harrington. Principal developers included graduate students
+# Patricio E. Cubillos and Jasmina Blecic, programmer Madison Stemm, and
+# undergraduates M. Oliver Bowman and Andrew S. D. Foster.  The included
+# 'transit' radiative transfer code is based on an earlier program of
+# the same name written by Patricio Rojo (Univ. de Chile, Santiago) when
+# he was a graduate student at Cornell University under Joseph
+# Harrington.  Statistical advice came from Thomas J. Loredo and Nate
+# B. Lust.
+# 
+# Copyright (C) 2015 University of Central Florida.  All rights reserved.
+# 
+# This is a test version only, and may not be redistributed to any third
+# party.  Please refer such requests to us.  This program is distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+# 
+# Our intent is to release this software under an open-source,
+# reproducible-research license, once the code is mature and the first
+# research paper describing the code has been accepted for publication
+# in a peer-reviewed journal.  We are committed to development in the
+# open, and have posted this code on github.com so that others can test
+# it and give us feedback.  However, until its first publication and
+# first stable release, we do not permit others to redistribute the code
+# in either original or modified form, nor to publish work based in
+# whole or in part on the output of this code.  By downloading, running,
+# or modifying this code, you agree to these conditions.  We do
+# encourage sharing any modifications with us and discussing them
+# openly.
+# 
+# We welcome your feedback, but do not guarantee support.  Please send
+# feedback or inquiries to:
+# 
+# Joseph Harrington <jh@physics.ucf.edu>
+# Patricio Cubillos <pcubillos@fulbrightmail.org>
+# Jasmina Blecic <jasmina@physics.ucf.edu>
+# 
+# or alternatively,
+# 
+# Joseph Harrington, Patricio Cubillos, and Jasmina Blecic
+# UCF PSB 441
+# 4111 Libra Drive
+# Orlando, FL 32816-2385
+# USA
+# 
+# Thank you for testing BART!
+# ******************************* END LICENSE *******************************
+
+"""
+Pure-NumPy stand-in for the compiled transit_module.
+
+It implements the transit_module interface used by BARTfunc and
+posterior (transit_init, get_no_samples, get_waveno_arr, run_transit,
+and free_memory), so that the BART forward model can be run and
+benchmarked without the compiled transit code nor an MPI parent.  To
+use it, register it before importing the BART modules:
+
+  >>> import sys, mocktransit
+  >>> sys.modules["transit_module"] = mocktransit
+
+The spectrum is the emergent flux of a stack of layers with a
+synthetic (fixed pseudo-random) opacity per species.  It is not
+physically meaningful, but its cost scales with the number of layers,
+species, and wavenumber samples as transit's does.
+
+Functions:
+----------
+configure:
+   Set the wavenumber count and the cost of each run_transit call.
+transit_init:
+   Read the transit configuration file (wavenumber range and atmosphere).
+get_no_samples:
+   Number of wavenumber samples.
+get_waveno_arr:
+   Wavenumber array (cm-1).
+run_transit:
+   Compute the spectrum for a set of temperature and abundance profiles.
+free_memory:
+   Release the arrays.
+"""
+
+import time
+import numpy as np
+import scipy.constants as sc
+
+import makeatm as mat
+
+# Tunable settings (see configure):
+_settings = {"nwave":None, "cost":0.0, "seed":0}
+# Arrays of the current initialization:
+_state = {}
+
+
+def configure(nwave=None, cost=0.0, seed=0):
+  """
+  Set the tunable settings of the mock transit.
+
+  Parameters:
+  -----------
+  nwave: Integer
+     Number of wavenumber samples.  If None, take it from the wavenumber
+     range and wndelt of the transit configuration file.
+  cost: Float
+     Minimum time (in seconds) of each run_transit call, to emulate
+     the line-by-line calculation of transit.
+  seed: Integer
+     Random seed of the synthetic opacities.
+  """
+  _settings["nwave"] = nwave
+  _settings["cost"]  = cost
+  _settings["seed"]  = seed
+
+
+def readconfig(tconfig):
+  """
+  Read a transit configuration file ('key value' lines) into a dict.
+  """
+  config = {}
+  for line in open(tconfig, "r"):
+    fields = line.split()
+    if len(fields) >= 2 and not fields[0].startswith("#"):
+      config[fields[0]] = fields[1]
+  return config
+
+
+def transit_init(argc, argv):
+  """
+  Initialize the mock transit from the command-line arguments (as the
+  transit_module: ['transit', '-c', tconfig]).
+  """
+  tconfig = argv[argv.index("-c") + 1]
+  config = readconfig(tconfig)
+
+  # Wavenumber range (cm-1):
+  wnfct = float(config.get("wnfct", 1.0))
+  wlfct = float(config.get("wlfct", 1e-4))
+  if "wnlow" in config:
+    wnlow = float(config["wnlow"]) * wnfct
+  else:
+    wnlow = 1.0 / (float(config["wlhigh"]) * wlfct)
+  if "wnhigh" in config:
+    wnhigh = float(config["wnhigh"]) * wnfct
+  else:
+    wnhigh = 1.0 / (float(config["wllow"]) * wlfct)
+
+  nwave = _settings["nwave"]
+  if nwave is None:
+    wndelt = float(config.get("wndelt", 1.0)) * wnfct
+    nwave  = int((wnhigh - wnlow) / wndelt) + 1
+  _state["specwn"] = np.linspace(wnlow, wnhigh, nwave)
+
+  # Synthetic opacity (cm2 per molecule) for each species:
+  species, pressure, temp, abundances = mat.readatm(config["atm"])
+  nlayers, nspecies = np.shape(abundances)
+  random = np.random.RandomState(_settings["seed"])
+  _state["opacity"] = 10.0**random.uniform(-24, -20, (nspecies, nwave))
+  # Layers sorted from the top of the atmosphere (lowest pressure):
+  top = np.argsort(pressure)
+  # Column density (molecules cm-2) of each layer, for a fixed
+  # (synthetic) 1e5 cm scale height:
+  dlogp = np.ediff1d(np.log(pressure[top]), to_begin=0.0)
+  _state["column"] = (pressure[top]*1e6 * dlogp /
+                      (sc.k*1e7 * temp[top]) * 1e5)
+  _state["top"] = top
+  _state["nlayers"]  = nlayers
+  _state["nspecies"] = nspecies
+
+
+def get_no_samples():
+  """
+  Number of wavenumber samples.
+  """
+  return len(_state["specwn"])
+
+
+def get_waveno_arr(nwave):
+  """
+  Wavenumber array (cm-1).
+  """
+  return np.copy(_state["specwn"][:nwave])
+
+
+def run_transit(profiles, nwave):
+  """
+  Compute the emergent spectrum for a set of profiles.
+
+  Parameters:
+  -----------
+  profiles: 1D float ndarray
+     Flattened [nspecies+1, nlayers] array with the temperature profile
+     followed by the abundance profiles.
+  nwave: Integer
+     Number of wavenumber samples.
+
+  Returns:
+  --------
+  spectrum: 1D float ndarray
+     Emergent flux (erg s-1 cm-2 cm).
+  """
+  start = time.time()
+  profiles = np.reshape(profiles, (_state["nspecies"]+1, _state["nlayers"]))
+  profiles = profiles[:,_state["top"]]
+  temp = profiles[0]
+  specwn = _state["specwn"][:nwave]
+
+  # Optical depth of each layer, and transmission above each layer:
+  dtau = np.dot(profiles[1:].T * _state["column"][:,None],
+                _state["opacity"][:,:nwave])
+  tau  = np.cumsum(dtau, axis=0) - dtau
+  # Planck function of each layer (erg s-1 cm-2 sr-1 cm):
+  c1 = 2.0 * (sc.h*1e7) * (sc.c*1e2)**2.0
+  c2 = (sc.h*1e7) * (sc.c*1e2) / (sc.k*1e7)
+  bb = c1 * specwn**3.0 / np.expm1(c2 * specwn / temp[:,None])
+  spectrum = np.pi * np.sum(bb * np.exp(-tau) * -np.expm1(-dtau), axis=0)
+
+  # Emulate the remaining cost of a transit call:
+  wait = _settings["cost"] - (time.time() - start)
+  if wait > 0:
+    time.sleep(wait)
+  return spectrum
+
+
+def free_memory():
+  """
+  Release the arrays of the mock transit.
+  """
+  _state.clear()
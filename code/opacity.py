@@ -0,0 +1,296 @@
+# ****************************** START LICENSE *******************************
+# Bayesian Atmospheric Radiative Transfer (BART), a code to infer
+# properties of planetary atmospheres based on observed spectroscopic
+# information.
+# 
+# This project was completed with the support of the NASA Planetary
+# Atmospheres Program, grant NNX12AI69G, held by Principal Investigator
+# Joseph Harrington. Principal developers included graduate students
+# Patricio E. Cubillos and Jasmina Blecic, programmer Madison Stemm, and
+# undergraduates M. Oliver Bowman and Andrew S. D. Foster.  The included
+# 'transit' radiative transfer code is based on an earlier program of
+# the same name written by Patricio Rojo (Univ. de Chile, Santiago) when
+# he was a graduate student at Cornell University under Joseph
+# Harrington.  Statistical advice came from Thomas J. Loredo and Nate
+# B. Lust.
+# 
+# Copyright (C) 2015 University of Central Florida.  All rights reserved.
+# 
+# This is a test version only, and may not be redistributed to any third
+# party.  Please refer such requests to us.  This program is distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+# 
+# Our intent is to release this software under an open-source,
+# reproducible-research license, once the code is mature and the first
+# research paper describing the code has been accepted for publication
+# in a peer-reviewed journal.  We are committed to development in the
+# open, and have posted this code on github.com so that others can test
+# it and give us feedback.  However, until its first publication and
+# first stable release, we do not permit others to redistribute the code
+# in either original or modified form, nor to publish work based in
+# whole or in part on the output of this code.  By downloading, running,
+# or modifying this code, you agree to these conditions.  We do
+# encourage sharing any modifications with us and discussing them
+# openly.
+# 
+# We welcome your feedback, but do not guarantee support.  Please send
+# feedback or inquiries to:
+# 
+# Joseph Harrington <jh@physics.ucf.edu>
+# Patricio Cubillos <pcubillos@fulbrightmail.org>
+# Jasmina Blecic <jasmina@physics.ucf.edu>
+# 
+# or alternatively,
+# 
+# Joseph Harrington, Patricio Cubillos, and Jasmina Blecic
+# UCF PSB 441
+# 4111 Libra Drive
+# Orlando, FL 32816-2385
+# USA
+# 
+# Thank you for testing BART!
+# ******************************* END LICENSE *******************************
+
+"""
+Generate the transit opacity table in parallel, by splitting its
+temperature grid into chunks that run as independent transit calls,
+and merging the chunk tables.
+
+The opacity file written by transit contains (native byte order):
+  Nmol, Ntemp, Nlayer, Nwave        (C long)
+  molecule IDs  [Nmol]              (C int)
+  temperatures  [Ntemp]             (double)
+  pressures     [Nlayer]            (double)
+  wavenumbers   [Nwave]             (double)
+  opacities     [Nlayer, Ntemp, Nmol, Nwave]  (double)
+
+Functions
+---------
+tempgrid:
+     Temperature grid of an opacity table.
+splitgrid:
+     Split a temperature grid into contiguous chunks.
+read:
+     Read an opacity file.
+merge:
+     Merge opacity files with consecutive temperature grids.
+compare:
+     Compare two opacity files.
+generate:
+     Generate an opacity table with parallel transit calls.
+"""
+
+import os, sys, time, shutil, subprocess
+import numpy as np
+
+import makecfg  as mc
+import pipeline as pl
+
+filedir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(filedir + "/../modules/MCcubed/src/")
+import mcutils as mu
+
+
+def tempgrid(tlow, thigh, tempdelt):
+  """
+  Temperature grid (in K) of an opacity table.
+  """
+  ntemp = int(np.round((thigh - tlow) / tempdelt)) + 1
+  return tlow + tempdelt * np.arange(ntemp)
+
+
+def splitgrid(temp, nchunks):
+  """
+  Split a temperature grid into (at most nchunks) contiguous chunks of
+  at least two temperatures each.
+
+  Returns:
+  --------
+  ranges: List of tuples
+     The (tlow, thigh) of each chunk.
+  """
+  nchunks = int(np.clip(nchunks, 1, len(temp)//2))
+  return [(chunk[0], chunk[-1])
+          for chunk in np.array_split(temp, nchunks)]
+
+
+def read(opfile):
+  """
+  Read an opacity file.
+
+  Parameters:
+  -----------
+  opfile: String
+     Opacity file written by transit.
+
+  Returns:
+  --------
+  molID: 1D integer ndarray
+     Molecule IDs.
+  temp: 1D float ndarray
+     Temperature grid (K).
+  press: 1D float ndarray
+     Layers pressure.
+  wn: 1D float ndarray
+     Wavenumber sampling (cm-1).
+  opacity: 4D float memmap
+     Opacities with shape [Nlayer, Ntemp, Nmol, Nwave] (read only).
+  """
+  f = open(opfile, "rb")
+  nmol, ntemp, nlayer, nwave = np.fromfile(f, np.int_, 4)
+  molID = np.fromfile(f, np.intc,   nmol)
+  temp  = np.fromfile(f, np.double, ntemp)
+  press = np.fromfile(f, np.double, nlayer)
+  wn    = np.fromfile(f, np.double, nwave)
+  offset = f.tell()
+  f.close()
+  opacity = np.memmap(opfile, np.double, "r", offset,
+                      (nlayer, ntemp, nmol, nwave))
+  return molID, temp, press, wn, opacity
+
+
+def merge(chunkfiles, opfile, tgrid=None):
+  """
+  Merge opacity files with consecutive temperature grids into a single
+  opacity file.
+
+  Parameters:
+  -----------
+  chunkfiles: List of strings
+     Opacity files, sorted by temperature.
+  opfile: String
+     Output opacity file.
+  tgrid: 1D float ndarray
+     Temperature grid of the full table (see tempgrid).  If given, the
+     chunks' temperatures must match it (to round-off, since each chunk
+     computes its grid from its own tlow), and the merged table gets it.
+  """
+  chunks = [read(chunkfile) for chunkfile in chunkfiles]
+  molID, temp0, press, wn, op0 = chunks[0]
+  # The chunks must differ only in their temperatures:
+  for i in np.arange(1, len(chunks)):
+    if (not np.array_equal(chunks[i][0], molID) or
+        not np.array_equal(chunks[i][2], press) or
+        not np.array_equal(chunks[i][3], wn)):
+      mu.error("Opacity chunk '{:s}' does not match the molecules, layers, "
+               "or wavenumbers of '{:s}'.".format(chunkfiles[i],
+                                                   chunkfiles[0]))
+  temp = np.concatenate([chunk[1] for chunk in chunks])
+  if np.any(np.ediff1d(temp) <= 0):
+    mu.error("Opacity chunks' temperatures are not increasing.")
+  if tgrid is not None:
+    if len(temp) != len(tgrid) or not np.allclose(temp, tgrid, rtol=1e-10,
+                                                  atol=0.0):
+      mu.error("Opacity chunks' temperatures do not match the temperature "
+               "grid of the table.")
+    temp = np.asarray(tgrid, np.double)
+
+  f = open(opfile, "wb")
+  np.array([len(molID), len(temp), len(press), len(wn)], np.int_).tofile(f)
+  molID.tofile(f)
+  temp.tofile(f)
+  press.tofile(f)
+  wn.tofile(f)
+  # Write layer by layer (concatenate the chunks along temperature):
+  for r in np.arange(len(press)):
+    np.concatenate([chunk[4][r] for chunk in chunks]).tofile(f)
+  f.close()
+
+
+def compare(opfile, reference, rtol=1e-10):
+  """
+  Compare two opacity files.
+
+  Returns:
+  --------
+  equal: Bool
+     True if the grids are identical and the opacities agree within rtol.
+  """
+  op1, op2 = read(opfile), read(reference)
+  for i in np.arange(4):
+    if not np.array_equal(op1[i], op2[i]):
+      return False
+  if op1[4].shape != op2[4].shape:
+    return False
+  for r in np.arange(op1[4].shape[0]):
+    if not np.allclose(op1[4][r], op2[4][r], rtol=rtol, atol=0.0):
+      return False
+  return True
+
+
+def generate(MCMC_cfile, tepfile, opfile, nchunks, Tcall, cwd,
+             verify=False):
+  """
+  Generate an opacity table by running transit concurrently over
+  chunks of the temperature grid, and merge them.
+
+  Parameters:
+  -----------
+  MCMC_cfile: String
+     MC3 configuration file (from makecfg.makeMCMC).
+  tepfile: String or system.System
+     A TEP file.
+  opfile: String
+     Output opacity file.
+  nchunks: Integer
+     Number of temperature chunks (and concurrent transit calls).
+  Tcall: String
+     Transit executable.
+  cwd: String
+     Directory where to run transit.
+  verify: Bool
+     If True, also run transit over the whole grid and check that the
+     merged table matches it.
+
+  Returns:
+  --------
+  code: Integer
+     Non-zero if any transit call failed.
+  """
+  args = mc.read(MCMC_cfile)
+  temp = tempgrid(float(args["tlow"]), float(args["thigh"]),
+                  float(args["tempdelt"]))
+  ranges = splitgrid(temp, nchunks)
+
+  # Directory for the chunk configuration and opacity files:
+  chunkdir = os.path.join(cwd, "opacity_chunks")
+  if not os.path.isdir(chunkdir):
+    os.mkdir(chunkdir)
+
+  # Transit configuration of each chunk (and of the serial reference):
+  tconfigs, chunkfiles = [], []
+  for i in np.arange(len(ranges)):
+    tconfigs.append(os.path.join(chunkdir, "chunk{:02d}.cfg".format(i)))
+    chunkfiles.append(os.path.join(chunkdir, "chunk{:02d}.dat".format(i)))
+    mc.makeTransit(MCMC_cfile, tepfile,
+                   {"tconfig":tconfigs[i], "opacityfile":chunkfiles[i],
+                    "tlow":repr(float(ranges[i][0])),
+                    "thigh":repr(float(ranges[i][1]))})
+  if verify:
+    reference = os.path.join(chunkdir, "serial.dat")
+    tconfigs.append(os.path.join(chunkdir, "serial.cfg"))
+    mc.makeTransit(MCMC_cfile, tepfile,
+                   {"tconfig":tconfigs[-1], "opacityfile":reference})
+
+  # Run transit for all chunks at once:
+  mu.msg(1, "Transit calls to generate the Opacity grid table in {:d} "
+            "temperature chunks.".format(len(ranges)))
+  procs = [subprocess.Popen([Tcall, "-c", tconfig, "--justOpacity"], cwd=cwd)
+           for tconfig in tconfigs]
+  codes = [pl.wait(proc, [Tcall, "-c", tconfig, "--justOpacity"])
+           for proc, tconfig in zip(procs, tconfigs)]
+  if np.any(codes):
+    mu.msg(1, "Transit exit codes: {}.".format(codes), indent=2)
+    # Exit code of the first failed chunk:
+    return [code for code in codes if code][0]
+
+  merge(chunkfiles, opfile, temp)
+  mu.msg(1, "Merged the opacity chunks into '{:s}'.".format(opfile), indent=2)
+  if verify:
+    if not compare(opfile, reference):
+      mu.error("Merged opacity table differs from the serial reference.")
+    mu.msg(1, "Merged opacity table matches the serial reference.", indent=2)
+  shutil.rmtree(chunkdir)
+  return 0
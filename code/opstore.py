@@ -0,0 +1,356 @@
+# ****************************** START LICENSE *******************************
+# Bayesian Atmospheric Radiative Transfer (BART), a code to infer
+# properties of planetary atmospheres based on observed spectroscopic
+# information.
+# 
+# This project was completed with the support of the NASA Planetary
+# Atmospheres Program, grant NNX12AI69G, held by Principal Investigator
+# Joseph Harrington. Principal developers included graduate students
+# Patricio E. Cubillos and Jasmina Blecic, programmer Madison Stemm, and
+# undergraduates M. Oliver Bowman and Andrew S. D. Foster.  The included
+# 'transit' radiative transfer code is based on an earlier program of
+# the same name written by Patricio Rojo (Univ. de Chile, Santiago) when
+# he was a graduate student at Cornell University under Joseph
+# Harrington.  Statistical advice came from Thomas J. Loredo and Nate
+# B. Lust.
+# 
+# Copyright (C) 2015 University of Central Florida.  All rights reserved.
+# 
+# This is a test version only, and may not be redistributed to any third
+# party.  Please refer such requests to us.  This program is distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+# 
+# Our intent is to release this software under an open-source,
+# reproducible-research license, once the code is mature and the first
+# research paper describing the code has been accepted for publication
+# in a peer-reviewed journal.  We are committed to development in the
+# open, and have posted this code on github.com so that others can test
+# it and give us feedback.  However, until its first publication and
+# first stable release, we do not permit others to redistribute the code
+# in either original or modified form, nor to publish work based in
+# whole or in part on the output of this code.  By downloading, running,
+# or modifying this code, you agree to these conditions.  We do
+# encourage sharing any modifications with us and discussing them
+# openly.
+# 
+# We welcome your feedback, but do not guarantee support.  Please send
+# feedback or inquiries to:
+# 
+# Joseph Harrington <jh@physics.ucf.edu>
+# Patricio Cubillos <pcubillos@fulbrightmail.org>
+# Jasmina Blecic <jasmina@physics.ucf.edu>
+# 
+# or alternatively,
+# 
+# Joseph Harrington, Patricio Cubillos, and Jasmina Blecic
+# UCF PSB 441
+# 4111 Libra Drive
+# Orlando, FL 32816-2385
+# USA
+# 
+# Thank you for testing BART!
+# ******************************* END LICENSE *******************************
+
+"""
+Shared, content-addressed store of transit opacity tables.
+
+An opacity table is determined by the line database and CIA files, the
+molecules and pressure layers of the atmospheric model, the molecular
+data file, the temperature grid, the wavenumber sampling, and the
+line-profile settings.  The store keeps one read-only table per
+combination of these (named by their SHA-1 hash), generates each table
+only once (concurrent runs wait on a file lock), serves it to the runs
+through hard links (or copies across file systems), and evicts the
+least recently used tables (with their lock files) when it exceeds a
+maximum size.
+
+Classes
+-------
+Store:
+     A directory of opacity tables.
+
+Functions
+---------
+readtconfig:
+     Read a transit configuration file.
+link:
+     Hard link a file, or copy it if it cannot be linked.
+"""
+
+import os, sys, time, errno, fcntl, shutil, hashlib
+import numpy as np
+
+import makeatm  as mat
+import pipeline as pl
+
+filedir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(filedir + "/../modules/MCcubed/src/")
+import mcutils as mu
+
+# Transit arguments that determine the opacity table:
+opacity_args = ["tlow", "thigh", "tempdelt",
+                "wllow", "wlhigh", "wlfct",
+                "wnlow", "wnhigh", "wndelt", "wnfct", "wnosamp",
+                "nwidth", "allowq"]
+# Transit arguments with files that determine the opacity table:
+opacity_files = ["linedb", "cia", "molfile"]
+
+
+def readtconfig(tconfig):
+  """
+  Read a transit configuration file.
+
+  Parameters:
+  -----------
+  tconfig: String
+     Transit configuration file.
+
+  Returns:
+  --------
+  args: Dictionary
+     The list of values of each argument.
+  """
+  args = {}
+  f = open(tconfig, "r")
+  for line in f:
+    fields = line.split(None, 1)
+    if len(fields) == 2 and not line.startswith("#"):
+      args.setdefault(fields[0], []).append(fields[1].strip())
+  f.close()
+  return args
+
+
+def link(src, dst):
+  """
+  Hard link src into dst (replacing dst), or copy it if the files are
+  on different file systems.
+  """
+  if os.path.lexists(dst):
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+      return
+    os.remove(dst)
+  try:
+    os.link(src, dst)
+  except OSError:
+    shutil.copy2(src, dst)
+
+
+class Store(object):
+  """
+  A directory of opacity tables, shared by BART runs.
+
+  Example:
+  --------
+  >>> import opstore as ops
+  >>> store = ops.Store("/data/opacity", maxsize=200e9)
+  >>> key = store.key("outdir/transit.cfg", "outdir/atm.dat")
+  >>> store.fetch(key, "outdir/opacity.dat", generate)
+  """
+  def __init__(self, root, maxsize=None, hashfunc=pl.filehash):
+    """
+    Parameters:
+    -----------
+    root: String
+       Store directory (created if it does not exist).
+    maxsize: Float
+       Maximum size of the store in bytes (default: unlimited).
+    hashfunc: Callable
+       Function that returns the hash of a file content.
+    """
+    self.root     = os.path.realpath(root)
+    self.maxsize  = maxsize
+    self.hashfunc = hashfunc
+    try:
+      os.makedirs(self.root)
+    except OSError, e:
+      if e.errno != errno.EEXIST:
+        raise
+
+
+  def key(self, tconfig, atmfile):
+    """
+    Hash of the inputs that determine an opacity table.
+
+    Parameters:
+    -----------
+    tconfig: String
+       Transit configuration file.
+    atmfile: String
+       Atmospheric model file.
+
+    Returns:
+    --------
+    key: String
+       Hexadecimal SHA-1 digest.
+    """
+    args = readtconfig(tconfig)
+    sha = hashlib.sha1()
+    for arg in opacity_args:
+      sha.update("{:s} {}\n".format(arg, args.get(arg)))
+    for arg in opacity_files:
+      for filename in args.get(arg, []):
+        sha.update("{:s} {}\n".format(arg, self.hashfunc(filename)))
+    # Molecules and pressure layers of the atmospheric model:
+    molecules, pressure, temp, abundances = mat.readatm(atmfile)
+    sha.update("molecules {}\n".format(" ".join(molecules)))
+    sha.update("pressure {}\n".format(" ".join(["{:.6e}".format(p)
+                                                for p in pressure])))
+    return sha.hexdigest()
+
+
+  def entry(self, key):
+    """
+    Path of the opacity table of a key.
+    """
+    return os.path.join(self.root, key + ".opc")
+
+
+  def lock(self, key, block=True):
+    """
+    Acquire the (inter-process) lock of a key.
+
+    Returns:
+    --------
+    lockfile: File object
+       The locked file (close it to release the lock), or None if
+       block is False and the lock is taken.
+    """
+    lockname = os.path.join(self.root, key + ".lock")
+    flags = fcntl.LOCK_EX
+    if not block:
+      flags |= fcntl.LOCK_NB
+    while True:
+      lockfile = open(lockname, "a")
+      try:
+        fcntl.flock(lockfile, flags)
+      except IOError:
+        lockfile.close()
+        return None
+      # Retry if evict() removed the lock file while we waited for it:
+      try:
+        if os.stat(lockname).st_ino == os.fstat(lockfile.fileno()).st_ino:
+          return lockfile
+      except OSError:
+        pass
+      lockfile.close()
+
+
+  def fetch(self, key, opacityfile, generate):
+    """
+    Provide the opacity table of a key at opacityfile, generating it
+    and adding it to the store if needed.
+
+    Parameters:
+    -----------
+    key: String
+       Opacity-table key (see Store.key()).
+    opacityfile: String
+       Path where the run expects the opacity table.
+    generate: Callable
+       Function (with no arguments) that writes the table into
+       opacityfile.  It may return an exit code.
+
+    Returns:
+    --------
+    code: Integer
+       Exit code of generate (0 if the table was in the store).
+    """
+    entry = self.entry(key)
+    lockfile = self.lock(key)
+    try:
+      if os.path.isfile(entry):
+        mu.msg(1, "Opacity table taken from the store: '{:s}'.".
+                  format(entry), indent=2)
+      else:
+        mu.msg(1, "Opacity table not in the store, generating it.", indent=2)
+        if os.path.lexists(opacityfile):
+          os.remove(opacityfile)
+        code = generate()
+        if code:
+          # No table for this key, drop its lock file:
+          os.remove(os.path.join(self.root, key + ".lock"))
+          return code
+        # Add the table to the store (read only):
+        tmpfile = entry + ".tmp"
+        link(opacityfile, tmpfile)
+        os.chmod(tmpfile, 0444)
+        os.rename(tmpfile, entry)
+      # Serve the table (a copy across file systems, so that evict()
+      # never leaves the run with a dangling link):
+      link(entry, opacityfile)
+      # Record the last use:
+      open(os.path.join(self.root, key + ".used"), "w").close()
+    finally:
+      lockfile.close()
+
+    self.evict()
+    return 0
+
+
+  def entries(self):
+    """
+    List the stored tables.
+
+    Returns:
+    --------
+    entries: List of tuples
+       The (key, size in bytes, last-use time) of each table, from the
+       least to the most recently used.
+    """
+    entries = []
+    for filename in os.listdir(self.root):
+      if filename.endswith(".opc"):
+        key = filename[:-4]
+        try:
+          size = os.path.getsize(self.entry(key))
+          used = os.path.getmtime(os.path.join(self.root, key + ".used"))
+        except OSError:
+          continue
+        entries.append((key, size, used))
+    return sorted(entries, key=lambda entry: entry[2])
+
+
+  def evict(self, maxsize=None):
+    """
+    Remove the least recently used tables until the store size is
+    below maxsize.  Tables being generated or served are not removed;
+    runs keep their hard-linked (or copied) tables.  The lock files of
+    the removed tables are removed too.
+
+    Parameters:
+    -----------
+    maxsize: Float
+       Maximum size in bytes (default: the store's maxsize).
+
+    Returns:
+    --------
+    removed: List of strings
+       Keys of the removed tables.
+    """
+    if maxsize is None:
+      maxsize = self.maxsize
+    if maxsize is None:
+      return []
+
+    entries = self.entries()
+    total = np.sum([entry[1] for entry in entries])
+    removed = []
+    for key, size, used in entries:
+      if total <= maxsize:
+        break
+      lockfile = self.lock(key, block=False)
+      if lockfile is None:
+        continue
+      try:
+        for ext in [".opc", ".used", ".lock"]:
+          if os.path.exists(os.path.join(self.root, key + ext)):
+            os.remove(os.path.join(self.root, key + ext))
+        total -= size
+        removed.append(key)
+        mu.msg(1, "Opacity table '{:s}' evicted from the store.".format(key),
+               indent=2)
+      finally:
+        lockfile.close()
+    return removed
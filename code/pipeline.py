@@ -0,0 +1,780 @@
+# ****************************** START LICENSE *******************************
+# Bayesian Atmospheric Radiative Transfer (BART), a code to infer
+# properties of planetary atmospheres based on observed spectroscopic
+# information.
+# 
+# This project was completed with the support of the NASA Planetary
+# Atmospheres Program, grant NNX12AI69G, held by Principal Investigator
+# Joseph Harrington. Principal developers included graduate students
+# Patricio E. Cubillos and Jasmina Blecic, programmer Madison Stemm, and
+# undergraduates M. Oliver Bowman and Andrew S. D. Foster.  The included
+# 'transit' radiative transfer code is based on an earlier program of
+# the same name written by Patricio Rojo (Univ. de Chile, Santiago) when
+# he was a graduate student at Cornell University under Joseph
+# Harrington.  Statistical advice came from Thomas J. Loredo and Nate
+# B. Lust.
+# 
+# Copyright (C) 2015 University of Central Florida.  All rights reserved.
+# 
+# This is a test version only, and may not be redistributed to any third
+# party.  Please refer such requests to us.  This program is distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+# 
+# Our intent is to release this software under an open-source,
+# reproducible-research license, once the code is mature and the first
+# research paper describing the code has been accepted for publication
+# in a peer-reviewed journal.  We are committed to development in the
+# open, and have posted this code on github.com so that others can test
+# it and give us feedback.  However, until its first publication and
+# first stable release, we do not permit others to redistribute the code
+# in either original or modified form, nor to publish work based in
+# whole or in part on the output of this code.  By downloading, running,
+# or modifying this code, you agree to these conditions.  We do
+# encourage sharing any modifications with us and discussing them
+# openly.
+# 
+# We welcome your feedback, but do not guarantee support.  Please send
+# feedback or inquiries to:
+# 
+# Joseph Harrington <jh@physics.ucf.edu>
+# Patricio Cubillos <pcubillos@fulbrightmail.org>
+# Jasmina Blecic <jasmina@physics.ucf.edu>
+# 
+# or alternatively,
+# 
+# Joseph Harrington, Patricio Cubillos, and Jasmina Blecic
+# UCF PSB 441
+# 4111 Libra Drive
+# Orlando, FL 32816-2385
+# USA
+# 
+# Thank you for testing BART!
+# ******************************* END LICENSE *******************************
+
+"""
+Dependency-aware pipeline runner.
+
+Each stage of a BART run declares the files it reads (inputs), the
+files it writes (outputs), the stages it depends on, and the parameters
+that affect its result.  A stage is skipped when the content hashes of
+its inputs and parameters match those of the previous run and its
+outputs are unchanged since; otherwise it (and anything downstream
+whose inputs change) is re-run.  Stages whose dependencies are
+satisfied run concurrently, subject to a CPU budget.
+
+Classes
+-------
+Resources:
+     CPU budget and per-stage concurrency limits shared by pipelines.
+FileResources:
+     CPU budget and limits shared by pipelines of different processes.
+Stage:
+     A pipeline stage.
+Pipeline:
+     A set of stages and the state of their previous executions.
+
+Functions
+---------
+filehash:
+     Calculate the SHA-1 hash of a file content.
+paramhash:
+     Calculate the SHA-1 hash of a set of stage parameters.
+wait:
+     Wait for a child process and record its exit code and usage.
+call:
+     Run a child process and record its exit code and usage.
+telemetry:
+     Resource usage of a stage.
+"""
+
+import os, sys, time, json, errno, fcntl, socket, hashlib, resource
+import threading, subprocess
+import multiprocessing
+import numpy as np
+
+filedir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(filedir + "/../modules/MCcubed/src/")
+import mcutils as mu
+
+# File hashes known to this process, shared by all pipelines so that
+# common inputs (e.g., line databases) are hashed only once:
+_hashes   = {}
+_hashlock = threading.Lock()
+# Child processes run (through wait()) by the stage of each thread:
+_children = threading.local()
+
+
+def filehash(filename, blocksize=2**20):
+  """
+  Calculate the SHA-1 hash of a file content.
+
+  Parameters:
+  -----------
+  filename: String
+     Path to the file.
+  blocksize: Integer
+     Size of the blocks read at a time.
+
+  Returns:
+  --------
+  hash: String
+     Hexadecimal digest of the file content (None if the file does not
+     exist).
+  """
+  if not os.path.isfile(filename):
+    return None
+  sha = hashlib.sha1()
+  f = open(filename, "rb")
+  block = f.read(blocksize)
+  while block:
+    sha.update(block)
+    block = f.read(blocksize)
+  f.close()
+  return sha.hexdigest()
+
+
+def _canonical(value):
+  """
+  JSON-serializable form of a value that json cannot encode: arrays
+  are represented by their dtype, shape, and the hash of their bytes.
+  """
+  if isinstance(value, np.ndarray):
+    value = np.ascontiguousarray(value)
+    return {"ndarray":hashlib.sha1(value.tobytes()).hexdigest(),
+            "dtype":value.dtype.str, "shape":list(value.shape)}
+  if isinstance(value, np.generic):
+    return value.item()
+  if isinstance(value, (set, frozenset)):
+    return sorted(value)
+  return repr(value)
+
+
+def paramhash(params):
+  """
+  Calculate the SHA-1 hash of a set of stage parameters, from their
+  canonical JSON serialization (dictionaries with sorted keys, floats
+  with full precision, and arrays hashed through their bytes).
+
+  Parameters:
+  -----------
+  params: Any
+     Stage parameters (numbers, strings, lists, tuples, dictionaries,
+     and numpy arrays).
+
+  Returns:
+  --------
+  hash: String
+     Hexadecimal digest.
+  """
+  serial = json.dumps(params, sort_keys=True, default=_canonical)
+  return hashlib.sha1(serial).hexdigest()
+
+
+def wait(proc, args=None):
+  """
+  Wait for a child process and, if called from a pipeline stage, record
+  its exit code, CPU time, and peak resident set size in the stage
+  telemetry.
+
+  Parameters:
+  -----------
+  proc: subprocess.Popen instance
+     The child process.
+  args: List of strings or String
+     Command of the child process (recorded in the telemetry).
+
+  Returns:
+  --------
+  code: Integer
+     Exit code of the child (minus the signal number if it was killed).
+  """
+  while True:
+    try:
+      pid, status, usage = os.wait4(proc.pid, 0)
+      break
+    except OSError as error:
+      if error.errno != errno.EINTR:
+        raise
+  if os.WIFSIGNALED(status):
+    code = -os.WTERMSIG(status)
+  else:
+    code = os.WEXITSTATUS(status)
+  proc.returncode = code
+
+  children = getattr(_children, "list", None)
+  if children is not None:
+    if isinstance(args, (list, tuple)):
+      args = " ".join(args)
+    children.append({"args":      args,
+                     "exit_code": code,
+                     "cpu":       usage.ru_utime + usage.ru_stime,
+                     "maxrss":    usage.ru_maxrss})
+  return code
+
+
+def call(args, **kwargs):
+  """
+  Run a child process (as subprocess.call) and record its exit code and
+  resource usage (see wait()).
+  """
+  return wait(subprocess.Popen(args, **kwargs), args)
+
+
+def telemetry(start, usage, cusage, code, children=[]):
+  """
+  Resource usage of a stage.
+
+  Parameters:
+  -----------
+  start: Float
+     Start time of the stage (time.time()).
+  usage: struct_rusage
+     Resource usage of this process at the start of the stage.
+  cusage: struct_rusage
+     Resource usage of the finished child processes at the start.
+  code: Integer
+     Exit code returned by the stage.
+  children: List of dictionaries
+     Child processes recorded by wait() during the stage.
+
+  Returns:
+  --------
+  telemetry: Dictionary
+     Wall time, CPU (user + system) time of this process and of the
+     child processes (e.g., transit, TEA, or MPI) finished during the
+     stage, peak resident set size (kB) of this process and of the
+     largest child of the stage (None if the stage ran no child through
+     wait()), the exit code, and the command, exit code, CPU time, and
+     peak RSS of each child run through wait().
+
+  Notes:
+  ------
+  Stages running concurrently share this process, so the CPU times of
+  this process and of its children, and the peak RSS of this process,
+  are not exclusive to a stage.  The children's peak RSS values are.
+  """
+  end  = resource.getrusage(resource.RUSAGE_SELF)
+  cend = resource.getrusage(resource.RUSAGE_CHILDREN)
+  maxrss_children = None
+  if len(children) > 0:
+    maxrss_children = max([child["maxrss"] for child in children])
+  return {"wall":            time.time() - start,
+          "cpu":             (end.ru_utime  - usage.ru_utime +
+                              end.ru_stime  - usage.ru_stime),
+          "cpu_children":    (cend.ru_utime - cusage.ru_utime +
+                              cend.ru_stime - cusage.ru_stime),
+          "maxrss":          end.ru_maxrss,
+          "maxrss_children": maxrss_children,
+          "exit_code":       code,
+          "children":        list(children)}
+
+
+class Resources(object):
+  """
+  CPU budget and per-stage concurrency limits.  A single Resources
+  object can be shared by several pipelines running concurrently.
+  """
+  def __init__(self, ncpu=None, limits={}):
+    """
+    Parameters:
+    -----------
+    ncpu: Integer
+       Total number of CPUs available (default: number of CPUs).
+    limits: Dictionary
+       Maximum number of concurrent executions for each stage name.
+    """
+    if ncpu is None:
+      ncpu = multiprocessing.cpu_count()
+    self.ncpu    = ncpu
+    self.free    = ncpu
+    self.limits  = dict(limits)
+    self.running = {}
+    self.cond    = threading.Condition()
+
+  def acquire(self, name, ncpu):
+    """
+    Block until ncpu CPUs are available for a stage called name.
+    Stages requesting more CPUs than the budget run alone.
+    """
+    ncpu = np.amin([ncpu, self.ncpu])
+    self.cond.acquire()
+    while (self.free < ncpu or
+           self.running.get(name, 0) >= self.limits.get(name, np.inf)):
+      self.cond.wait()
+    self.free -= ncpu
+    self.running[name] = self.running.get(name, 0) + 1
+    self.cond.release()
+    return ncpu
+
+  def release(self, name, ncpu):
+    """
+    Return the ncpu CPUs taken by a stage called name.
+    """
+    self.cond.acquire()
+    self.free += ncpu
+    self.running[name] -= 1
+    self.cond.notify_all()
+    self.cond.release()
+
+
+class FileResources(Resources):
+  """
+  CPU budget and per-stage concurrency limits shared by pipelines in
+  different processes (e.g., the runs of a campaign).  The budget is a
+  JSON file that lists the CPUs held by each stage and process; it is
+  locked while read or updated.  CPUs held by processes that no longer
+  exist are returned to the budget.
+  """
+  def __init__(self, filename, ncpu=None, limits=None, poll=0.5):
+    """
+    Parameters:
+    -----------
+    filename: String
+       Budget file.  It is created if ncpu or limits are given (or if
+       it does not exist), otherwise the existing budget is used.
+    ncpu: Integer
+       Total number of CPUs available (default: number of CPUs).
+    limits: Dictionary
+       Maximum number of concurrent executions for each stage name.
+    poll: Float
+       Interval (s) between checks of the budget while waiting for CPUs.
+    """
+    self.filename = os.path.realpath(filename)
+    self.poll     = poll
+    if ncpu is not None or limits is not None or \
+       not os.path.isfile(self.filename):
+      if ncpu is None:
+        ncpu = multiprocessing.cpu_count()
+      if limits is None:
+        limits = {}
+      f = open(self.filename, "w")
+      json.dump({"ncpu":int(ncpu), "limits":limits, "held":[]}, f)
+      f.close()
+    state = self._update(lambda state: state)
+    self.ncpu   = state["ncpu"]
+    self.limits = state["limits"]
+
+  def _update(self, func):
+    """
+    Apply func to the budget (dictionary) with the file locked, write
+    the budget back, and return the output of func.
+    """
+    f = open(self.filename, "r+")
+    try:
+      fcntl.flock(f, fcntl.LOCK_EX)
+      state = json.load(f)
+      # Drop the CPUs held by processes that no longer exist:
+      state["held"] = [held for held in state["held"] if _alive(held[2])]
+      result = func(state)
+      f.seek(0)
+      f.truncate()
+      json.dump(state, f)
+      f.flush()
+    finally:
+      f.close()
+    return result
+
+  def acquire(self, name, ncpu):
+    """
+    Block until ncpu CPUs are available for a stage called name.
+    Stages requesting more CPUs than the budget run alone.
+    """
+    ncpu = int(np.amin([ncpu, self.ncpu]))
+    def take(state):
+      free = state["ncpu"] - np.sum([held[1] for held in state["held"]])
+      running = np.sum([held[0] == name for held in state["held"]])
+      if free >= ncpu and running < state["limits"].get(name, np.inf):
+        state["held"].append([name, ncpu, os.getpid()])
+        return True
+      return False
+    while not self._update(take):
+      time.sleep(self.poll)
+    return ncpu
+
+  def release(self, name, ncpu):
+    """
+    Return the ncpu CPUs taken by a stage called name.
+    """
+    def give(state):
+      held = [name, ncpu, os.getpid()]
+      if held in state["held"]:
+        state["held"].remove(held)
+    self._update(give)
+
+
+def _alive(pid):
+  """
+  Check whether a process exists.
+  """
+  try:
+    os.kill(pid, 0)
+  except OSError as error:
+    return error.errno == errno.EPERM
+  return True
+
+
+class Stage(object):
+  """
+  A pipeline stage.
+  """
+  def __init__(self, name, func, inputs=[], outputs=[], depends=[],
+               params=None, ncpu=1, metrics=None):
+    """
+    Parameters:
+    -----------
+    name: String
+       Stage name.
+    func: Callable
+       Function (with no arguments) that executes the stage.  It may
+       return the exit code of the stage.
+    inputs: List of strings
+       Files read by the stage.
+    outputs: List of strings
+       Files written by the stage.
+    depends: List of strings
+       Names of the stages that must run before this one.
+    params: Any
+       Parameters that affect the outputs of the stage (hashed through
+       their canonical serialization, see paramhash()).
+    ncpu: Integer
+       Number of CPUs used by the stage.
+    metrics: Callable
+       Function that takes the stage telemetry (dictionary) after an
+       execution and returns a dictionary of stage-specific metrics.
+    """
+    self.name    = name
+    self.func    = func
+    self.inputs  = [f for f in inputs  if f is not None]
+    self.outputs = [f for f in outputs if f is not None]
+    self.depends = list(depends)
+    self.params  = params
+    self.ncpu    = ncpu
+    self.metrics = metrics
+
+
+class Pipeline(object):
+  """
+  A set of stages and the record (hashes) of their previous executions.
+
+  Example:
+  --------
+  >>> import pipeline as pl
+  >>> pipe = pl.Pipeline("outdir/pipeline.json")
+  >>> pipe.add("pressure", makepress, outputs=["outdir/layers.press"],
+  >>>          params=[100, 1e-5, 100.0])
+  >>> pipe.add("atm", makeatm, inputs=["outdir/layers.press"],
+  >>>          outputs=["outdir/atm.tea"], depends=["pressure"])
+  >>> pipe.run()
+  """
+  def __init__(self, statefile, resources=None):
+    """
+    Parameters:
+    -----------
+    statefile: String
+       File where the stage hashes are recorded.
+    resources: Resources instance
+       CPU budget (default: all CPUs of this machine).
+    """
+    if resources is None:
+      resources = Resources()
+    self.statefile = statefile
+    self.resources = resources
+    self.stages    = []
+    self.times     = {}   # Execution time of the stages
+    self.status    = {}   # Status of the stages in the last run()
+    self.telemetry = {}   # Resource usage of the executed stages
+    self.start     = time.time()
+    self.lock      = threading.Lock()
+    # Load the record of previous executions:
+    self.state = {"stages":{}, "files":{}}
+    if os.path.isfile(statefile):
+      f = open(statefile, "r")
+      self.state = json.load(f)
+      f.close()
+
+
+  def add(self, name, func, **kwargs):
+    """
+    Add a stage to the pipeline (see Stage for the arguments).
+    """
+    stage = Stage(name, func, **kwargs)
+    self.stages.append(stage)
+    return stage
+
+
+  def get(self, name):
+    """
+    Get a stage by name.
+    """
+    for stage in self.stages:
+      if stage.name == name:
+        return stage
+    raise ValueError("Pipeline has no stage '{:s}'.".format(name))
+
+
+  def needed(self, targets=None):
+    """
+    List the stages required to produce targets (default: all stages),
+    in the order they were added.
+    """
+    if targets is None:
+      return list(self.stages)
+    names = set()
+    queue = list(targets)
+    while queue:
+      name = queue.pop()
+      if name not in names:
+        names.add(name)
+        queue += self.get(name).depends
+    return [stage for stage in self.stages if stage.name in names]
+
+
+  def hash(self, filename):
+    """
+    Hash of a file content.  Hashes are cached with the file size and
+    modification time, so unchanged files are not read again.
+    """
+    path = os.path.realpath(filename)
+    if not os.path.isfile(path):
+      return None
+    stat = os.stat(path)
+    fileid = [stat.st_size, stat.st_mtime]
+    _hashlock.acquire()
+    cache = _hashes.get(path)
+    _hashlock.release()
+    if cache is None:
+      self.lock.acquire()
+      cache = self.state["files"].get(path)
+      self.lock.release()
+    if cache is not None and cache[0:2] == fileid:
+      digest = cache[2]
+    else:
+      digest = filehash(path)
+    _hashlock.acquire()
+    _hashes[path] = fileid + [digest]
+    _hashlock.release()
+    self.lock.acquire()
+    self.state["files"][path] = fileid + [digest]
+    self.lock.release()
+    return digest
+
+
+  def key(self, stage):
+    """
+    Hash of the stage parameters and the content of its inputs.
+    """
+    sha = hashlib.sha1()
+    sha.update(stage.name)
+    sha.update(paramhash(stage.params))
+    for filename in stage.inputs:
+      sha.update(os.path.realpath(filename))
+      sha.update(str(self.hash(filename)))
+    for filename in stage.outputs:
+      sha.update(os.path.realpath(filename))
+    return sha.hexdigest()
+
+
+  def uptodate(self, stage, key):
+    """
+    Check whether a stage ran before with the same key and its outputs
+    were not modified since.
+    """
+    self.lock.acquire()
+    record = self.state["stages"].get(stage.name)
+    self.lock.release()
+    if record is None or record["key"] != key or len(stage.outputs) == 0:
+      return False
+    for filename in stage.outputs:
+      if self.hash(filename) != record["outputs"].get(filename):
+        return False
+    return True
+
+
+  def record(self, stage, key):
+    """
+    Record the key and output hashes of an executed stage.
+    """
+    outputs = {}
+    for filename in stage.outputs:
+      outputs[filename] = self.hash(filename)
+    self.lock.acquire()
+    self.state["stages"][stage.name] = {"key":key, "outputs":outputs}
+    self.save()
+    self.lock.release()
+
+
+  def invalidate(self, name):
+    """
+    Forget the record of a stage, so that it runs again.
+    """
+    self.lock.acquire()
+    self.state["stages"].pop(name, None)
+    self.save()
+    self.lock.release()
+
+
+  def save(self):
+    """
+    Write the state file (the caller must hold the lock).
+    """
+    tmpfile = self.statefile + ".tmp"
+    f = open(tmpfile, "w")
+    json.dump(self.state, f, indent=1, sort_keys=True)
+    f.close()
+    os.rename(tmpfile, self.statefile)
+
+
+  def execute(self, stage):
+    """
+    Run a stage unless it is up to date, and record its wall and CPU
+    times, peak resident memory, and exit code into self.telemetry.
+
+    Returns:
+    --------
+    status: String
+       'skipped' or 'done'.
+    """
+    key = self.key(stage)
+    if self.uptodate(stage, key):
+      mu.msg(1, "Stage '{:s}' is up to date.".format(stage.name), indent=2)
+      return "skipped"
+
+    ncpu = self.resources.acquire(stage.name, stage.ncpu)
+    mu.msg(1, "Stage '{:s}' starts.".format(stage.name), indent=2)
+    start  = time.time()
+    usage  = resource.getrusage(resource.RUSAGE_SELF)
+    cusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    code = None
+    _children.list = []
+    try:
+      code = stage.func()
+    finally:
+      self.times[stage.name] = time.time() - start
+      self.resources.release(stage.name, ncpu)
+      self.telemetry[stage.name] = telemetry(start, usage, cusage, code,
+                                             _children.list)
+      _children.list = None
+    if code:
+      raise RuntimeError("Stage '{:s}' failed with exit code {}.".
+                         format(stage.name, code))
+    # Inputs may have been modified by the stage itself (e.g., copies):
+    self.record(stage, self.key(stage))
+    mu.msg(1, "Stage '{:s}' done.".format(stage.name), indent=2)
+    return "done"
+
+
+  def manifest(self, filename):
+    """
+    Write a JSON manifest of the last run: the status, telemetry,
+    metrics, and the hash and size of the input and output files of
+    each stage.
+
+    Parameters:
+    -----------
+    filename: String
+       Output manifest file.
+    """
+    stages = []
+    for stage in self.stages:
+      if stage.name not in self.status:
+        continue
+      info = {"name":   stage.name,
+              "status": self.status[stage.name],
+              "ncpu":   stage.ncpu}
+      info.update(self.telemetry.get(stage.name, {}))
+      if stage.metrics is not None and stage.name in self.telemetry:
+        try:
+          info["metrics"] = stage.metrics(info)
+        except Exception as error:
+          info["metrics"] = {"error":str(error)}
+      for files in ["inputs", "outputs"]:
+        info[files] = []
+        for path in getattr(stage, files):
+          size = None
+          if os.path.isfile(path):
+            size = os.path.getsize(path)
+          info[files].append({"file":path, "size":size,
+                              "sha1":self.hash(path)})
+      stages.append(info)
+
+    manifest = {"host":   socket.gethostname(),
+                "argv":   sys.argv,
+                "start":  time.strftime("%Y-%m-%dT%H:%M:%S",
+                                        time.localtime(self.start)),
+                "wall":   time.time() - self.start,
+                "stages": stages}
+    f = open(filename, "w")
+    json.dump(manifest, f, indent=1, sort_keys=True)
+    f.close()
+
+
+  def run(self, targets=None):
+    """
+    Run the stages needed for targets (default: all stages).  Stages
+    run as soon as their dependencies are completed.
+
+    Parameters:
+    -----------
+    targets: List of strings
+       Names of the stages to produce.
+
+    Returns:
+    --------
+    status: Dictionary
+       Status ('skipped' or 'done') of each executed stage.
+    """
+    stages  = self.needed(targets)
+    names   = [stage.name for stage in stages]
+    for stage in stages:
+      for dep in stage.depends:
+        if dep not in names:
+          raise ValueError("Stage '{:s}' depends on unknown stage '{:s}'.".
+                           format(stage.name, dep))
+    status  = {}
+    errors  = []
+    running = set()
+    cond    = threading.Condition()
+
+    def worker(stage):
+      try:
+        result = self.execute(stage)
+      except BaseException as error:
+        result = None
+        cond.acquire()
+        errors.append((stage.name, sys.exc_info()))
+        cond.release()
+      cond.acquire()
+      status[stage.name] = result
+      self.status[stage.name] = result or "failed"
+      running.remove(stage.name)
+      cond.notify_all()
+      cond.release()
+
+    cond.acquire()
+    while len(status) < len(stages):
+      if errors:
+        # Let running stages finish, do not start new ones:
+        if running:
+          cond.wait()
+          continue
+        break
+      # Start the stages whose dependencies are completed:
+      for stage in stages:
+        if (stage.name not in status and stage.name not in running and
+            np.all([status.get(dep) is not None for dep in stage.depends])):
+          running.add(stage.name)
+          thread = threading.Thread(target=worker, args=(stage,))
+          thread.daemon = True
+          thread.start()
+      if len(status) < len(stages):
+        cond.wait()
+    cond.release()
+
+    if errors:
+      name, info = errors[0]
+      mu.msg(1, "Stage '{:s}' failed.".format(name), indent=2)
+      raise info[0], info[1], info[2]
+
+    return status
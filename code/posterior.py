@@ -0,0 +1,489 @@
+# ****************************** START LICENSE *******************************
+# Bayesian Atmospheric Radiative Transfer (BART), a code to infer
+# properties of planetary atmospheres based on observed spectroscopic
+# information.
+# 
+# This project was completed with the support of the NASA Planetary
+# Atmospheres Program, grant NNX12AI69G, held by Principal Investigator
+# Joseph Harrington. Principal developers included graduate students
+# Patricio E. Cubillos and Jasmina Blecic, programmer Madison Stemm, and
+# undergraduates M. Oliver Bowman and Andrew S. D. Foster.  The included
+# 'transit' radiative transfer code is based on an earlier program of
+# the same name written by Patricio Rojo (Univ. de Chile, Santiago) when
+# he was a graduate student at Cornell University under Joseph
+# Harrington.  Statistical advice came from Thomas J. Loredo and Nate
+# B. Lust.
+# 
+# Copyright (C) 2015 University of Central Florida.  All rights reserved.
+# 
+# This is a test version only, and may not be redistributed to any third
+# party.  Please refer such requests to us.  This program is distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+# 
+# Our intent is to release this software under an open-source,
+# reproducible-research license, once the code is mature and the first
+# research paper describing the code has been accepted for publication
+# in a peer-reviewed journal.  We are committed to development in the
+# open, and have posted this code on github.com so that others can test
+# it and give us feedback.  However, until its first publication and
+# first stable release, we do not permit others to redistribute the code
+# in either original or modified form, nor to publish work based in
+# whole or in part on the output of this code.  By downloading, running,
+# or modifying this code, you agree to these conditions.  We do
+# encourage sharing any modifications with us and discussing them
+# openly.
+# 
+# We welcome your feedback, but do not guarantee support.  Please send
+# feedback or inquiries to:
+# 
+# Joseph Harrington <jh@physics.ucf.edu>
+# Patricio Cubillos <pcubillos@fulbrightmail.org>
+# Jasmina Blecic <jasmina@physics.ucf.edu>
+# 
+# or alternatively,
+# 
+# Joseph Harrington, Patricio Cubillos, and Jasmina Blecic
+# UCF PSB 441
+# 4111 Libra Drive
+# Orlando, FL 32816-2385
+# USA
+# 
+# Thank you for testing BART!
+# ******************************* END LICENSE *******************************
+
+"""
+Posterior-predictive spectra.
+
+This module evaluates the full model spectrum and band-integrated
+fluxes for a set of thinned posterior samples of an MCMC run.  The
+forward model is the same in-process transit_module path used by
+BARTfunc, so the opacity table and filters are loaded only once per
+worker process instead of once per sample.
+
+Functions
+---------
+thin:
+     Draw evenly-thinned posterior samples from the MC3 output chains.
+setup:
+     Initialize transit and the output-converter arrays for one process.
+model:
+     Evaluate the spectrum and band fluxes for a set of parameters.
+scale:
+     Scale the fitted abundance profiles.
+integrate:
+     Band-integrate a spectrum over the filters.
+close:
+     Free the transit-module memory of the current process.
+credible:
+     Compute the median and credible bands of a set of spectra.
+predictive:
+     Evaluate the posterior-predictive spectra over a pool of workers.
+"""
+
+import sys, os
+import multiprocessing as mpr
+import numpy as np
+import scipy.constants as sc
+
+import makeatm   as mat
+import PT        as pt
+import wine      as w
+import system    as sy
+import constants as c
+
+filedir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(filedir + "/../modules/MCcubed/src/")
+import mcutils as mu
+
+# The compiled transit module is imported by setup() (so that BART runs
+# that do not evaluate the model do not need it):
+sys.path.append(filedir + "/../modules/transit/transit/python")
+trm = None
+
+# Forward-model state of the current worker process:
+_state = None
+
+
+def thin(MCfile, burnin, nsamples, stepsize, params):
+  """
+  Draw evenly-thinned samples from the post-burn-in MCMC chains.
+
+  Parameters:
+  -----------
+  MCfile: String
+     MC3 output file with the chains (nchains, nfree, niter).
+  burnin: Integer
+     Number of burn-in iterations to discard from each chain.
+  nsamples: Integer
+     Number of samples to draw.
+  stepsize: 1D float ndarray
+     Parameters stepsize (only the parameters with positive stepsize are
+     in the chains).
+  params: 1D float ndarray
+     Model-fitting parameters (provide the values of the other
+     parameters).
+
+  Returns:
+  --------
+  samples: 2D float ndarray
+     Array of shape (nsamples, npars) with the full set of parameters
+     for each sample.
+  """
+  # Load the chains:
+  data = np.load(MCfile)
+  nchains, nfree, niter = np.shape(data)
+
+  # Stack the post-burn-in chains, shape (nchains*(niter-burnin), nfree):
+  stack = np.transpose(data[:,:,int(burnin):], (0, 2, 1)).reshape(-1, nfree)
+  if len(stack) == 0:
+    mu.error("There are no post-burn-in samples in '{:s}' (burnin of {:d} "
+             "iterations, chains of {:d} iterations).".format(MCfile,
+                                                    int(burnin), niter))
+  nsamples = np.amin([nsamples, len(stack)])
+
+  # Evenly-spaced thinning through the stacked chains:
+  isample = np.linspace(0, len(stack)-1, nsamples).astype(int)
+
+  # Fill in the fixed and shared parameters:
+  stepsize = np.asarray(stepsize, np.double)
+  samples = np.tile(np.asarray(params, np.double), (nsamples, 1))
+  samples[:, stepsize > 0] = stack[isample]
+
+  return samples
+
+
+def setup(tconfig, atmfile, tepfile, PTtype, molfit, filters, kurucz,
+          solution, tint=100.0, filter_cache=None, bins=None):
+  """
+  Initialize the transit module and the input/output converter arrays
+  (as in BARTfunc) for the current process.
+
+  Parameters:
+  -----------
+  tconfig: String
+     Transit configuration file.
+  atmfile: String
+     Atmospheric model file.
+  tepfile: String or system.System
+     A TEP file.
+  PTtype: String
+     Temperature profile model.
+  molfit: 1D string ndarray
+     Molecules being fit.
+  filters: 1D string ndarray
+     Waveband filter files.
+  kurucz: String
+     Stellar Kurucz file.
+  solution: String
+     Solution geometry ('transit' or 'eclipse').
+  tint: Float
+     Internal temperature of the planet.
+  filter_cache: String
+     Filter-bank cache directory (see wine.FilterBank).  If None, use
+     the directory of tconfig.
+  bins: 1D float ndarray
+     Wavelength edges (microns) of top-hat bins, integrated after the
+     filters (see wine.readbins).
+
+  Returns:
+  --------
+  state: Dictionary
+     The forward-model arrays used by model().
+  """
+  state = {"solution":solution}
+
+  # Extract necessary values from the TEP file:
+  system = sy.load(tepfile)
+  state["rprs"] = system.rprs
+
+  # Read atmospheric file to get data arrays:
+  species, pressure, temp, abundances = mat.readatm(atmfile)
+  species = np.asarray(species)
+  # Reverse pressure order (for PT to work):
+  state["pressure"]   = pressure[::-1]
+  state["abundances"] = abundances
+  nlayers, nspecies = np.shape(abundances)
+
+  # Indices of H2, He, the metals, and the fitted molecules:
+  iH2 = np.where(species=="H2")[0]
+  iHe = np.where(species=="He")[0]
+  state["iH2"] = iH2
+  state["iHe"] = iHe
+  state["ratio"]   = (abundances[:,iH2] / abundances[:,iHe]).squeeze()
+  state["imetals"] = np.where((species != "He") & (species != "H2"))[0]
+  state["imol"]    = np.zeros(len(molfit), int)
+  for i in np.arange(len(molfit)):
+    state["imol"][i] = np.where(species == molfit[i])[0][0]
+
+  # Pressure-Temperature profile arguments:
+  state["PTargs"] = [PTtype]
+  if PTtype == "line":
+    # Planetary surface gravity (in cm s-2):
+    gplanet = 100.0 * system.gplanet
+    state["PTargs"] += [system.rstar, system.tstar, tint, system.sma, gplanet]
+
+  # Store abundance profiles:
+  state["profiles"] = np.zeros((nspecies+1, nlayers), dtype='d')
+  state["profiles"][1:] = abundances.T
+
+  # Initialize the transit python module:
+  global trm
+  import transit_module as trm
+  transit_args = ["transit", "-c", tconfig]
+  trm.transit_init(len(transit_args), transit_args)
+  state["nwave"]  = trm.get_no_samples()
+  state["specwn"] = trm.get_waveno_arr(state["nwave"])
+
+  # Filters and stellar flux resampled to the spectrum (cached):
+  if filter_cache is None:
+    filter_cache = os.path.dirname(os.path.realpath(tconfig))
+  bank = w.FilterBank(state["specwn"], filters, kurucz, system.tstar,
+                      system.gstar, filter_cache)
+  state["nifilter"]  = bank.nifilter
+  state["istarfl"]   = bank.istarfl
+  state["wnindices"] = bank.wnindices
+
+  # Top-hat bins:
+  state["bins"] = None
+  if bins is not None:
+    state["bins"] = w.Bins(state["specwn"], bins, kurucz, system.tstar,
+                           system.gstar)
+
+  return state
+
+
+def model(state, params):
+  """
+  Evaluate the model spectrum and band-integrated fluxes.
+
+  Parameters:
+  -----------
+  state: Dictionary
+     Forward-model arrays returned by setup().
+  params: 1D float ndarray
+     Model-fitting parameters (PT parameters followed by the log10 of the
+     molecular scaling factors).
+
+  Returns:
+  --------
+  spectrum: 1D float ndarray
+     The transit output spectrum.
+  bandflux: 1D float ndarray
+     The band-integrated flux ratio (eclipse) or modulation (transit).
+  """
+  profiles = state["profiles"]
+  nPT      = len(params) - len(state["imol"])
+
+  # Input converter calculate the profiles:
+  profiles[0] = pt.PT_generator(state["pressure"], params[0:nPT],
+                                state["PTargs"])[::-1]
+  scale(state, params[nPT:])
+
+  # Let transit calculate the model spectrum:
+  spectrum = trm.run_transit(profiles.flatten(), state["nwave"])
+
+  return spectrum, integrate(state, spectrum)
+
+
+def scale(state, molpars):
+  """
+  Scale the fitted abundance profiles (in state["profiles"]), and
+  update the H2 and He abundances so that they sum 1.0 in each layer.
+
+  Parameters:
+  -----------
+  state: Dictionary
+     Forward-model arrays returned by setup().
+  molpars: 1D float ndarray
+     Log10 of the molecular scaling factors.
+  """
+  profiles   = state["profiles"]
+  abundances = state["abundances"]
+  imol  = state["imol"]
+  ratio = state["ratio"]
+
+  # Scale abundance profiles:
+  for i in np.arange(len(imol)):
+    profiles[imol[i]+1] = abundances[:, imol[i]] * 10.0**molpars[i]
+  # Update H2, He abundances so sum(abundances) = 1.0 in each layer:
+  q = 1.0 - np.sum(profiles[state["imetals"]+1], axis=0)
+  profiles[state["iH2"]+1] = ratio * q / (1.0 + ratio)
+  profiles[state["iHe"]+1] =         q / (1.0 + ratio)
+
+
+def integrate(state, spectrum):
+  """
+  Band-integrate a spectrum over the filters and the top-hat bins.
+
+  Parameters:
+  -----------
+  state: Dictionary
+     Forward-model arrays returned by setup().
+  spectrum: 1D float ndarray
+     The transit output spectrum.
+
+  Returns:
+  --------
+  bandflux: 1D float ndarray
+     The band-integrated flux ratio (eclipse) or modulation (transit).
+  """
+  nfilters = len(state["nifilter"])
+  nbins = 0
+  if state["bins"] is not None:
+    nbins = len(state["bins"].meanwn)
+  bandflux = np.zeros(nfilters+nbins, dtype='d')
+  for i in np.arange(nfilters):
+    wnind = state["wnindices"][i]
+    if   state["solution"] == "eclipse":
+      fluxrat = (spectrum[wnind]/state["istarfl"][i]) * state["rprs"]**2
+      bandflux[i] = w.bandintegrate(fluxrat, state["specwn"],
+                                    state["nifilter"][i], wnind)
+    elif state["solution"] == "transit":
+      bandflux[i] = w.bandintegrate(spectrum[wnind], state["specwn"],
+                                    state["nifilter"][i], wnind)
+  if nbins > 0:
+    if   state["solution"] == "eclipse":
+      bandflux[nfilters:] = state["bins"].fluxratio(spectrum, state["rprs"])
+    elif state["solution"] == "transit":
+      bandflux[nfilters:] = state["bins"].integrate(spectrum)
+
+  return bandflux
+
+
+def close():
+  """
+  Free the memory allocated by the transit module of the current process.
+  """
+  trm.free_memory()
+
+
+def credible(spectra, chunk=1000):
+  """
+  Compute the median and the 68% and 95% credible bands of a set of
+  spectra.  The percentiles are computed in wavenumber chunks, so that
+  memory-mapped inputs are never loaded in full.
+
+  Parameters:
+  -----------
+  spectra: 2D float ndarray
+     Array of shape (nsamples, nwave) of spectra.
+  chunk: Integer
+     Number of wavenumber samples processed at once.
+
+  Returns:
+  --------
+  median: 1D float ndarray
+     Median spectrum.
+  low1, hi1: 1D float ndarray
+     Boundaries of the 68% credible band.
+  low2, hi2: 1D float ndarray
+     Boundaries of the 95% credible band.
+  """
+  nwave = np.shape(spectra)[1]
+  bands = np.zeros((5, nwave), np.double)
+  for i in np.arange(0, nwave, chunk):
+    bands[:,i:i+chunk] = np.percentile(spectra[:,i:i+chunk],
+                                       [50.0, 16.0, 84.0, 2.5, 97.5], axis=0)
+  return bands[0], bands[1], bands[2], bands[3], bands[4]
+
+
+def _init(kwargs):
+  """
+  Pool initializer, set up the forward model of a worker process.
+  """
+  global _state
+  _state = setup(**kwargs)
+
+
+def _wavenumber(dummy=None):
+  """
+  Pool task, return the wavenumber array of the spectra.
+  """
+  return _state["specwn"]
+
+
+def _evaluate(args):
+  """
+  Pool task, evaluate the model of one posterior sample.
+  """
+  i, params = args
+  spectrum, bandflux = model(_state, params)
+  return i, spectrum, bandflux
+
+
+def predictive(MCfile, burnin, nsamples, stepsize, params, outdir,
+               nproc=None, **kwargs):
+  """
+  Evaluate the posterior-predictive spectra and band fluxes for a set of
+  thinned posterior samples over a pool of worker processes.
+
+  Parameters:
+  -----------
+  MCfile: String
+     MC3 output file with the chains.
+  burnin: Integer
+     Number of burn-in iterations per chain.
+  nsamples: Integer
+     Number of posterior samples to evaluate.
+  stepsize: 1D float ndarray
+     Parameters stepsize.
+  params: 1D float ndarray
+     Model-fitting parameters.
+  outdir: String
+     Output directory.
+  nproc: Integer
+     Number of worker processes (default: number of CPUs).
+  kwargs: Dictionary
+     Arguments for setup() (tconfig, atmfile, tepfile, PTtype, molfit,
+     filters, kurucz, solution, tint, filter_cache, and bins).
+
+  Returns:
+  --------
+  spectra: 2D float memmap
+     Array of shape (nsamples, nwave) with the spectra, stored in
+     'posterior_spectra.npy'.
+  bandflux: 2D float ndarray
+     Array of shape (nsamples, nfilters+nbins) with the band-integrated
+     fluxes.
+
+  Notes:
+  ------
+  The credible bands of the spectra are saved into 'posterior_bands.npz'
+  (with the wavenumber array, median, and the 68% and 95% boundaries).
+  """
+  if nproc is None:
+    nproc = mpr.cpu_count()
+
+  # Draw the posterior samples:
+  samples  = thin(MCfile, burnin, nsamples, stepsize, params)
+  nsamples = len(samples)
+  np.save(outdir + "posterior_samples.npy", samples)
+  mu.msg(1, "Evaluating {:d} posterior samples with {:d} workers.".
+             format(nsamples, nproc), indent=2)
+
+  # Evaluate the models, write the spectra into a memory-mapped array:
+  pool = mpr.Pool(nproc, _init, (kwargs,))
+  specwn  = pool.apply(_wavenumber)
+  spectra = np.lib.format.open_memmap(outdir + "posterior_spectra.npy",
+                                      mode="w+", shape=(nsamples, len(specwn)))
+  bandflux = None
+  for i, spectrum, bflux in pool.imap_unordered(_evaluate,
+                                                enumerate(samples)):
+    if bandflux is None:
+      bandflux = np.zeros((nsamples, len(bflux)), np.double)
+    spectra [i] = spectrum
+    bandflux[i] = bflux
+  pool.close()
+  pool.join()
+
+  spectra.flush()
+  np.save(outdir + "posterior_bandflux.npy", bandflux)
+
+  # Spectral credible bands:
+  median, low1, hi1, low2, hi2 = credible(spectra)
+  np.savez(outdir + "posterior_bands.npz", specwn=specwn, median=median,
+           low1=low1, hi1=hi1, low2=low2, hi2=hi2)
+
+  return spectra, bandflux
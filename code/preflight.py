@@ -0,0 +1,255 @@
+# ****************************** START LICENSE *******************************
+# Bayesian Atmospheric Radiative Transfer (BART), a code to infer
+# properties of planetary atmospheres based on observed spectroscopic
+# information.
+# 
+# This project was completed with the support of the NASA Planetary
+# Atmospheres Program, grant NNX12AI69G, held by Principal Investigator
+# Joseph Harrington. Principal developers included graduate students
+# Patricio E. Cubillos and Jasmina Blecic, programmer Madison Stemm, and
+# undergraduates M. Oliver Bowman and Andrew S. D. Foster.  The included
+# 'transit' radiative transfer code is based on an earlier program of
+# the same name written by Patricio Rojo (Univ. de Chile, Santiago) when
+# he was a graduate student at Cornell University under Joseph
+# Harrington.  Statistical advice came from Thomas J. Loredo and Nate
+# B. Lust.
+# 
+# Copyright (C) 2015 University of Central Florida.  All rights reserved.
+# 
+# This is a test version only, and may not be redistributed to any third
+# party.  Please refer such requests to us.  This program is distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+# 
+# Our intent is to release this software under an open-source,
+# reproducible-research license, once the code is mature and the first
+# research paper describing the code has been accepted for publication
+# in a peer-reviewed journal.  We are committed to development in the
+# open, and have posted this code on github.com so that others can test
+# it and give us feedback.  However, until its first publication and
+# first stable release, we do not permit others to redistribute the code
+# in either original or modified form, nor to publish work based in
+# whole or in part on the output of this code.  By downloading, running,
+# or modifying this code, you agree to these conditions.  We do
+# encourage sharing any modifications with us and discussing them
+# openly.
+# 
+# We welcome your feedback, but do not guarantee support.  Please send
+# feedback or inquiries to:
+# 
+# Joseph Harrington <jh@physics.ucf.edu>
+# Patricio Cubillos <pcubillos@fulbrightmail.org>
+# Jasmina Blecic <jasmina@physics.ucf.edu>
+# 
+# or alternatively,
+# 
+# Joseph Harrington, Patricio Cubillos, and Jasmina Blecic
+# UCF PSB 441
+# 4111 Libra Drive
+# Orlando, FL 32816-2385
+# USA
+# 
+# Thank you for testing BART!
+# ******************************* END LICENSE *******************************
+
+"""
+Preflight validation of a BART configuration: fast checks of the input
+files and of the consistency of the arguments, run before any stage so
+that a run does not fail after hours of TEA, opacity, or MCMC.
+
+Functions
+---------
+check:
+     Validate the BART arguments.
+specrange:
+     Wavenumber range of the transit spectrum.
+"""
+
+import os, sys
+import numpy as np
+
+import makecfg as mc
+import makeatm as mat
+import wine    as w
+
+filedir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(filedir + "/../modules/MCcubed/src/")
+import mcutils as mu
+
+# Number of PT-profile parameters per model:
+nPTpars = {"line":[5], "madhu":[5, 6]}
+
+
+def check(args, cfile):
+  """
+  Validate the BART arguments.
+
+  Parameters:
+  -----------
+  args: Namespace
+     The BART arguments (from BART.parse()).
+  cfile: String
+     The BART configuration file.
+
+  Returns:
+  --------
+  errors: List of strings
+     Description of each problem found (empty if none).
+  """
+  errors = []
+  config = mc.read(cfile)
+
+  def readable(filename, description):
+    """Check that a file exists and can be read."""
+    if not os.path.isfile(filename):
+      errors.append("{:s} '{:s}' not found.".format(description, filename))
+    elif not os.access(filename, os.R_OK):
+      errors.append("{:s} '{:s}' is not readable.".format(description,
+                                                          filename))
+    else:
+      return True
+    return False
+
+  # Input files:
+  if args.tep_name is None:
+    errors.append("No TEP file (tep_name) given.")
+  else:
+    readable(args.tep_name, "TEP file")
+  if args.kurucz is not None:
+    readable(args.kurucz, "Kurucz file")
+  filters = []
+  if args.filter is not None:
+    filters = [f for f in args.filter if readable(f, "Filter file")]
+  for key in ["linedb", "cia", "molfile"]:
+    for filename in config.get(key, "").split():
+      readable(filename, "Transit {:s} file".format(key))
+  atmgiven = args.atmfile is not None and os.path.isfile(args.atmfile)
+  if not atmgiven and args.abun_basic is not None:
+    readable(args.abun_basic, "Elemental abundances file")
+  if args.func is not None and len(args.func) >= 3:
+    if not os.path.isdir(args.func[2]):
+      errors.append("Fitting-function folder '{:s}' not found.".
+                    format(args.func[2]))
+
+  # Parameter arrays:
+  params = args.params
+  if params is None:
+    errors.append("No fitting parameters (params) given.")
+    params = []
+  # Only the free parameters (stepsize > 0) must lie within the limits:
+  free = np.ones(len(params), bool)
+  for key in ["stepsize", "pmin", "pmax"]:
+    if key in config:
+      values = mu.parray(config[key])
+      if len(values) != len(params):
+        errors.append("Number of {:s} values ({:d}) does not match the "
+                      "number of params ({:d}).".format(key, len(values),
+                                                        len(params)))
+      elif key == "stepsize":
+        free = np.asarray(values) > 0
+      elif key == "pmin" and np.any((np.asarray(params) < values)[free]):
+        errors.append("Initial free params are below pmin.")
+      elif key == "pmax" and np.any((np.asarray(params) > values)[free]):
+        errors.append("Initial free params are above pmax.")
+
+  # Molecules fit:
+  molfit = args.molfit
+  if molfit is None:
+    molfit = []
+  nPT = len(params) - len(molfit)
+  if args.PTtype in nPTpars and len(params) > 0 and \
+     nPT not in nPTpars[args.PTtype]:
+    errors.append("params has {:d} PT parameters for the '{:s}' PT model "
+                  "(expected {}).".format(nPT, args.PTtype,
+                   " or ".join([str(n) for n in nPTpars[args.PTtype]])))
+  if atmgiven:
+    species = mat.readatm(args.atmfile)[0]
+  else:
+    species = [spec.partition("_")[0] for spec in args.out_spec.split()]
+  for mol in molfit:
+    if mol not in species:
+      errors.append("molfit species '{:s}' is not in the atmospheric "
+                    "species ({:s}).".format(mol, " ".join(species)))
+
+  # Temperature boundaries within the opacity grid:
+  if "tlow" in config and float(config["tlow"]) > args.Tmin:
+    errors.append("Tmin ({:.1f} K) is below the opacity-grid tlow ({:s} K).".
+                  format(args.Tmin, config["tlow"]))
+  if "thigh" in config and float(config["thigh"]) < args.Tmax:
+    errors.append("Tmax ({:.1f} K) is above the opacity-grid thigh "
+                  "({:s} K).".format(args.Tmax, config["thigh"]))
+  if args.Tmin >= args.Tmax:
+    errors.append("Tmin is not lower than Tmax.")
+
+  # Top-hat bins:
+  edges = None
+  if args.bins is None and args.binres is not None:
+    if args.binrange is None or len(args.binrange) != 2:
+      errors.append("binres requires a two-value binrange (microns).")
+    elif args.binres <= 0.5 or args.binrange[0] >= args.binrange[1]:
+      errors.append("Invalid binres ({:g}) or binrange ({:g} - {:g} um).".
+                    format(args.binres, args.binrange[0], args.binrange[1]))
+    else:
+      edges = w.readbins(None, args.binres, args.binrange)
+  elif args.bins is not None:
+    edges = w.readbins(args.bins)
+    if len(edges) < 2 or np.any(np.diff(edges) <= 0):
+      errors.append("The bin edges must be at least two increasing "
+                    "wavelengths.")
+      edges = None
+  nbins = 0 if edges is None else len(edges) - 1
+
+  # Data and uncertainties per filter and bin:
+  nbands = len(args.filter or []) + nbins
+  for key in ["data", "uncert"]:
+    values = getattr(args, key)
+    if values is not None and len(values) != nbands:
+      errors.append("Number of {:s} values ({:d}) does not match the "
+                    "number of filters and bins ({:d}).".format(key,
+                                                  len(values), nbands))
+
+  # Filters within the spectrum wavenumber range:
+  wnrange = specrange(config)
+  if wnrange is not None:
+    for filename in filters:
+      filtwn, filttr = w.readfilter(filename)
+      if filtwn[0] < wnrange[0] or filtwn[-1] > wnrange[1]:
+        errors.append("Filter '{:s}' ({:.2f} - {:.2f} cm-1) is outside the "
+                      "spectrum wavenumber range ({:.2f} - {:.2f} cm-1).".
+                      format(filename, filtwn[0], filtwn[-1], wnrange[0],
+                             wnrange[1]))
+    if edges is not None and (1e4/edges[-1] < wnrange[0] or
+                              1e4/edges[0]  > wnrange[1]):
+      errors.append("The bins ({:.2f} - {:.2f} cm-1) are outside the "
+                    "spectrum wavenumber range ({:.2f} - {:.2f} cm-1).".
+                    format(1e4/edges[-1], 1e4/edges[0], wnrange[0],
+                           wnrange[1]))
+
+  # Resuming needs a checkpointed MCMC:
+  if args.resume and (args.checkpoint_iter is None and
+                      args.checkpoint_time is None):
+    errors.append("--resume requires checkpoint_iter or checkpoint_time.")
+  return errors
+
+
+def specrange(config):
+  """
+  Wavenumber range (cm-1) of the transit spectrum from the BART
+  configuration (wnlow/wnhigh, or else wllow/wlhigh), or None if not
+  set.
+  """
+  wnfct = float(config.get("wnfct", 1.0))
+  wlfct = float(config.get("wlfct", 1.0))
+  wnlow, wnhigh = None, None
+  if "wnlow" in config:
+    wnlow  = float(config["wnlow"])  * wnfct
+  elif "wlhigh" in config:
+    wnlow  = 1.0 / (float(config["wlhigh"]) * wlfct)
+  if "wnhigh" in config:
+    wnhigh = float(config["wnhigh"]) * wnfct
+  elif "wllow" in config:
+    wnhigh = 1.0 / (float(config["wllow"])  * wlfct)
+  if wnlow is None or wnhigh is None:
+    return None
+  return wnlow, wnhigh
@@ -115,8 +115,12 @@ class File:
 
   def __init__(self, file):
     # List for the parameter and values
-    self.params = np.array([])       
+    self.params = []
     self.values = []
+    # Position of each parameter in params/values, and the cache of the
+    # already-evaluated values:
+    self.index = {}
+    self.cache = {}
 
     # Read the file
     file = open(file, 'r')
@@ -130,8 +134,19 @@ class File:
         line = line.strip()
 
       if len(line) > 0:
-        self.params = np.append(self.params, line.split()[0])
-        self.values.append( np.array(line.split()[1:]) )
+        fields = line.split()
+        # A repeated parameter takes its last definition:
+        self.index[fields[0]] = len(self.params)
+        self.params.append(fields[0])
+        self.values.append(np.array(fields[1:]))
+    self.params = np.array(self.params)
+
+
+  def listparams(self):
+    '''
+    Return the list of parameter names (in the order of the file).
+    '''
+    return list(self.params)
 
 
   def evaluate(self, value):
@@ -154,8 +169,7 @@ class File:
     If not, returns NaN.
     '''
     try:
-      id = np.where(self.params == par)[0]
-      value = self.values[id]
+      value = self.values[self.index[par]]
       return value[0] if value.size == 1 else value
     except:
       return np.nan
@@ -165,6 +179,26 @@ class File:
     '''
     Get the values of a parameter, if it has more than one value, 
     returns an array, if not, returns the value.
+    Each parameter is evaluated only once, later calls return the
+    cached values.
+    '''
+    try:
+      value = self.cache[par]
+    except (KeyError, TypeError):
+      value = self.parsevalue(par)
+      try:
+        self.cache[par] = value
+      except TypeError:
+        pass
+    # Return a copy, so the callers cannot modify the cache:
+    if isinstance(value, np.ndarray):
+      return np.copy(value)
+    return value
+
+
+  def parsevalue(self, par):
+    '''
+    Evaluate the values of a parameter (see getvalue).
     '''
     val = self.checkpar(par)
     if val is np.nan:
@@ -1,8 +1,9 @@
 # This wonderful piece of code reads the output modulation spectrum
 # of a transit run and plots it.
 
+import os
 import numpy as np
-import matplotlib.pyplot as plt
+import plots
 
 tfile = 'atmredo01_outp0.dat'
 
@@ -11,6 +12,7 @@ def readplot(tfile, wn=True, fid=0):
   Read transit's output and plot it.
   """
   wave, spectrum = readspectrum(tfile, wn)
+  plt = plots.pyplot()
   plt.figure(fid)
   plt.clf()
   plt.plot(wave, spectrum)
@@ -19,6 +21,14 @@ def readplot(tfile, wn=True, fid=0):
   return wave, spectrum
 
 
+def binfile(tfile):
+  """
+  Name of the binary (npz) version of a spectrum file: the ASCII file
+  name with its extension replaced by '.npz'.
+  """
+  return os.path.splitext(tfile)[0] + ".npz"
+
+
 def readspectrum(tfile, wn=True):
   """
   Read transit's output spectrum.
@@ -26,7 +36,9 @@ def readspectrum(tfile, wn=True):
   Parameters:
   -----------
   tfile: String
-     Path to output Transit spectrum file to read.
+     Path to output Transit spectrum file to read.  If tfile is a '.npz'
+     file, or its binary version (see binfile) exists and is not older
+     than tfile, read the binary file instead.
   wn: Boolean
      If True convert wavelength to wavenumber.
 
@@ -34,30 +46,96 @@ def readspectrum(tfile, wn=True):
   ---------------------
   2014-12-16  patricio  Initial version.
   """
-  f = open(tfile, "r")
+  # Binary spectrum:
+  bfile = binfile(tfile)
+  if tfile.endswith(".npz") or (os.path.isfile(bfile) and
+          (not os.path.isfile(tfile) or
+           os.path.getmtime(bfile) >= os.path.getmtime(tfile))):
+    spec = np.load(bfile)
+    specwn, spectrum = spec["specwn"], spec["spectrum"]
+    if wn:
+      return specwn, spectrum
+    return 1e4/specwn, spectrum
 
-  # Count number of lines in file:
-  f.seek(0)
-  l = f.readline()  # Ignore first line of comments:
-  ndata = 0
-  for line in f:
-    ndata += 1
-
-  # Initialize arrays:
-  wave     = np.zeros(ndata, np.double)
-  spectrum = np.zeros(ndata, np.double)
-  
-  # Return to begining of file:
+  f = open(tfile, "r")
+  f.readline()  # Ignore first line of comments
+  # Read all the values at once, and reshape into [ndata, ncolumns]:
+  ncol = len(f.readline().split())
   f.seek(0)
   f.readline()
-  i = 0
-  for i in np.arange(ndata):
-    l = f.readline().strip().split()
-    wave    [i] = np.double(l[ 0])
-    spectrum[i] = np.double(l[-1])
-  
+  data = np.array(f.read().split(), np.double).reshape(-1, ncol)
+  f.close()
+
+  wave     = data[:, 0]
+  spectrum = data[:,-1]
+
   # Convert wavelength (micron) to wavenumber (cm-1):
   if wn:
     wave = 1e4/wave
-  
+
   return wave, spectrum
+
+
+def readspectra(tfiles, outfile=None, wn=True):
+  """
+  Read a set of spectra (sampled on the same wavelength array) into a
+  single 2D array.
+
+  Parameters:
+  -----------
+  tfiles: List of strings
+     Spectrum files (ASCII or binary, see readspectrum).
+  outfile: String
+     If not None, store the spectra in a memory-mapped .npy file with
+     this name, instead of in memory.
+  wn: Boolean
+     If True convert wavelength to wavenumber.
+
+  Returns:
+  --------
+  wave: 1D float ndarray
+     Wavenumber (cm-1) or wavelength (micron) array.
+  spectra: 2D float ndarray
+     Spectra of shape [nspectra, nwave].
+  """
+  wave, spectrum = readspectrum(tfiles[0], wn)
+  shape = (len(tfiles), len(wave))
+  if outfile is None:
+    spectra = np.zeros(shape, np.double)
+  else:
+    spectra = np.lib.format.open_memmap(outfile, mode="w+",
+                                        dtype=np.double, shape=shape)
+  spectra[0] = spectrum
+  for i in np.arange(1, len(tfiles)):
+    w, spectrum = readspectrum(tfiles[i], wn)
+    if len(w) != len(wave):
+      raise ValueError("Spectrum '{:s}' has {:d} samples, expected {:d}.".
+                       format(tfiles[i], len(w), len(wave)))
+    spectra[i] = spectrum
+  if outfile is not None:
+    spectra.flush()
+
+  return wave, spectra
+
+
+def writespectrum(tfile, specwn, spectrum, binary=False):
+  """
+  Write a spectrum into a file with the format of transit's output
+  spectrum (readable by readspectrum).
+
+  Parameters:
+  -----------
+  tfile: String
+     Output spectrum file name.
+  specwn: 1D float ndarray
+     Wavenumber array (cm-1).
+  spectrum: 1D float ndarray
+     Spectrum values.
+  binary: Boolean
+     If True, also write the binary version of the spectrum (see binfile).
+  """
+  data = np.column_stack((1e4/np.asarray(specwn), spectrum))
+  np.savetxt(tfile, data, fmt=["%.9f", "%.9e"], delimiter="  ",
+             header="wavelength[um]  flux", comments="#")
+  if binary:
+    np.savez(binfile(tfile), specwn=specwn, spectrum=spectrum)
@@ -0,0 +1,156 @@
+# ****************************** START LICENSE *******************************
+# Bayesian Atmospheric Radiative Transfer (BART), a code to infer
+# properties of planetary atmospheres based on observed spectroscopic
+# information.
+# 
+# This project was completed with the support of the NASA Planetary
+# Atmospheres Program, grant NNX12AI69G, held by Principal Investigator
+# Joseph Harrington. Principal developers included graduate students
+# Patricio E. Cubillos and Jasmina Blecic, programmer Madison Stemm, and
+# undergraduates M. Oliver Bowman and Andrew S. D. Foster.  The included
+# 'transit' radiative transfer code is based on an earlier program of
+# the same name written by Patricio Rojo (Univ. de Chile, Santiago) when
+# he was a graduate student at Cornell University under Joseph
+# Harrington.  Statistical advice came from Thomas J. Loredo and Nate
+# B. Lust.
+# 
+# Copyright (C) 2015 University of Central Florida.  All rights reserved.
+# 
+# This is a test version only, and may not be redistributed to any third
+# party.  Please refer such requests to us.  This program is distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+# 
+# Our intent is to release this software under an open-source,
+# reproducible-research license, once the code is mature and the first
+# research paper describing the code has been accepted for publication
+# in a peer-reviewed journal.  We are committed to development in the
+# open, and have posted this code on github.com so that others can test
+# it and give us feedback.  However, until its first publication and
+# first stable release, we do not permit others to redistribute the code
+# in either original or modified form, nor to publish work based in
+# whole or in part on the output of this code.  By downloading, running,
+# or modifying this code, you agree to these conditions.  We do
+# encourage sharing any modifications with us and discussing them
+# openly.
+# 
+# We welcome your feedback, but do not guarantee support.  Please send
+# feedback or inquiries to:
+# 
+# Joseph Harrington <jh@physics.ucf.edu>
+# Patricio Cubillos <pcubillos@fulbrightmail.org>
+# Jasmina Blecic <jasmina@physics.ucf.edu>
+# 
+# or alternatively,
+# 
+# Joseph Harrington, Patricio Cubillos, and Jasmina Blecic
+# UCF PSB 441
+# 4111 Libra Drive
+# Orlando, FL 32816-2385
+# USA
+# 
+# Thank you for testing BART!
+# ******************************* END LICENSE *******************************
+
+"""
+Planetary-system parameters shared across the BART modules.
+
+Classes:
+--------
+System:
+   Immutable set of the stellar, orbital, and planetary parameters
+   (in MKS units) from a TEP file.
+
+Functions:
+----------
+load:
+   Read (once) the System of a TEP file.
+"""
+
+import os
+import collections
+import threading
+import scipy.constants as sc
+
+import reader    as rd
+import constants as c
+
+# Systems already read, indexed by TEP file path:
+_systems = {}
+_lock    = threading.Lock()
+
+
+class System(collections.namedtuple("System",
+                  "tstar rstar sma rplanet mplanet gstar tepfile")):
+  """
+  Stellar, orbital, and planetary parameters of a planetary system.
+  System is a namedtuple, thus it cannot be modified once created.
+
+  Attributes:
+  -----------
+  tstar: Float
+     Stellar effective temperature (K).
+  rstar: Float
+     Stellar radius (m).
+  sma: Float
+     Orbital semi-major axis (m).
+  rplanet: Float
+     Planetary radius (m).
+  mplanet: Float
+     Planetary mass (kg).
+  gstar: Float
+     Log10 of the stellar surface gravity (cgs units).
+  tepfile: String
+     The TEP file the values came from.
+  """
+  __slots__ = ()
+
+  @property
+  def gplanet(self):
+    """
+    Planetary surface gravity (m s-2).
+    """
+    return sc.G * self.mplanet / self.rplanet**2
+
+  @property
+  def rprs(self):
+    """
+    Planet-to-star radius ratio.
+    """
+    return self.rplanet / self.rstar
+
+
+def load(tep):
+  """
+  Get the System of a TEP file.  The file is read only the first time,
+  later calls return the same (immutable) object.
+
+  Parameters:
+  -----------
+  tep: String or System
+     TEP file name.  If tep is already a System, return it as is.
+
+  Returns:
+  --------
+  system: System
+     The planetary-system parameters.
+  """
+  if isinstance(tep, System):
+    return tep
+
+  tepfile = os.path.realpath(tep)
+  # Re-read the file if it changed:
+  key = tepfile, os.path.getmtime(tepfile)
+  with _lock:
+    if key not in _systems:
+      tep = rd.File(tepfile)
+      _systems[key] = System(
+               tstar   = float(tep.getvalue('Ts')[0]),
+               rstar   = float(tep.getvalue('Rs')[0]) * c.Rsun,
+               sma     = float(tep.getvalue( 'a')[0]) * sc.au,
+               rplanet = float(tep.getvalue('Rp')[0]) * c.Rjup,
+               mplanet = float(tep.getvalue('Mp')[0]) * c.Mjup,
+               gstar   = float(tep.getvalue('loggstar')[0]),
+               tepfile = tepfile)
+    return _systems[key]
@@ -0,0 +1,197 @@
+# ****************************** START LICENSE *******************************
+# Bayesian Atmospheric Radiative Transfer (BART), a code to infer
+# properties of planetary atmospheres based on observed spectroscopic
+# information.
+# 
+# This project was completed with the support of the NASA Planetary
+# Atmospheres Program, grant NNX12AI69G, held by Principal Investigator
+# Joseph Harrington. Principal developers included graduate students
+# Patricio E. Cubillos and Jasmina Blecic, programmer Madison Stemm, and
+# undergraduates M. Oliver Bowman and Andrew S. D. Foster.  The included
+# 'transit' radiative transfer code is based on an earlier program of
+# the same name written by Patricio Rojo (Univ. de Chile, Santiago) when
+# he was a graduate student at Cornell University under Joseph
+# Harrington.  Statistical advice came from Thomas J. Loredo and Nate
+# B. Lust.
+# 
+# Copyright (C) 2015 University of Central Florida.  All rights reserved.
+# 
+# This is a test version only, and may not be redistributed to any third
+# party.  Please refer such requests to us.  This program is distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+# 
+# Our intent is to release this software under an open-source,
+# reproducible-research license, once the code is mature and the first
+# research paper describing the code has been accepted for publication
+# in a peer-reviewed journal.  We are committed to development in the
+# open, and have posted this code on github.com so that others can test
+# it and give us feedback.  However, until its first publication and
+# first stable release, we do not permit others to redistribute the code
+# in either original or modified form, nor to publish work based in
+# whole or in part on the output of this code.  By downloading, running,
+# or modifying this code, you agree to these conditions.  We do
+# encourage sharing any modifications with us and discussing them
+# openly.
+# 
+# We welcome your feedback, but do not guarantee support.  Please send
+# feedback or inquiries to:
+# 
+# Joseph Harrington <jh@physics.ucf.edu>
+# Patricio Cubillos <pcubillos@fulbrightmail.org>
+# Jasmina Blecic <jasmina@physics.ucf.edu>
+# 
+# or alternatively,
+# 
+# Joseph Harrington, Patricio Cubillos, and Jasmina Blecic
+# UCF PSB 441
+# 4111 Libra Drive
+# Orlando, FL 32816-2385
+# USA
+# 
+# Thank you for testing BART!
+# ******************************* END LICENSE *******************************
+
+"""
+Reader of the whitespace-separated tables used by BART (filter
+bandpasses, elemental abundances, pressure layers), and writer of the
+fixed-width data rows of the atmospheric files.
+
+Functions:
+----------
+read:
+   Read (once) the columns of a table file into a structured array.
+clear:
+   Empty the cache of tables already read.
+writerows:
+   Write the rows of a 2D array with a fixed-width row format.
+"""
+
+import os
+import threading
+import numpy as np
+
+# Tables already read, indexed by file path, modification time, and
+# columns:
+_tables = {}
+_lock   = threading.Lock()
+
+
+def read(filename, names, formats, usecols=None, skiprows=0):
+  """
+  Read a whitespace-separated table into a structured array.  Text
+  after a '#' character and empty lines are ignored.  The file is
+  parsed only the first time (or when it changes), later calls return
+  a copy of the cached table.  A row without the columns read raises a
+  ValueError that gives the file name and line number.
+
+  Parameters:
+  -----------
+  filename: String
+     Table file name.
+  names: List of strings
+     Name of each column read.
+  formats: List of dtypes
+     Data type of each column read.
+  usecols: List of integers
+     Indices of the file columns read (default: the first len(names)).
+     Other columns are ignored.
+  skiprows: Integer
+     Number of (non-comment) header lines to skip.
+
+  Returns:
+  --------
+  table: 1D structured ndarray
+     The table, with a field per column.
+
+  Examples:
+  ---------
+  >>> import table as tb
+  >>> press = tb.read("atm.pres", ["layer", "pressure"], [int, float],
+  >>>                 skiprows=1)["pressure"]
+  """
+  if usecols is None:
+    usecols = np.arange(len(names))
+  path = os.path.realpath(filename)
+  key = (path, os.path.getmtime(path), tuple(names),
+         tuple([np.dtype(fmt).str for fmt in formats]), tuple(usecols),
+         skiprows)
+  with _lock:
+    if key not in _tables:
+      _tables[key] = _parse(path, names, formats, usecols, skiprows)
+    return np.copy(_tables[key])
+
+
+def _parse(filename, names, formats, usecols, skiprows):
+  """
+  Parse a table file (see read()).
+  """
+  f = open(filename, "r")
+  text = f.read()
+  f.close()
+
+  # Strip the comments, drop the empty lines and the header (keep the
+  # line numbers for the error messages):
+  lines = [(i+1, line.partition("#")[0])
+           for i, line in enumerate(text.splitlines())]
+  lines = [(i, line) for i, line in lines if line.strip()][skiprows:]
+
+  table = np.zeros(len(lines), dtype=zip(names, formats))
+  if len(lines) == 0:
+    return table
+  # Every row must have the columns read:
+  counts = np.array([len(line.split()) for i, line in lines])
+  nread  = np.amax(usecols) + 1
+  short  = np.where(counts < nread)[0]
+  if len(short) > 0:
+    i, line = lines[short[0]]
+    raise ValueError("Line {:d} of '{:s}' has {:d} fields, expected at "
+                     "least {:d}.".format(i, filename, counts[short[0]], nread))
+
+  # Split all the rows at once if they have the same number of fields;
+  # otherwise, split row by row:
+  lines = [line for i, line in lines]
+  ncols = counts[0]
+  if np.all(counts == ncols):
+    fields = np.array(" ".join(lines).split())
+    fields = np.reshape(fields, (len(lines), ncols))[:,usecols]
+  else:
+    fields = np.array([line.split()[:nread] for line in lines])[:,usecols]
+
+  for i in np.arange(len(names)):
+    table[names[i]] = fields[:,i].astype(formats[i])
+  return table
+
+
+def clear():
+  """
+  Empty the cache of tables already read.
+  """
+  with _lock:
+    _tables.clear()
+
+
+def writerows(fout, data, fmt, chunk=1024):
+  """
+  Write the rows of a 2D array into an open file.  Rather than one
+  formatting operation per value, each block of chunk rows is rendered
+  with a single string-formatting call, and written at once.  The
+  output is identical to writing fmt % tuple(row) for each row.
+
+  Parameters:
+  -----------
+  fout: File object
+     Open file where to write.
+  data: 2D ndarray
+     Table of shape [nrows, ncolumns].
+  fmt: String
+     Format of a row, with one conversion per column (and the end of
+     line), e.g., '%10.4e %7.2f\\n'.
+  chunk: Integer
+     Number of rows rendered per block.
+  """
+  data = np.asarray(data)
+  for i in np.arange(0, len(data), chunk):
+    block = data[i:i+chunk]
+    fout.write((fmt * len(block)) % tuple(block.ravel().tolist()))
@@ -0,0 +1,424 @@
+# ****************************** START LICENSE *******************************
+# Bayesian Atmospheric Radiative Transfer (BART), a code to infer
+# properties of planetary atmospheres based on observed spectroscopic
+# information.
+# 
+# This project was completed with the support of the NASA Planetary
+# Atmospheres Program, grant NNX12AI69G, held by Principal Investigator
+# Joseph Harrington. Principal developers included graduate students
+# Patricio E. Cubillos and Jasmina Blecic, programmer Madison Stemm, and
+# undergraduates M. Oliver Bowman and Andrew S. D. Foster.  The included
+# 'transit' radiative transfer code is based on an earlier program of
+# the same name written by Patricio Rojo (Univ. de Chile, Santiago) when
+# he was a graduate student at Cornell University under Joseph
+# Harrington.  Statistical advice came from Thomas J. Loredo and Nate
+# B. Lust.
+# 
+# Copyright (C) 2015 University of Central Florida.  All rights reserved.
+# 
+# This is a test version only, and may not be redistributed to any third
+# party.  Please refer such requests to us.  This program is distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+# 
+# Our intent is to release this software under an open-source,
+# reproducible-research license, once the code is mature and the first
+# research paper describing the code has been accepted for publication
+# in a peer-reviewed journal.  We are committed to development in the
+# open, and have posted this code on github.com so that others can test
+# it and give us feedback.  However, until its first publication and
+# first stable release, we do not permit others to redistribute the code
+# in either original or modified form, nor to publish work based in
+# whole or in part on the output of this code.  By downloading, running,
+# or modifying this code, you agree to these conditions.  We do
+# encourage sharing any modifications with us and discussing them
+# openly.
+# 
+# We welcome your feedback, but do not guarantee support.  Please send
+# feedback or inquiries to:
+# 
+# Joseph Harrington <jh@physics.ucf.edu>
+# Patricio Cubillos <pcubillos@fulbrightmail.org>
+# Jasmina Blecic <jasmina@physics.ucf.edu>
+# 
+# or alternatively,
+# 
+# Joseph Harrington, Patricio Cubillos, and Jasmina Blecic
+# UCF PSB 441
+# 4111 Libra Drive
+# Orlando, FL 32816-2385
+# USA
+# 
+# Thank you for testing BART!
+# ******************************* END LICENSE *******************************
+
+"""
+Run TEA in parallel, by splitting the layers of the pre-atmospheric
+file into chunks that run as independent TEA calls (each in its own
+working directory), and merging the chunk outputs in layer order.
+A layer cache keeps the TEA output of each layer, so that later runs
+send only the new or changed layers to TEA.
+
+The pre-atmospheric and TEA files have a header (comments, #SPECIES,
+#TEADATA, and the columns' labels) followed by one data line per layer.
+
+Functions
+---------
+readlines:
+     Split a pre-atmospheric or TEA file into header and data lines.
+splitlayers:
+     Split the layers into contiguous chunks.
+merge:
+     Merge TEA files of consecutive layer chunks.
+compare:
+     Compare two TEA files.
+run:
+     Run TEA over a pre-atmospheric file, with parallel TEA calls.
+
+Classes
+-------
+Cache:
+     A directory of TEA outputs per layer.
+"""
+
+import os, sys, shutil, hashlib, subprocess
+import numpy as np
+
+import makecfg  as mc
+import makeatm  as mat
+import pipeline as pl
+
+filedir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(filedir + "/../modules/MCcubed/src/")
+import mcutils as mu
+
+# TEA arguments that determine the output abundances:
+tea_args = ["maxiter", "location_TEA"]
+# Significant digits of the layers' values in the cache keys:
+cache_digits = 8
+
+
+def readlines(filename):
+  """
+  Split a pre-atmospheric or TEA file into header and data lines.
+
+  Returns:
+  --------
+  header: List of strings
+     Lines up to the columns' labels (the line after #TEADATA).
+  data: List of strings
+     One line per layer.
+  """
+  f = open(filename, "r")
+  lines = f.readlines()
+  f.close()
+  start = [line.strip() for line in lines].index("#TEADATA") + 2
+  return lines[:start], [line for line in lines[start:] if line.strip()]
+
+
+def splitlayers(nlayers, nchunks):
+  """
+  Split nlayers layers into (at most nchunks) contiguous chunks.
+
+  Returns:
+  --------
+  chunks: List of 1D integer ndarrays
+     Layer indices of each chunk.
+  """
+  nchunks = int(np.clip(nchunks, 1, nlayers))
+  return np.array_split(np.arange(nlayers), nchunks)
+
+
+def merge(chunkfiles, teafile):
+  """
+  Merge TEA files of consecutive layer chunks into a single TEA file.
+
+  Parameters:
+  -----------
+  chunkfiles: List of strings
+     TEA files, sorted by layer.
+  teafile: String
+     Output TEA file.
+  """
+  header, data = readlines(chunkfiles[0])
+  for chunkfile in chunkfiles[1:]:
+    head, rows = readlines(chunkfile)
+    # The chunks must have the same columns (species):
+    if head[-1] != header[-1]:
+      mu.error("TEA chunk '{:s}' does not match the species of '{:s}'.".
+               format(chunkfile, chunkfiles[0]))
+    data += rows
+
+  outdir = os.path.dirname(os.path.realpath(teafile))
+  if not os.path.isdir(outdir):
+    os.makedirs(outdir)
+  f = open(teafile, "w")
+  f.writelines(header + data)
+  f.close()
+
+
+def compare(teafile, reference, rtol=1e-10):
+  """
+  Compare two TEA files.
+
+  Returns:
+  --------
+  equal: Bool
+     True if the species, pressures, and temperatures are identical,
+     and the abundances agree within rtol.
+  """
+  atm1, atm2 = mat.readatm(teafile), mat.readatm(reference)
+  if list(atm1[0]) != list(atm2[0]):
+    return False
+  for i in [1, 2, 3]:
+    if np.shape(atm1[i]) != np.shape(atm2[i]):
+      return False
+  return (np.array_equal(atm1[1], atm2[1]) and
+          np.array_equal(atm1[2], atm2[2]) and
+          np.allclose(atm1[3], atm2[3], rtol=rtol, atol=0.0))
+
+
+def run(preatm_file, cfile, TEAdir, outdir, nchunks=1, verify=False,
+        cache=None):
+  """
+  Run TEA over the layers of a pre-atmospheric file, with nchunks
+  concurrent TEA calls over contiguous chunks of layers, and merge
+  their outputs into outdir/TEA/results/TEA.tea.
+
+  Parameters:
+  -----------
+  preatm_file: String
+     Pre-atmospheric file (from makeatm.make_preatm).
+  cfile: String
+     BART configuration file.
+  TEAdir: String
+     Default TEA directory.
+  outdir: String
+     Output directory.
+  nchunks: Integer
+     Number of layer chunks (and concurrent TEA calls).
+  verify: Bool
+     If True, also run TEA over all the layers at once and check that
+     the merged output matches it.
+  cache: String
+     If not None, the TEA layer-cache directory (see Cache): take the
+     cached layers from it, and run TEA only over the other layers.
+
+  Returns:
+  --------
+  code: Integer
+     Non-zero if any TEA call failed.
+  """
+  if cache is not None:
+    return Cache(cache).run(preatm_file, cfile, TEAdir, outdir, nchunks,
+                            verify)
+
+  TEAcall = TEAdir + "tea/runatm.py"
+  teafile = os.path.join(outdir, "TEA", "results", "TEA.tea")
+  header, data = readlines(preatm_file)
+  chunks = splitlayers(len(data), nchunks)
+  if len(chunks) == 1 and not verify:
+    # Generate the TEA configuration file:
+    mc.makeTEA(cfile, TEAdir, outdir)
+    # Call TEA (from outdir) to calculate the atmospheric file:
+    mu.msg(1, "\nExecute TEA:")
+    return pl.call([TEAcall, os.path.realpath(preatm_file), "TEA"],
+                   cwd=outdir)
+
+  # Working directory (TEA configuration, pre-atmospheric, and output
+  # files) of each chunk, and of the serial reference:
+  chunkdir = os.path.join(outdir, "TEA_chunks")
+  workdirs, preatms = [], []
+  for i in np.arange(len(chunks)):
+    workdirs.append(os.path.join(chunkdir, "chunk{:02d}".format(i)))
+    preatms.append(os.path.join(workdirs[i], "chunk{:02d}.atm".format(i)))
+  if verify:
+    workdirs.append(os.path.join(chunkdir, "serial"))
+    preatms.append(os.path.realpath(preatm_file))
+  for i in np.arange(len(workdirs)):
+    if not os.path.isdir(workdirs[i]):
+      os.makedirs(workdirs[i])
+    mc.makeTEA(cfile, TEAdir, workdirs[i])
+  for i in np.arange(len(chunks)):
+    f = open(preatms[i], "w")
+    f.writelines(header + [data[j] for j in chunks[i]])
+    f.close()
+
+  # Run TEA for all chunks at once:
+  mu.msg(1, "\nExecute TEA in {:d} layer chunks:".format(len(chunks)))
+  procs = [subprocess.Popen([TEAcall, preatms[i], "TEA"], cwd=workdirs[i])
+           for i in np.arange(len(workdirs))]
+  codes = [pl.wait(proc, [TEAcall, preatm, "TEA"])
+           for proc, preatm in zip(procs, preatms)]
+  if np.any(codes):
+    mu.msg(1, "TEA exit codes: {}.".format(codes), indent=2)
+    # Exit code of the first failed chunk:
+    return [code for code in codes if code][0]
+
+  results = [os.path.join(workdir, "TEA", "results", "TEA.tea")
+             for workdir in workdirs]
+  merge(results[:len(chunks)], teafile)
+  mu.msg(1, "Merged the TEA chunks into '{:s}'.".format(teafile), indent=2)
+  if verify:
+    if not compare(teafile, results[-1]):
+      mu.error("Merged TEA output differs from the serial reference.")
+    mu.msg(1, "Merged TEA output matches the serial reference.", indent=2)
+  shutil.rmtree(chunkdir)
+  return 0
+
+
+class Cache(object):
+  """
+  A directory of TEA outputs per layer, shared by BART runs.
+
+  The outputs of each set of input elements, output species, and TEA
+  arguments go into a sub-directory (named by their SHA-1 hash), which
+  holds the header of the TEA file and one file per layer with its TEA
+  data line, named by the hash of the layer's pressure, temperature,
+  and elemental abundances (rounded to cache_digits significant digits).
+
+  Example:
+  --------
+  >>> import teachunks as tc
+  >>> cache = tc.Cache("/data/tea_cache")
+  >>> cache.run("outdir/elem.atm", "BART.cfg", TEAdir, "outdir/", nchunks=4)
+  """
+  def __init__(self, root):
+    """
+    Parameters:
+    -----------
+    root: String
+       Cache directory (created if it does not exist).
+    """
+    self.root = os.path.realpath(root)
+    if not os.path.isdir(self.root):
+      try:
+        os.makedirs(self.root)
+      except OSError:
+        if not os.path.isdir(self.root):
+          raise
+
+
+  def setupkey(self, header, cfile, TEAdir):
+    """
+    Hash of the input elements, output species, and TEA arguments.
+
+    Parameters:
+    -----------
+    header: List of strings
+       Header of the pre-atmospheric file (see readlines).
+    cfile: String
+       BART configuration file.
+    TEAdir: String
+       Default TEA directory.
+    """
+    lines = [line.strip() for line in header]
+    species = lines[lines.index("#SPECIES") + 1].split()
+    config  = mc.TEAconfig(cfile, TEAdir)
+    sha = hashlib.sha1()
+    sha.update("species {:s}\n".format(" ".join(species)))
+    sha.update("elements {:s}\n".format(" ".join(lines[-1].split()[2:])))
+    for arg in tea_args:
+      sha.update("{:s} {:s}\n".format(arg, config.get("TEA", arg)))
+    return sha.hexdigest()
+
+
+  def layerkey(self, line):
+    """
+    Hash of the (rounded) values of a pre-atmospheric data line.
+    """
+    values = ["{:.{:d}e}".format(float(value), cache_digits-1)
+              for value in line.split()]
+    return hashlib.sha1(" ".join(values)).hexdigest()
+
+
+  def read(self, setupdir, key):
+    """
+    Read a cache entry, return None if it does not exist.
+    """
+    try:
+      f = open(os.path.join(setupdir, key), "r")
+    except IOError:
+      return None
+    content = f.read()
+    f.close()
+    return content
+
+
+  def write(self, setupdir, key, content):
+    """
+    Write a cache entry (atomically, so that concurrent runs never read
+    an incomplete entry).
+    """
+    entry = os.path.join(setupdir, key)
+    tmpfile = "{:s}.{:d}.tmp".format(entry, os.getpid())
+    f = open(tmpfile, "w")
+    f.write(content)
+    f.close()
+    os.rename(tmpfile, entry)
+
+
+  def run(self, preatm_file, cfile, TEAdir, outdir, nchunks=1, verify=False):
+    """
+    Calculate outdir/TEA/results/TEA.tea for a pre-atmospheric file,
+    running TEA (see run) only over the layers that are not in the
+    cache, and adding them to the cache.
+
+    Returns:
+    --------
+    code: Integer
+       Non-zero if any TEA call failed.
+    """
+    header, data = readlines(preatm_file)
+    setupdir = os.path.join(self.root, self.setupkey(header, cfile, TEAdir))
+    if not os.path.isdir(setupdir):
+      try:
+        os.makedirs(setupdir)
+      except OSError:
+        if not os.path.isdir(setupdir):
+          raise
+
+    keys = [self.layerkey(line) for line in data]
+    teaheader = self.read(setupdir, "header")
+    if teaheader is None:
+      rows = [None] * len(data)
+    else:
+      rows = [self.read(setupdir, key) for key in keys]
+    missing = [i for i in np.arange(len(data)) if rows[i] is None]
+    mu.msg(1, "\nTEA cache: {:d} of {:d} layers cached.".
+              format(len(data)-len(missing), len(data)))
+
+    if len(missing) > 0:
+      # Run TEA over the missing layers:
+      updatedir = os.path.join(outdir, "TEA_update")
+      if not os.path.isdir(updatedir):
+        os.makedirs(updatedir)
+      update_file = os.path.join(updatedir, "update.atm")
+      f = open(update_file, "w")
+      f.writelines(header + [data[i] for i in missing])
+      f.close()
+      code = run(update_file, cfile, TEAdir, updatedir, nchunks, verify)
+      if code:
+        return code
+      head, lines = readlines(os.path.join(updatedir, "TEA", "results",
+                                           "TEA.tea"))
+      if len(lines) != len(missing):
+        mu.error("TEA returned {:d} layers, expected {:d}.".
+                 format(len(lines), len(missing)))
+      # Splice the new layers in and add them to the cache:
+      for i, line in zip(missing, lines):
+        rows[i] = line
+        self.write(setupdir, keys[i], line)
+      teaheader = "".join(head)
+      self.write(setupdir, "header", teaheader)
+      shutil.rmtree(updatedir)
+
+    resultdir = os.path.join(outdir, "TEA", "results")
+    if not os.path.isdir(resultdir):
+      os.makedirs(resultdir)
+    f = open(os.path.join(resultdir, "TEA.tea"), "w")
+    f.write(teaheader)
+    f.writelines(rows)
+    f.close()
+    return 0
@@ -55,8 +55,11 @@
 # Thank you for testing BART!
 # ******************************* END LICENSE *******************************
 
+import os
+import hashlib
 import numpy as np
 import kurucz_inten      as ki
+import table             as tb
 import scipy.constants   as sc
 import scipy.interpolate as si
 
@@ -64,7 +67,10 @@ import scipy.interpolate as si
 WINE: Waveband INtegrated Emission module
 
 This set of routines calculate the integrated emission spectrum of
-a signal over specified filter wavebands.
+a signal over specified filter wavebands.  The FilterBank class holds
+the filters and stellar flux resampled to a spectrum's wavenumber grid.
+The Bins class integrates top-hat bins defined by their edges (or by a
+resolving power, see readbins) without filter files.
 """
 
 def readfilter(filt):
@@ -73,8 +79,7 @@ def readfilter(filt):
 
   Notes:
   ------
-  - The file can contains empty lines and comments (with '#' character)
-    before the data.  No comments or empty lines after the data.
+  - The file can contain empty lines and comments (with '#' character).
   - The data must come in two columns.  The first column must contain
     the wavelength in microns, the second the filter response, other
     columns will be ignored.
@@ -95,23 +100,10 @@ def readfilter(filt):
   2013-01-23  patricio  Initial implementation.   pcubillos@fulbrightmail.org
   2014-03-26  patricio  Changed input to the file name. 
   """
-  # Open and read the filter file:
-  data = open(filt, "r")
-  lines = data.readlines()
-  data.close()
-
-  # Remove header comments and empty lines:
-  while lines[0].startswith("#") or not lines[0].strip():
-    comment = lines.pop(0)
-
-  # Allocate arrays for the wavelength and response:
-  nlines = len(lines)
-  wavel  = np.zeros(nlines, np.double) # filter's wavelengths  (in microns)
-  transm = np.zeros(nlines, np.double) # filter's pass bands
-
-  # Read the data and store in reverse order:
-  for i in np.arange(nlines):
-    wavel[nlines-1-i], transm[nlines-1-i] = lines[i].strip().split()[0:2]
+  # Read the filter file (in reverse order):
+  data = tb.read(filt, ["wavel", "transm"], [np.double, np.double])[::-1]
+  wavel  = data["wavel"]  # filter's wavelengths  (in microns)
+  transm = data["transm"] # filter's pass bands
 
   m2cm  = 1e-4 # Microns to cm conversion factor
   # Get wavenumber in cm-1:
@@ -120,19 +112,26 @@ def readfilter(filt):
   return waven, transm
 
 
-def readkurucz(kfile, temperature, logg):
+def readkurucz(kfile, temperature, logg, interp=False, cachedir=None):
   """
   Load a the Kurucz stellar spectrum with parameters closest to requested
-  temperature and log(g).
+  temperature and log(g), or interpolated to them.
 
   Parameters:
   -----------
   kfile: String
-     Path to the kurucz file.
+     Path to the kurucz file, or to a stellar-model file written by
+     savestellar() (in which case temperature and logg are ignored).
   temperature: Scalar
      Surface temperature in K.
   logg: Scalar
      log10 of surface gravity (g in cgs units).
+  interp: Boolean
+     If True, interpolate the model grid to temperature and logg (see
+     kurucz_inten.gridinterp), else take the nearest model.
+  cachedir: String
+     Directory where to keep a binary (memory-mapped) version of the
+     Kurucz file (see kurucz_inten.load).  If None, parse the file.
 
   Returns:
   --------
@@ -149,21 +148,37 @@ def readkurucz(kfile, temperature, logg):
   ---------------------
   2013-01-23  patricio  Initial implementation.   pcubillos@fulbrightmail.org
   """
-
-  inten, freq, grav, temp, nainten, head = ki.read(kfile, freq=True)
-
-  # Wavenumber in cm^-1
-  starwn = freq / sc.c * 1e-2  
-  
-  # Find the model index with the nearest temp and log(g):
-  # Nearest sampled temperature:
-  tmodel = temp[np.argmin(np.abs(temp-temperature))]
-  # Nearest sampled log(g):
-  gmodel = grav[np.argmin(np.abs(grav-logg))]
-  imodel = np.where((temp == tmodel) & (grav > gmodel))[0][0]
-
-  # Get the stellar flux:
-  starfl = inten[imodel]  # W m^-2 sr^-1 Hz^-1
+  # Pre-selected stellar model:
+  if kfile.endswith(".npz"):
+    model = np.load(kfile)
+    return (model["starfl"], model["starwn"],
+            model["tmodel"][()], model["gmodel"][()])
+
+  # Memory-mapped binary version of the Kurucz file (built the first
+  # time, see kurucz_inten.load), or parse the file if there is no cache
+  # or it cannot be written:
+  try:
+    if cachedir is None:
+      raise IOError("No Kurucz cache directory.")
+    inten, wave, grav, temp, head = ki.load(kfile, cachedir)
+  except (IOError, OSError):
+    inten, wave, grav, temp, nainten, head = ki.read(kfile)
+
+  # Wavenumber in cm^-1 (increasing order)
+  starwn = np.flipud(sc.c / wave) / sc.c * 1e-2
+
+  if interp:
+    tmodel, gmodel = temperature, logg
+    starfl = np.flipud(ki.gridinterp(inten, grav, temp, logg, temperature))
+  else:
+    # Find the model index with the nearest temp and log(g):
+    # Nearest sampled temperature:
+    tmodel = temp[np.argmin(np.abs(temp-temperature))]
+    # Nearest sampled log(g):
+    gmodel = grav[np.argmin(np.abs(grav-logg))]
+    imodel = np.where((temp == tmodel) & (grav > gmodel))[0][0]
+    # Get the stellar flux (in increasing wavenumber order):
+    starfl = np.flipud(np.array(inten[imodel]))  # W m^-2 sr^-1 Hz^-1
 
   # Convert F_freq to F_wavenumber (Hz-1 --> m):
   #   multiply by c.
@@ -178,6 +193,34 @@ def readkurucz(kfile, temperature, logg):
   return starfl, starwn, tmodel, gmodel
 
 
+def savestellar(sfile, kfile, temperature, logg, interp=False,
+                cachedir=None):
+  """
+  Select the Kurucz stellar model closest to the requested temperature
+  and log(g) (or interpolate it), and save it into a (small)
+  stellar-model file, so that readkurucz() does not need to parse the
+  whole Kurucz file again.
+
+  Parameters:
+  -----------
+  sfile: String
+     Output stellar-model file (.npz extension).
+  kfile: String
+     Path to the kurucz file.
+  temperature: Scalar
+     Surface temperature in K.
+  logg: Scalar
+     log10 of surface gravity (g in cgs units).
+  interp: Boolean
+     If True, interpolate the model grid (see readkurucz).
+  cachedir: String
+     Kurucz cache directory (see readkurucz).
+  """
+  starfl, starwn, tmodel, gmodel = readkurucz(kfile, temperature, logg,
+                                              interp, cachedir)
+  np.savez(sfile, starfl=starfl, starwn=starwn, tmodel=tmodel, gmodel=gmodel)
+
+
 def resample(specwn, filterwn, filtertr, starwn, starfl):
   """
   Resample the filtertr curve from the filterwn sampling into specwn
@@ -251,3 +294,310 @@ def bandintegrate(spectrum, specwn, nifilter, wnindices):
   # fratio = Fplanet / Fstar * rprs**2.0
 
   return np.trapz(spectrum*nifilter, specwn[wnindices])
+
+
+def _filekey(filename, maxsize=2**26):
+  """
+  Hash key of a file: its content for files up to maxsize bytes, else
+  its path, size, and modification time.
+  """
+  stat = os.stat(filename)
+  if stat.st_size > maxsize:
+    return "{:s} {:d} {:.6f}".format(os.path.realpath(filename),
+                                     stat.st_size, stat.st_mtime)
+  sha = hashlib.sha1()
+  f = open(filename, "rb")
+  for block in iter(lambda: f.read(2**20), b""):
+    sha.update(block)
+  f.close()
+  return sha.hexdigest()
+
+
+class FilterBank(object):
+  """
+  Filters and stellar flux resampled to a wavenumber grid (see
+  resample()).  A bank is identified by a hash of the wavenumber grid,
+  the filter files, and the stellar model, and can be saved into (and
+  loaded from) a cache directory, so that all MPI ranks, MCMC segments,
+  and runs sharing the directory compute it only once.
+
+  Attributes:
+  -----------
+  nifilter: List of 1D ndarrays
+     Normalized interpolated filters.
+  istarfl: List of 1D ndarrays
+     Stellar flux interpolated over each filter's band.
+  wnindices: List of tuples
+     Indices of the wavenumber grid in each filter's band.
+  meanwn: 1D ndarray
+     Transmission-weighted mean wavenumber of each filter (cm-1).
+  bounds: 2D ndarray
+     Wavenumber boundaries of each filter, shape (nfilters, 2).
+  key: String
+     Hash key of the bank.
+  """
+  def __init__(self, specwn, filters, kurucz, temperature, logg,
+               cachedir=None):
+    """
+    Parameters:
+    -----------
+    specwn: 1D ndarray
+       Wavenumber grid (cm-1) of the spectrum.
+    filters: List of strings
+       Filter files.
+    kurucz: String
+       Kurucz or stellar-model file (see readkurucz).
+    temperature: Scalar
+       Stellar surface temperature (K).
+    logg: Scalar
+       Log10 of the stellar surface gravity (cgs units).
+    cachedir: String
+       Directory where to look for (and save) the bank.  If None, do
+       not cache.
+    """
+    if filters is None:
+      filters = []
+    filters = list(filters)
+    specwn  = np.ascontiguousarray(specwn, np.double)
+
+    sha = hashlib.sha1()
+    for filename in filters + [kurucz]:
+      sha.update(_filekey(filename) + "\n")
+    sha.update("{:.6f} {:.6f}\n".format(temperature, logg))
+    sha.update(specwn.tostring())
+    self.key = sha.hexdigest()
+
+    cachefile = None
+    if cachedir is not None:
+      cachefile = os.path.join(cachedir,
+                               "filterbank_{:s}.npz".format(self.key))
+      if os.path.isfile(cachefile):
+        self.load(cachefile)
+        return
+
+    # Get the stellar model, read and resample the filters:
+    starfl, starwn, tmodel, gmodel = readkurucz(kurucz, temperature, logg)
+    self.nifilter  = []
+    self.istarfl   = []
+    self.wnindices = []
+    self.meanwn    = np.zeros(len(filters))
+    self.bounds    = np.zeros((len(filters), 2))
+    for i in np.arange(len(filters)):
+      filtwaven, filttransm = readfilter(filters[i])
+      self.meanwn[i] = np.sum(filtwaven*filttransm) / np.sum(filttransm)
+      self.bounds[i] = filtwaven[0], filtwaven[-1]
+      nifilt, strfl, wnind = resample(specwn, filtwaven, filttransm,
+                                      starwn, starfl)
+      self.nifilter.append(nifilt)
+      self.istarfl.append(strfl)
+      self.wnindices.append(wnind)
+
+    if cachefile is not None:
+      try:
+        self.save(cachefile)
+      except (IOError, OSError):
+        pass
+
+
+  def load(self, cachefile):
+    """
+    Load the bank from a file written by save().
+    """
+    cache = np.load(cachefile)
+    nfilters = len(cache["meanwn"])
+    self.nifilter  = [cache["nifilter{:d}".format(i)] for i in range(nfilters)]
+    self.istarfl   = [cache["istarfl{:d}".format(i)]  for i in range(nfilters)]
+    self.wnindices = [(cache["wnindices{:d}".format(i)],)
+                      for i in range(nfilters)]
+    self.meanwn    = cache["meanwn"]
+    self.bounds    = cache["bounds"]
+
+
+  def save(self, cachefile):
+    """
+    Save the bank into a file.
+    """
+    arrays = {"meanwn":self.meanwn, "bounds":self.bounds}
+    for i in np.arange(len(self.nifilter)):
+      arrays["nifilter{:d}".format(i)]  = self.nifilter[i]
+      arrays["istarfl{:d}".format(i)]   = self.istarfl[i]
+      arrays["wnindices{:d}".format(i)] = self.wnindices[i][0]
+    cachedir = os.path.dirname(os.path.realpath(cachefile))
+    if not os.path.isdir(cachedir):
+      os.makedirs(cachedir)
+    # Write and rename, so readers never see a partial file:
+    tmpfile = cachefile + ".{:d}.tmp.npz".format(os.getpid())
+    np.savez(tmpfile, **arrays)
+    os.rename(tmpfile, cachefile)
+
+
+def binedges(wlmin, wlmax, resolution):
+  """
+  Wavelength edges of consecutive bins with a constant resolving power
+  (bin center over bin width) between wlmin and wlmax.
+
+  Parameters:
+  -----------
+  wlmin: Float
+     Lower wavelength boundary (microns).
+  wlmax: Float
+     Upper wavelength boundary (microns).
+  resolution: Float
+     Resolving power, lambda/delta-lambda.
+
+  Returns:
+  --------
+  edges: 1D ndarray
+     Bin edges (microns), nbins+1 values.
+  """
+  ratio = (2.0*resolution + 1.0) / (2.0*resolution - 1.0)
+  nbins = int(np.floor(np.log(wlmax/wlmin) / np.log(ratio)))
+  return wlmin * ratio**np.arange(nbins+1)
+
+
+def readbins(bins=None, binres=None, binrange=None):
+  """
+  Bin edges from the configuration: an array of wavelength edges, or a
+  resolving power and wavelength range.
+
+  Parameters:
+  -----------
+  bins: 1D float ndarray
+     Wavelength edges (microns) of consecutive bins.
+  binres: Float
+     Resolving power of the bins (used if bins is None).
+  binrange: 2-element float ndarray
+     Wavelength range (microns) of the binres bins.
+
+  Returns:
+  --------
+  edges: 1D ndarray
+     Bin edges (microns), or None if there are no bins.
+  """
+  if bins is not None:
+    return np.asarray(bins, np.double)
+  if binres is not None:
+    return binedges(binrange[0], binrange[1], binres)
+  return None
+
+
+class Bins(object):
+  """
+  Top-hat spectroscopic bins.  Rather than a filter file per bin, the
+  bins are defined by their wavelength edges, and are integrated with a
+  prefix sum of the trapezoidal integral of the spectrum, so that each
+  bin costs O(1) per spectrum regardless of its width.
+
+  Attributes:
+  -----------
+  edges: 1D ndarray
+     Wavelength edges of the bins (microns).
+  wnlo: 1D ndarray
+     Lower wavenumber boundary of each bin (cm-1).
+  wnhi: 1D ndarray
+     Upper wavenumber boundary of each bin (cm-1).
+  meanwn: 1D ndarray
+     Central wavenumber of each bin (cm-1).
+  starfl: 1D ndarray
+     Stellar flux interpolated on the spectrum wavenumber grid (None if
+     no stellar model was given).
+  """
+  def __init__(self, specwn, edges, kurucz=None, temperature=None,
+               logg=None):
+    """
+    Parameters:
+    -----------
+    specwn: 1D ndarray
+       Wavenumber grid (cm-1) of the spectrum (increasing order).
+    edges: 1D ndarray
+       Wavelength edges of consecutive bins (microns).
+    kurucz: String
+       Kurucz or stellar-model file (see readkurucz), needed to compute
+       flux ratios.
+    temperature: Scalar
+       Stellar surface temperature (K).
+    logg: Scalar
+       Log10 of the stellar surface gravity (cgs units).
+    """
+    self.specwn = np.asarray(specwn, np.double)
+    self.edges  = np.asarray(edges,  np.double)
+    self.wnlo   = 1e4/self.edges[1:]
+    self.wnhi   = 1e4/self.edges[:-1]
+    self.wnlo, self.wnhi = (np.minimum(self.wnlo, self.wnhi),
+                            np.maximum(self.wnlo, self.wnhi))
+    self.meanwn = 0.5*(self.wnlo + self.wnhi)
+    if (np.amin(self.wnlo) < self.specwn[0] or
+        np.amax(self.wnhi) > self.specwn[-1]):
+      raise ValueError("The bins ({:.2f} - {:.2f} cm-1) are outside the "
+                       "spectrum wavenumber range ({:.2f} - {:.2f} cm-1).".
+                       format(np.amin(self.wnlo), np.amax(self.wnhi),
+                              self.specwn[0], self.specwn[-1]))
+
+    # Location of the bin boundaries in the wavenumber grid (index of
+    # the sample to the left, sample spacing, and fractional position):
+    self.ilo, self.hlo, self.tlo = self._locate(self.wnlo)
+    self.ihi, self.hhi, self.thi = self._locate(self.wnhi)
+    self.dwn = np.ediff1d(self.specwn)
+
+    self.starfl = None
+    if kurucz is not None:
+      starfl, starwn, tmodel, gmodel = readkurucz(kurucz, temperature, logg)
+      self.starfl = si.interp1d(starwn, starfl)(self.specwn)
+
+
+  def _locate(self, wn):
+    """
+    Index of the grid sample to the left of each wn, grid spacing, and
+    fractional position of wn in that interval.
+    """
+    index = np.clip(np.searchsorted(self.specwn, wn, "right") - 1,
+                    0, len(self.specwn)-2)
+    step  = self.specwn[index+1] - self.specwn[index]
+    return index, step, (wn - self.specwn[index]) / step
+
+
+  def _cumulative(self, spectrum, cumsum, index, step, frac):
+    """
+    Trapezoidal integral of the (linearly interpolated) spectrum from
+    the first grid sample to the given positions.
+    """
+    left  = spectrum[index]
+    slope = spectrum[index+1] - left
+    return (cumsum[index] +
+            step * (frac*left + 0.5*frac**2.0 * slope))
+
+
+  def integrate(self, spectrum):
+    """
+    Average of a spectrum over each bin.
+
+    Parameters:
+    -----------
+    spectrum: 1D ndarray
+       Spectrum sampled on the specwn grid.
+
+    Returns:
+    --------
+    binflux: 1D ndarray
+       Bin-averaged spectrum.
+    """
+    # Prefix sum of the trapezoidal integral:
+    cumsum = np.zeros(len(spectrum))
+    cumsum[1:] = np.cumsum(0.5*(spectrum[1:]+spectrum[:-1]) * self.dwn)
+    hi = self._cumulative(spectrum, cumsum, self.ihi, self.hhi, self.thi)
+    lo = self._cumulative(spectrum, cumsum, self.ilo, self.hlo, self.tlo)
+    return (hi - lo) / (self.wnhi - self.wnlo)
+
+
+  def fluxratio(self, spectrum, rprs):
+    """
+    Bin-averaged planet-to-star flux ratio (eclipse geometry).
+
+    Parameters:
+    -----------
+    spectrum: 1D ndarray
+       Planetary emission spectrum sampled on the specwn grid.
+    rprs: Float
+       Planet-to-star radius ratio.
+    """
+    return self.integrate(spectrum/self.starfl * rprs**2.0)
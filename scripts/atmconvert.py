@@ -0,0 +1,38 @@
+import sys, os
+import argparse
+
+scriptsdir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptsdir + "/../code")
+import atmbin as ab
+
+
+def main():
+  """
+  Convert an atmospheric file between the text (TEA or transit) and
+  binary formats (see code/atmbin.py).  The direction of the conversion
+  is set by the format of the input file.
+
+  Usage:
+  ------
+  python atmconvert.py input output [--layout tea|transit]
+  """
+  parser = argparse.ArgumentParser(description=main.__doc__,
+                         formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("input",  help="Input atmospheric file")
+  parser.add_argument("output", help="Output atmospheric file")
+  parser.add_argument("--layout", dest="layout", default=None,
+                      choices=("tea", "transit"),
+                      help="Layout of the output text file [default: the "
+                           "layout of the original text file]")
+  args = parser.parse_args()
+
+  if ab.isbinary(args.input):
+    ab.totext(args.input, args.output, args.layout)
+    print("Wrote text atmospheric file '{:s}'.".format(args.output))
+  else:
+    ab.tobinary(args.input, args.output)
+    print("Wrote binary atmospheric file '{:s}'.".format(args.output))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,405 @@
+import sys, os, time, shutil, tempfile, json
+import argparse
+import numpy as np
+import scipy.constants as sc
+
+scriptsdir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptsdir + "/../code")
+# Run the forward model with the pure-NumPy transit stand-in:
+import mocktransit as mt
+sys.modules["transit_module"] = mt
+import PT          as pt
+import posterior   as pp
+import readtransit as rt
+import wine        as w
+import makeatm     as mat
+import makeP       as mp
+
+# Forward-model stages timed at each iteration:
+stages = ["PT", "abundances", "transit", "band", "io", "model"]
+
+
+def makeinputs(outdir, nlayers, nspecies, nfilters, wllow=2.8, wlhigh=11.0):
+  """
+  Write synthetic inputs for the forward model: an atmospheric file,
+  a transit configuration file, a stellar model, and filter files.
+
+  Parameters:
+  -----------
+  outdir: String
+     Directory where to write the files.
+  nlayers: Integer
+     Number of atmospheric layers.
+  nspecies: Integer
+     Number of species (H2, He, and nspecies-2 metals).
+  nfilters: Integer
+     Number of filters, evenly spread over the spectrum.
+  wllow: Float
+     Spectrum lower wavelength boundary (microns).
+  wlhigh: Float
+     Spectrum higher wavelength boundary (microns).
+
+  Returns:
+  --------
+  files: Dictionary
+     The tconfig, atmfile, kurucz (stellar model), and filters file
+     names, and the fitted molecules (molfit).
+  """
+  # Atmospheric file (as written by TEA, without radius):
+  metals = ["H2O", "CH4", "CO", "CO2", "NH3", "C2H2", "C2H4", "HCN"]
+  metals += ["X{:02d}".format(i) for i in np.arange(len(metals), nspecies)]
+  species = ["H2", "He"] + metals[:nspecies-2]
+  pressure = np.logspace(2, -5, nlayers)
+  temp = np.linspace(1800.0, 1000.0, nlayers)
+  abun = np.tile(1e-4, nspecies)
+  abun[1] = 0.15
+  abun[0] = 1.0 - np.sum(abun[1:])
+  atmfile = outdir + "bench.atm"
+  f = open(atmfile, "w")
+  f.write("# Synthetic atmospheric file.\n\n#SPECIES\n{:s}\n\n#TEADATA\n"
+          "#Pressure  Temp  {:s}\n".format(" ".join(species),
+                                            " ".join(species)))
+  for i in np.arange(nlayers):
+    f.write("{:.4e} {:7.2f} {:s}\n".format(pressure[i], temp[i],
+                        " ".join(["{:.4e}".format(a) for a in abun])))
+  f.close()
+
+  # Transit configuration file:
+  tconfig = outdir + "bench_tconfig.cfg"
+  f = open(tconfig, "w")
+  f.write("atm {:s}\nwllow {:.2f}\nwlhigh {:.2f}\nwlfct 1e-4\n"
+          "wndelt 1.0\n".format(atmfile, wllow, wlhigh))
+  f.close()
+
+  # Stellar model (blackbody, in the savestellar format):
+  starwn = np.linspace(0.5e4/wlhigh, 2e4/wllow, 2000)
+  tstar  = 6000.0
+  starfl = (2*np.pi * (sc.h*1e7) * (sc.c*1e2)**2 * starwn**3 /
+            np.expm1((sc.h*sc.c*1e2) * starwn / (sc.k * tstar)))
+  kurucz = outdir + "bench_stellar.npz"
+  np.savez(kurucz, starfl=starfl, starwn=starwn, tmodel=tstar, gmodel=4.5)
+
+  # Filters (Gaussian bandpasses, in microns):
+  filters = []
+  centers = np.linspace(wllow, wlhigh, nfilters+2)[1:-1]
+  width = 0.25 * (wlhigh-wllow) / (nfilters+1)
+  for i in np.arange(nfilters):
+    wl = np.linspace(centers[i]-2*width, centers[i]+2*width, 200)
+    filters.append(outdir + "bench_filter{:02d}.dat".format(i))
+    np.savetxt(filters[i], np.column_stack((wl,
+               np.exp(-0.5*((wl-centers[i])/(0.5*width))**2))))
+
+  return {"tconfig":tconfig, "atmfile":atmfile, "kurucz":kurucz,
+          "filters":filters, "molfit":metals[:nspecies-2]}
+
+
+def bench(nlayers, nspecies, nfilters, niter=50, nwave=None, cost=0.0):
+  """
+  Time the forward-model stages for one configuration.
+
+  Parameters:
+  -----------
+  nlayers: Integer
+     Number of atmospheric layers.
+  nspecies: Integer
+     Number of species.
+  nfilters: Integer
+     Number of filters.
+  niter: Integer
+     Number of forward-model evaluations.
+  nwave: Integer
+     Number of wavenumber samples (None for the tconfig sampling).
+  cost: Float
+     Minimum time of the mock transit call (s).
+
+  Returns:
+  --------
+  timing: Dictionary
+     Mean time per call (s) of each stage, and the throughput of the
+     full model (evaluations per second).
+  """
+  tmpdir = tempfile.mkdtemp(prefix="BARTbench") + "/"
+  try:
+    files = makeinputs(tmpdir, nlayers, nspecies, nfilters)
+    mt.configure(nwave=nwave, cost=cost)
+    tepfile = scriptsdir + "/../inputs/tep/HD209458b.tep"
+    state = pp.setup(files["tconfig"], files["atmfile"], tepfile, "line",
+                     files["molfit"], files["filters"], files["kurucz"],
+                     "eclipse")
+    PTparams = np.array([-2.0, 0.0, 1.0, 0.0, 0.98])
+    molpars  = np.zeros(len(files["molfit"]))
+    params   = np.concatenate((PTparams, molpars))
+    specfile = tmpdir + "bench_spectrum.dat"
+
+    timing = dict([(stage, 0.0) for stage in stages])
+    random = np.random.RandomState(0)
+    for i in np.arange(niter):
+      # Perturb the parameters, as the MCMC would:
+      molpars = random.uniform(-1, 1, len(molpars))
+      t0 = time.time()
+      state["profiles"][0] = pt.PT_generator(state["pressure"], PTparams,
+                                             state["PTargs"])[::-1]
+      t1 = time.time()
+      pp.scale(state, molpars)
+      t2 = time.time()
+      spectrum = mt.run_transit(state["profiles"].flatten(), state["nwave"])
+      t3 = time.time()
+      pp.integrate(state, spectrum)
+      t4 = time.time()
+      rt.writespectrum(specfile, state["specwn"], spectrum)
+      rt.readspectrum(specfile)
+      t5 = time.time()
+      params[len(PTparams):] = molpars
+      pp.model(state, params)
+      t6 = time.time()
+      for stage, dt in zip(stages, np.ediff1d([t0, t1, t2, t3, t4, t5, t6])):
+        timing[stage] += dt / niter
+    pp.close()
+  finally:
+    shutil.rmtree(tmpdir)
+
+  timing["throughput"] = 1.0 / timing["model"]
+  timing["nwave"] = state["nwave"]
+  return timing
+
+
+def binscaling(nbins, nwave=100000, niter=20, wllow=1.0, wlhigh=5.0):
+  """
+  Time the band integration of top-hat bins (wine.Bins) against the
+  same bins given as filters (wine.resample and wine.bandintegrate per
+  bin), for several numbers of bins.
+
+  Parameters:
+  -----------
+  nbins: List of integers
+     Numbers of bins, evenly spread in wavelength over the spectrum.
+  nwave: Integer
+     Number of wavenumber samples of the spectrum.
+  niter: Integer
+     Number of spectra integrated per configuration.
+  wllow: Float
+     Spectrum lower wavelength boundary (microns).
+  wlhigh: Float
+     Spectrum higher wavelength boundary (microns).
+
+  Returns:
+  --------
+  timing: List of dictionaries
+     For each number of bins: the setup and per-spectrum times (s) of
+     both methods.
+  """
+  specwn = np.linspace(1e4/wlhigh, 1e4/wllow, nwave)
+  random = np.random.RandomState(0)
+  spectra = 1.0 + 0.1*random.normal(0, 1, (niter, nwave))
+  # A flat stellar flux, to compare the band integrals only:
+  starwn, starfl = specwn, np.ones(nwave)
+
+  timing = []
+  for nb in nbins:
+    edges = np.linspace(1.01*wllow, 0.99*wlhigh, nb+1)
+    t0 = time.time()
+    bins = w.Bins(specwn, edges)
+    t1 = time.time()
+    # The same bins as top-hat filters:
+    filters = []
+    for i in np.arange(nb):
+      wn = np.array([1e4/edges[i+1], 1e4/edges[i]])
+      filters.append(w.resample(specwn, wn, np.ones(2), starwn, starfl))
+    t2 = time.time()
+    for spectrum in spectra:
+      bins.integrate(spectrum)
+    t3 = time.time()
+    for spectrum in spectra:
+      for nifilt, strfl, wnind in filters:
+        w.bandintegrate(spectrum[wnind], specwn, nifilt, wnind)
+    t4 = time.time()
+    timing.append({"nbins":nb, "bins_setup":t1-t0, "filters_setup":t2-t1,
+                   "bins":(t3-t2)/niter, "filters":(t4-t3)/niter})
+  return timing
+
+
+def writers(nlayers=1000, nspecies=50, niter=5):
+  """
+  Time the atmospheric-file writers (Atmosphere.write for the TEA and
+  transit layouts, and make_preatm).  See regression.py for the check of
+  their outputs against the reference files.
+
+  Returns:
+  --------
+  timing: Dictionary
+     Mean time (s) of each writer.
+  """
+  tmpdir = tempfile.mkdtemp(prefix="BARTbench") + "/"
+  inputs = scriptsdir + "/../inputs/"
+  abun_file = inputs + "abundances_Asplund2009.txt"
+  tepfile   = inputs + "tep/HD209458b.tep"
+  random = np.random.RandomState(0)
+  try:
+    species = ["H2", "He"] + ["X{:02d}_g".format(i)
+                              for i in np.arange(nspecies-2)]
+    abun = random.dirichlet(np.ones(nspecies), nlayers)
+    atm = mat.Atmosphere(species, np.logspace(2, -5, nlayers),
+                         random.uniform(800, 2000, nlayers), abun,
+                         random.uniform(9e4, 1e5, nlayers))
+    press_file = tmpdir + "bench.pres"
+    mp.makeP(nlayers, 1e-5, 100, press_file)
+
+    def tea():
+      atm.write(tmpdir + "bench.atm")
+    def transit():
+      new = mat.Atmosphere(atm.species, atm.pressure, atm.temp,
+                           atm.abundances, atm.radius)
+      new.reformat()
+      new.write(tmpdir + "bench.atm")
+    def preatm():
+      mat.make_preatm(tepfile, press_file, abun_file, "H He C N O",
+                      " ".join(species), tmpdir + "bench.atm", atm.temp)
+
+    timing = {}
+    for label, writer in [("tea", tea), ("transit", transit),
+                          ("preatm", preatm)]:
+      t0 = time.time()
+      for i in np.arange(niter):
+        writer()
+      timing[label] = (time.time() - t0) / niter
+  finally:
+    shutil.rmtree(tmpdir)
+  return timing
+
+
+def compare(results, baseline, tolerance):
+  """
+  Compare the stage timings against a baseline.
+
+  Returns:
+  --------
+  regressions: List of strings
+     Description of each stage slower than the baseline by more than
+     the tolerance fraction.
+  """
+  regressions = []
+  for key in sorted(results):
+    if key not in baseline:
+      continue
+    for stage in stages:
+      old, new = baseline[key][stage], results[key][stage]
+      if new > old * (1.0 + tolerance):
+        regressions.append("{:s} {:s}: {:.3e} s -> {:.3e} s (+{:.0f}%)".
+                           format(key, stage, old, new, 100*(new/old-1)))
+  return regressions
+
+
+def main():
+  """
+  Benchmark the BART forward-model glue (PT profile, abundance scaling,
+  band integration, and spectrum I/O) with a mock transit_module, over
+  a grid of layer, species, and filter counts.
+
+  Usage:
+  ------
+  python benchmark.py [--layers N ...] [--species N ...] [--filters N ...]
+                      [--niter N] [--nwave N] [--cost SECONDS]
+                      [--output FILE] [--baseline FILE] [--tolerance F]
+
+  With --bins, instead time the integration of top-hat bins against
+  the same bins given as filters, for each number of bins:
+
+  python benchmark.py --bins 10 100 1000 5000 [--niter N] [--nwave N]
+
+  With --writers, instead time the atmospheric-file writers (see
+  regression.py for the check of their outputs):
+
+  python benchmark.py --writers [--layers N] [--species N] [--niter N]
+  """
+  parser = argparse.ArgumentParser(description=main.__doc__,
+                         formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--layers", dest="layers", type=int, nargs="+",
+                      default=[50, 100, 200],
+                      help="Numbers of layers [default: %(default)s]")
+  parser.add_argument("--species", dest="species", type=int, nargs="+",
+                      default=[4, 8, 16],
+                      help="Numbers of species [default: %(default)s]")
+  parser.add_argument("--filters", dest="filters", type=int, nargs="+",
+                      default=[2, 8, 32],
+                      help="Numbers of filters [default: %(default)s]")
+  parser.add_argument("--niter", dest="niter", type=int, default=50,
+                      help="Evaluations per configuration "
+                           "[default: %(default)s]")
+  parser.add_argument("--nwave", dest="nwave", type=int, default=None,
+                      help="Number of wavenumber samples "
+                           "[default: from the 2.8-11 um range, wndelt=1]")
+  parser.add_argument("--cost", dest="cost", type=float, default=0.0,
+                      help="Minimum time of the mock transit call in seconds "
+                           "[default: %(default)s]")
+  parser.add_argument("--output", dest="output", default=None,
+                      help="Write the results into this JSON file")
+  parser.add_argument("--baseline", dest="baseline", default=None,
+                      help="Compare against the results in this JSON file")
+  parser.add_argument("--tolerance", dest="tolerance", type=float,
+                      default=0.2,
+                      help="Slowdown fraction reported as a regression "
+                           "[default: %(default)s]")
+  parser.add_argument("--bins", dest="bins", type=int, nargs="+",
+                      default=None,
+                      help="Run the top-hat bin scaling benchmark for these "
+                           "numbers of bins (e.g., 10 100 1000 5000)")
+  parser.add_argument("--writers", dest="writers", action="store_true",
+                      default=False,
+                      help="Run the atmospheric-file writers benchmark "
+                           "(for the first --layers and --species values)")
+  args = parser.parse_args()
+
+  if args.writers:
+    nlayers  = args.layers[0]  if "--layers"  in sys.argv else 1000
+    nspecies = args.species[0] if "--species" in sys.argv else 50
+    timing = writers(nlayers, nspecies, args.niter)
+    print("{:d} layers, {:d} species:".format(nlayers, nspecies))
+    print("{:>8s} {:>12s}".format("Writer", "Time (s)"))
+    for label in ["tea", "transit", "preatm"]:
+      print("{:>8s} {:12.3e}".format(label, timing[label]))
+    return
+
+  if args.bins is not None:
+    nwave = args.nwave if args.nwave is not None else 100000
+    print("{:>6s} {:>12s} {:>12s} {:>12s} {:>12s} {:>9s}".format("Bins",
+          "Bins setup", "Filt. setup", "Bins/spec", "Filt./spec", "Speedup"))
+    for timing in binscaling(args.bins, nwave, args.niter):
+      print("{:6d} {:12.3e} {:12.3e} {:12.3e} {:12.3e} {:9.1f}".format(
+            timing["nbins"], timing["bins_setup"], timing["filters_setup"],
+            timing["bins"], timing["filters"],
+            timing["filters"]/timing["bins"]))
+    return
+
+  results = {}
+  print("{:>6s} {:>7s} {:>7s} ".format("Layers", "Species", "Filters") +
+        " ".join(["{:>10s}".format(stage) for stage in stages]) +
+        " {:>10s}".format("Evals/s"))
+  for nlayers in args.layers:
+    for nspecies in args.species:
+      for nfilters in args.filters:
+        timing = bench(nlayers, nspecies, nfilters, args.niter, args.nwave,
+                       args.cost)
+        key = "{:d}-{:d}-{:d}".format(nlayers, nspecies, nfilters)
+        results[key] = timing
+        print("{:6d} {:7d} {:7d} ".format(nlayers, nspecies, nfilters) +
+              " ".join(["{:10.3e}".format(timing[stage])
+                        for stage in stages]) +
+              " {:10.1f}".format(timing["throughput"]))
+
+  if args.output is not None:
+    f = open(args.output, "w")
+    json.dump(results, f, indent=2, sort_keys=True)
+    f.close()
+
+  if args.baseline is not None:
+    f = open(args.baseline, "r")
+    baseline = json.load(f)
+    f.close()
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+      print("REGRESSION " + regression)
+    sys.exit(int(len(regressions) > 0))
+
+
+if __name__ == "__main__":
+  main()
@@ -1,23 +1,31 @@
-import sys, os
+import sys, os, re
+import argparse, ConfigParser
 import numpy as np
 import scipy.constants as sc
-import ConfigParser
+import scipy.special   as ss
 
 scriptsdir = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(scriptsdir + "/../code")
 import makeatm as ma
 
-def get_widths(cfile):
+def readconfig(cfile):
   """
-  Calculate the max and min Lorentz and Doppler broadening HWHM for
-  the given configuration file.
+  Read the spectral, atmospheric, and species information needed to
+  compute the line-broadening widths from a BART configuration file.
 
   Parameters:
   -----------
   cfile: String
      A BART configuration file.
-  """
 
+  Returns:
+  --------
+  info: Dictionary
+     Config values (defaults), wavenumber (wnmin, wnmax) and temperature
+     (tmin, tmax) boundaries, the atmospheric pressure (barye),
+     temperature, and abundances, and the species names, masses (g),
+     and diameters (cm), sorted as in the atmospheric file.
+  """
   # Read config:
   config = ConfigParser.SafeConfigParser()
   config.optionxform = str  # This one enable Uppercase in arguments
@@ -47,12 +55,9 @@ def get_widths(cfile):
   except:
     tmax = np.amax(temps)
 
-  # Get min-max pressures: 
-  pmin = np.amin(pressure) * 1e6
-  pmax = np.amax(pressure) * 1e6
-
   # Get masses:
-  molfile = scriptsdir + "/../modules/transit/inputs/molecules.dat"
+  molfile = defaults.get("molfile",
+                         scriptsdir + "/../modules/transit/inputs/molecules.dat")
   ID, mol, mass, diam = readmol(molfile)
 
   # Keep only molecules from the atmospheric file:
@@ -68,24 +73,300 @@ def get_widths(cfile):
   isort = np.zeros(len(mol), int)
   for i in np.arange(len(mol)):
     isort[i] = np.where(np.asarray(mol) == molecs[i])[0][0]
-  mol  = mol [isort]
-  mass = mass[isort]
-  diam = diam[isort]
 
-  # Calculate minimum and maximum Doppler widths:
-  dmin = Doppler(wnmin, tmin, np.amin(mass))
-  dmax = Doppler(wnmax, tmax, np.amax(mass))
+  return {"defaults":defaults, "wnmin":wnmin, "wnmax":wnmax,
+          "tmin":tmin, "tmax":tmax, "pressure":pressure*1e6,
+          "temperature":temps, "abundances":abun, "mol":mol[isort],
+          "mass":mass[isort], "diam":diam[isort]}
+
+
+def get_widths(cfile):
+  """
+  Calculate the max and min Lorentz and Doppler broadening HWHM for
+  the given configuration file (see boundmap for the widths over all
+  layers, species, and wavenumbers).
+
+  Parameters:
+  -----------
+  cfile: String
+     A BART configuration file.
+
+  Returns:
+  --------
+  dmin, dmax: Float
+     Doppler minimum and maximum HWHM (cm-1).
+  lmin, lmax: Float
+     Lorentz minimum and maximum HWHM (cm-1).
+  """
+  info = readconfig(cfile)
+  mol, mass, diam, abun = (info["mol"], info["mass"], info["diam"],
+                           info["abundances"])
+
+  # Get min-max pressures:
+  pmin = np.amin(info["pressure"])
+  pmax = np.amax(info["pressure"])
+
+  # Calculate minimum and maximum Doppler widths (the width decreases
+  # with the mass):
+  dmin = Doppler(info["wnmin"], info["tmin"], np.amax(mass))
+  dmax = Doppler(info["wnmax"], info["tmax"], np.amin(mass))
 
   iH2 = np.where(mol == 'H2')[0]
   iHe = np.where(mol == 'He')[0]
 
   # Calculate minimum and maximum Lorentz widths:
-  lmin = Lorentz(pmin, tmax, mass, iH2, iHe, abun[-1], diam, True)
-  lmax = Lorentz(pmax, tmin, mass, iH2, iHe, abun[ 0], diam, False)
+  lmin = Lorentz(pmin, info["tmax"], mass, iH2, iHe, abun[-1], diam, True)
+  lmax = Lorentz(pmax, info["tmin"], mass, iH2, iHe, abun[ 0], diam, False)
 
   print("Doppler minimum and maximum HWHM (cm-1): {:.3e}, {:.3e}\n"
         "Lorentz minimum and maximum HWHM (cm-1): {:.3e}, {:.3e}".
         format(dmin, dmax, lmin, lmax))
+  return dmin, dmax, lmin, lmax
+
+
+def widthmap(wavenumber, pressure, temperature, abundances, mass, diam,
+             iH2, iHe):
+  """
+  Calculate the Doppler and Lorentz HWHM (in cm-1) for every layer,
+  species, and wavenumber.
+
+  Parameters:
+  -----------
+  wavenumber: 1D float ndarray
+     Wavenumber array in cm-1.
+  pressure: 1D float ndarray
+     Layers pressure in Barye.
+  temperature: 1D float ndarray
+     Layers temperature in K.
+  abundances: 2D float ndarray
+     Mole mixing ratios of shape [nlayers, nspecies].
+  mass: 1D float ndarray
+     Species masses in grams.
+  diam: 1D float ndarray
+     Species collisional diameters in cm.
+  iH2: Integer
+     Index of H2 in the species arrays.
+  iHe: Integer
+     Index of helium in the species arrays.
+
+  Returns:
+  --------
+  doppler: 3D float ndarray
+     Doppler HWHM of shape [nlayers, nspecies, nwave].
+  lorentz: 2D float ndarray
+     Lorentz HWHM of shape [nlayers, nspecies].
+  """
+  temp = np.asarray(temperature)[:,None,None]
+  doppler = Doppler(np.asarray(wavenumber)[None,None,:], temp,
+                    np.asarray(mass)[None,:,None])
+
+  # Collision factor of each species with H2 and He (as in Lorentz):
+  fH2 = ((diam+diam[iH2])*0.5)**2.0 * np.sqrt(1/mass + 1/mass[iH2])
+  fHe = ((diam+diam[iHe])*0.5)**2.0 * np.sqrt(1/mass + 1/mass[iHe])
+  flim = (np.outer(abundances[:,iH2], fH2) +
+          np.outer(abundances[:,iHe], fHe))
+  lorentz = (np.sqrt(2)/(sc.c*100) /
+             np.sqrt(temp[:,:,0]*np.pi*(sc.k*1e7)) * pressure[:,None] * flim)
+  return doppler, lorentz
+
+
+def boundmap(info, nwave=100):
+  """
+  Width map (see widthmap) over the layers of the atmospheric file,
+  taking at each point the narrowest width among the layer temperature
+  and the tmin-tmax boundaries (the temperatures the MCMC can explore).
+
+  Parameters:
+  -----------
+  info: Dictionary
+     Output from readconfig().
+  nwave: Integer
+     Number of wavenumber samples between wnmin and wnmax.
+
+  Returns:
+  --------
+  doppler: 3D float ndarray
+     Doppler HWHM (cm-1) of shape [nlayers, nspecies, nwave].
+  lorentz: 2D float ndarray
+     Lorentz HWHM (cm-1) of shape [nlayers, nspecies].
+  """
+  wn = np.linspace(info["wnmin"], info["wnmax"], nwave)
+  iH2 = np.where(info["mol"] == 'H2')[0][0]
+  iHe = np.where(info["mol"] == 'He')[0][0]
+  nlayers = len(info["pressure"])
+
+  doppler, lorentz = None, None
+  for temp in [info["temperature"], np.tile(info["tmin"], nlayers),
+                                    np.tile(info["tmax"], nlayers)]:
+    d, l = widthmap(wn, info["pressure"], temp, info["abundances"],
+                    info["mass"], info["diam"], iH2, iHe)
+    if doppler is None:
+      doppler, lorentz = d, l
+    doppler = np.minimum(doppler, d)
+    lorentz = np.minimum(lorentz, l)
+  return doppler, lorentz
+
+
+def voigt(doppler, lorentz):
+  """
+  Voigt HWHM from the Doppler and Lorentz HWHM (Olivero & Longbothum
+  1977, accurate to 0.02%).
+  """
+  return 0.5346*lorentz + np.sqrt(0.2166*lorentz**2.0 + doppler**2.0)
+
+
+def tune(cfile, tol=0.01, wndelt=None, nwave=100):
+  """
+  Recommend the spectral sampling (wndelt, wnosamp) and the profile
+  extent (nwidth) for a BART configuration file, such that the sampled
+  line profiles stay within a relative tolerance.
+
+  Notes:
+  ------
+  - The fine (oversampled) grid spacing, wndelt/wnosamp, is the coarsest
+    that samples the narrowest Voigt profile (over all layers, species,
+    and wavenumbers) with a peak interpolation error below tol:
+    spacing <= 2 HWHM sqrt(tol) (the Lorentz, stricter, case).
+  - wndelt sets the output spectral resolution, so it is kept as given
+    (or as in the config file), unless it is finer than needed to reach
+    the fine spacing with wnosamp=1, in which case that coarser spacing
+    is recommended.
+  - nwidth is the number of widths where the profile wings hold less than
+    tol of the line area:  erfc(nwidth sqrt(ln2)) for the Doppler core,
+    and 2/(pi nwidth) for the Lorentz wings, weighted by the Lorentz
+    fraction of each Voigt width.
+
+  Parameters:
+  -----------
+  cfile: String
+     A BART configuration file.
+  tol: Float
+     Relative tolerance of the line profiles.
+  wndelt: Float
+     Output wavenumber sampling interval (cm-1).  If None, take it from
+     the config file.
+  nwave: Integer
+     Number of wavenumber samples of the width map.
+
+  Returns:
+  --------
+  tuned: Dictionary
+     Recommended wndelt, wnosamp, and nwidth, the fine-grid spacing, and
+     the narrowest Voigt HWHM (all in cm-1), the config wnfct, and the
+     Doppler and Lorentz width maps (see boundmap).
+  """
+  info = readconfig(cfile)
+  doppler, lorentz = boundmap(info, nwave)
+  vwidth = voigt(doppler, lorentz[:,:,None])
+
+  # Fine-grid spacing:
+  vmin    = np.amin(vwidth)
+  spacing = 2.0 * vmin * np.sqrt(tol)
+
+  # Output sampling and oversampling factor:
+  wnfct = float(info["defaults"].get("wnfct", 1.0))
+  if wndelt is None:
+    # The config wndelt is in wnfct units:
+    if "wndelt" in info["defaults"]:
+      wndelt = float(info["defaults"]["wndelt"]) * wnfct
+    else:
+      wndelt = spacing
+  wndelt  = np.amax([wndelt, spacing])
+  wnosamp = int(np.ceil(wndelt/spacing))
+
+  # Profile extent (transit cuts the profiles at nwidth times the larger
+  # of the Doppler and Lorentz widths):
+  lfrac  = lorentz[:,:,None] / vwidth
+  ndop   = ss.erfcinv(tol) / np.sqrt(np.log(2))
+  nlor   = np.amax(2.0/np.pi * lfrac / tol)
+  nwidth = int(np.ceil(np.amax([ndop, nlor])))
+
+  return {"wndelt":wndelt, "wnosamp":wnosamp, "nwidth":nwidth,
+          "spacing":spacing, "vmin":vmin, "wnfct":wnfct,
+          "doppler":doppler, "lorentz":lorentz}
+
+
+def setkeys(filename, values):
+  """
+  Set the values of keys in a BART ('key = value') or transit
+  ('key value') configuration file, keeping the rest of the file.
+  Keys not found are added after the [MCMC] section header (or at the
+  end of the file).
+
+  Parameters:
+  -----------
+  filename: String
+     Configuration file to update.
+  values: Dictionary
+     Values to set, indexed by key.
+  """
+  f = open(filename, "r")
+  lines = f.readlines()
+  f.close()
+
+  missing = dict(values)
+  for i in np.arange(len(lines)):
+    match = re.match(r"^(\w+)(\s*=\s*|\s+)", lines[i])
+    if match is not None and match.group(1) in missing:
+      lines[i] = "{:s}{:s}{}\n".format(match.group(1), match.group(2),
+                                      missing.pop(match.group(1)))
+
+  if len(missing) > 0:
+    if "[MCMC]\n" in lines:
+      index = lines.index("[MCMC]\n") + 1
+      sep = " = "
+    else:
+      index = len(lines)
+      sep = " "
+    lines[index:index] = ["{:s}{:s}{}\n".format(key, sep, missing[key])
+                          for key in sorted(missing)]
+
+  f = open(filename, "w")
+  f.writelines(lines)
+  f.close()
+
+
+def main():
+  """
+  Compute the line-broadening width map of a BART configuration and
+  recommend the wndelt, wnosamp, and nwidth sampling parameters.
+
+  Usage:
+  ------
+  python broadening.py -c BART.cfg [--tol TOL] [--wndelt WNDELT]
+                       [--write CONFIG]
+  """
+  parser = argparse.ArgumentParser(description=main.__doc__,
+                         formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("-c", "--config_file", dest="cfile", required=True,
+                      help="BART configuration file")
+  parser.add_argument("--tol", dest="tol", type=float, default=0.01,
+                      help="Line-profile relative tolerance "
+                           "[default: %(default)s]")
+  parser.add_argument("--wndelt", dest="wndelt", type=float, default=None,
+                      help="Output wavenumber sampling (cm-1) "
+                           "[default: from the config file]")
+  parser.add_argument("--write", dest="write", default=None,
+                      help="Write the recommended values into this BART "
+                           "or transit configuration file")
+  args = parser.parse_args()
+
+  get_widths(args.cfile)
+  tuned = tune(args.cfile, args.tol, args.wndelt)
+  print("Narrowest Voigt HWHM (cm-1):   {:.3e}\n"
+        "Fine-grid spacing (cm-1):      {:.3e}\n"
+        "Recommended wndelt  = {:.6g}\n"
+        "Recommended wnosamp = {:d}\n"
+        "Recommended nwidth  = {:d}".format(tuned["vmin"], tuned["spacing"],
+                     tuned["wndelt"], tuned["wnosamp"], tuned["nwidth"]))
+
+  if args.write is not None:
+    # wndelt in the config units:
+    wndelt = tuned["wndelt"] / tuned["wnfct"]
+    setkeys(args.write, {"wndelt":"{:.6g}".format(wndelt),
+                         "wnosamp":tuned["wnosamp"],
+                         "nwidth":tuned["nwidth"]})
+    print("Updated '{:s}'.".format(args.write))
 
 
 def Lorentz(pressure, temperature, mass, iH2, iHe, abundance,
@@ -188,3 +469,5 @@ def readmol(molfile):
           np.asarray(mass, np.double), np.asarray(diam, np.double))
 
 
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,106 @@
+import sys, os, glob, subprocess
+import argparse
+import numpy as np
+
+scriptsdir = os.path.dirname(os.path.realpath(__file__))
+codedir = os.path.realpath(scriptsdir + "/../code")
+
+# Statement executed in a fresh interpreter to time an import:
+timer = ("import sys, time\n"
+         "sys.path.append('{:s}')\n"
+         "t0 = time.time()\n"
+         "import {:s}\n"
+         "t1 = time.time()\n"
+         "print('{{:.6f}} {{:d}}'.format(t1-t0, "
+         "'matplotlib.pyplot' in sys.modules))\n")
+
+
+def importtime(module, nrep=3):
+  """
+  Measure the time to import a BART module in a fresh interpreter.
+
+  Parameters:
+  -----------
+  module: String
+     Name of the module (in the BART code directory).
+  nrep: Integer
+     Number of repetitions, the minimum time is reported.
+
+  Returns:
+  --------
+  itime: Float
+     Import time in seconds (NaN if the import failed).
+  pyplot: Boolean
+     Whether importing the module loaded matplotlib.pyplot.
+  error: String
+     Last line of the error output if the import failed, else None.
+  """
+  itime, pyplot = np.inf, False
+  for i in np.arange(nrep):
+    proc = subprocess.Popen([sys.executable, "-c",
+                            timer.format(codedir, module)],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = proc.communicate()
+    if proc.returncode != 0:
+      lines = err.strip().splitlines()
+      return np.nan, False, lines[-1] if len(lines) > 0 else ""
+    t, plot = out.split()
+    itime  = np.amin([itime, float(t)])
+    pyplot = pyplot or plot == "1"
+  return itime, pyplot, None
+
+
+def main():
+  """
+  Benchmark the import time of each BART code/ module, and check them
+  against a time budget.  Modules imported by the MCMC workers must
+  not import matplotlib.pyplot.  A module that fails to import fails
+  the check.
+
+  Usage:
+  ------
+  python importtime.py [--budget SECONDS] [--nrep N] [modules ...]
+  """
+  parser = argparse.ArgumentParser(description=main.__doc__,
+                         formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("modules", nargs="*",
+                      help="Modules to time [default: all in code/]")
+  parser.add_argument("--budget", dest="budget", type=float, default=1.0,
+                      help="Import-time budget in seconds per module "
+                           "[default: %(default)s]")
+  parser.add_argument("--nrep", dest="nrep", type=int, default=3,
+                      help="Number of repetitions [default: %(default)s]")
+  parser.add_argument("--workers", dest="workers",
+                      default="BARTfunc,posterior",
+                      help="Worker modules that must not load pyplot "
+                           "[default: %(default)s]")
+  args = parser.parse_args()
+
+  modules = args.modules
+  if len(modules) == 0:
+    modules = sorted([os.path.splitext(os.path.basename(f))[0]
+                      for f in glob.glob(codedir + "/*.py")])
+
+  fail = False
+  print("{:<14s} {:>10s}  {:s}".format("Module", "Time (s)", "Status"))
+  for module in modules:
+    itime, pyplot, error = importtime(module, args.nrep)
+    if error is not None:
+      status = "IMPORT FAILED ({:s})".format(error)
+      fail = True
+    elif itime > args.budget:
+      status = "OVER BUDGET"
+      fail = True
+    else:
+      status = "ok"
+    if pyplot:
+      status += ", imports pyplot"
+      if module in args.workers.split(","):
+        fail = True
+    print("{:<14s} {:10.4f}  {:s}".format(module, itime, status))
+
+  sys.exit(int(fail))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,113 @@
+import sys, os, shutil, tempfile
+import argparse
+import numpy as np
+
+scriptsdir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(scriptsdir + "/../code")
+import makeatm as mat
+import bestFit as bf
+
+# Reference inputs and outputs.  The outputs (preatm.atm, transit.atm,
+# and bestFit.atm) were written by the original per-value writers of
+# make_preatm(), makeRadius() + reformat(), and write_atmfile():
+refdir    = scriptsdir + "/reference/"
+inputs    = scriptsdir + "/../inputs/"
+tepfile   = inputs + "tep/HD209458b.tep"
+abun_file = inputs + "abundances_Asplund2009.txt"
+in_elem   = "H He C N O"
+refpress  = 0.1
+
+
+def regression(outdir):
+  """
+  Write the TEA pre-atmospheric file, the transit atmospheric file (with
+  the file-based and the in-memory writers), and the best-fit
+  atmospheric file from the reference inputs, and compare them to the
+  reference outputs.
+
+  Parameters:
+  -----------
+  outdir: String
+     Directory where to write the files.
+
+  Returns:
+  --------
+  results: List of tuples
+     Name of each check, and whether its output is byte-identical to
+     the reference.
+  """
+  teafile = refdir + "tea.tea"
+  species, pressure, temp, abundances = mat.readatm(teafile)
+  out_spec = " ".join(species)
+
+  # TEA pre-atmospheric file:
+  mat.make_preatm(tepfile, refdir + "layers.pres", abun_file, in_elem,
+                  out_spec, outdir + "preatm.atm", temp)
+  files = [("preatm", "preatm.atm", "preatm.atm")]
+
+  # Transit atmospheric file, from the TEA file:
+  shutil.copy(teafile, outdir + "transit.atm")
+  mat.makeRadius(out_spec, outdir + "transit.atm", abun_file, tepfile,
+                 refpress)
+  mat.reformat(outdir + "transit.atm")
+  files.append(("transit", "transit.atm", "transit.atm"))
+
+  atm = mat.Atmosphere.read(teafile)
+  mat.finalize(atm, abun_file, tepfile, refpress)
+  atm.write(outdir + "atmosphere.atm")
+  files.append(("transit (in memory)", "atmosphere.atm", "transit.atm"))
+
+  # Best-fit atmospheric file, from the profiles of the reference:
+  species, pressure, temp, abundances = mat.readatm(refdir + "bestFit.atm")
+  profiles = np.vstack((temp, abundances.T))
+  bf.write_atmfile(refdir + "transit.atm", profiles, outdir)
+  files.append(("bestFit", "bestFit.atm", "bestFit.atm"))
+
+  results = []
+  for name, output, reference in files:
+    f = open(outdir + output, "r")
+    new = f.read()
+    f.close()
+    f = open(refdir + reference, "r")
+    old = f.read()
+    f.close()
+    results.append((name, new == old))
+  return results
+
+
+def main():
+  """
+  Check the atmospheric-file writers (TEA pre-atmospheric, transit, and
+  best-fit files) against the reference outputs in scripts/reference/
+  (exit status 1 if any differs).
+
+  Usage:
+  ------
+  python regression.py [--keep DIR]
+  """
+  parser = argparse.ArgumentParser(description=main.__doc__,
+                         formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--keep", dest="keep", default=None,
+                      help="Write the outputs into this directory (and keep "
+                           "them) [default: a temporary directory]")
+  args = parser.parse_args()
+
+  if args.keep is not None:
+    outdir = os.path.realpath(args.keep) + "/"
+    if not os.path.isdir(outdir):
+      os.makedirs(outdir)
+  else:
+    outdir = tempfile.mkdtemp(prefix="BARTregression") + "/"
+  try:
+    results = regression(outdir)
+  finally:
+    if args.keep is None:
+      shutil.rmtree(outdir)
+
+  for name, identical in results:
+    print("{:<20s} {:s}".format(name, "OK" if identical else "DIFFERS"))
+  sys.exit(int(not all([identical for name, identical in results])))
+
+
+if __name__ == "__main__":
+  main()